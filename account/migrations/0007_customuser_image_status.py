@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_alter_customuser_email_alter_customuser_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='image_status',
+            field=models.CharField(choices=[('ready', '処理済み'), ('pending', '処理待ち'), ('failed', '処理失敗')], default='ready', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='image',
+            field=models.ImageField(blank=True, default='default/default.png', null=True, upload_to='profiles/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0007_customuser_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from review.models import Review
+from images.models import ImageStatus
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 import uuid
 
@@ -25,6 +26,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(max_length=50,unique=True,db_index=True)
     name = models.CharField(max_length=255,default='未設定',db_index=True)
     image = models.ImageField(upload_to='profiles/',default='default/default.png',blank=True,null=True,)
+    image_status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.READY)
+    # 画像のレンディション {形式: {サイズ: ファイル名}}
+    image_renditions = models.JSONField(default=dict, blank=True)
     updated_at = models.DateTimeField("更新日", auto_now=True) 
     created_at = models.DateTimeField("作成日", auto_now_add=True)
     is_active = models.BooleanField(default=True)
@@ -6,6 +6,8 @@ from rest_framework.exceptions import AuthenticationFailed
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
+from images.renditions import image_srcset
+from images.serializers import UploadImageField, UploadKeyField
 
 User = get_user_model()
 
@@ -37,9 +39,20 @@ class TokenRefreshSerializer(serializers.Serializer):
     return attrs
 
 class UserSerializer(serializers.ModelSerializer):
-  image = serializers.ImageField(default='default/default.png')
+  image = UploadImageField(default='default/default.png')
+  image_srcset = serializers.SerializerMethodField()
+  # 直接アップロードした元画像のキー（imageの代わりに送る）
+  image_key = UploadKeyField()
   
   class Meta:
     model = User
-    fields = ('id','name','email','image','favorite_reviews')
+    fields = ('id','name','email','image','image_status','image_srcset','image_key','favorite_reviews')
+    read_only_fields = ('image_status',)
+
+  @classmethod
+  def setup_eager_loading(cls, queryset, request=None):
+    return queryset.prefetch_related('favorite_reviews')
+
+  def get_image_srcset(self, obj):
+    return image_srcset(obj, 'image', self.context.get('request'))
 
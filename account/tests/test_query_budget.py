@@ -0,0 +1,71 @@
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import RefreshToken
+from account.urls import urlpatterns
+from reviewsite.utils import testing
+
+User = get_user_model()
+
+
+# アカウント関連エンドポイントのクエリ数がデータ件数に依存しないことを確認
+class AccountQueryBudgetTests(testing.QueryBudgetTestCase):
+  app_namespace = 'accounts'
+  urlpatterns = urlpatterns
+
+  def test_user_list(self):
+    url = reverse('accounts:customuser-list')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_user_detail(self):
+    url = reverse('accounts:customuser-detail', kwargs={'pk': self.user.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_user_detail_update(self):
+    url = reverse('accounts:customuser-detail', kwargs={'pk': self.user.id})
+    data = {'name': 'Updated'}
+    self.assertQueryCountConstant(lambda: self.client.patch(url, data, format='multipart'))
+
+  def test_login(self):
+    url = reverse('accounts:login')
+    data = {'email': 'budget@example.com', 'password': 'testpass'}
+    self.assertQueryCountConstant(lambda: self.client.post(url, data, format='json'))
+
+  def test_register(self):
+    url = reverse('accounts:register')
+    self.assertQueryCountConstant(
+      lambda email: self.client.post(url, {'email': email, 'password': 'testpass'}, format='json'),
+      lambda size: (f'register{size}@example.com',)
+    )
+
+  def test_check_auth(self):
+    url = reverse('accounts:check-auth')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_refresh_token(self):
+    url = reverse('accounts:refresh-token')
+    self.assertQueryCountConstant(
+      lambda refresh: self.client.post(url, {'refresh': refresh}, format='json'),
+      lambda size: (str(RefreshToken.for_user(self.user)),)
+    )
+
+  def test_logout(self):
+    url = reverse('accounts:logout')
+    self.assertQueryCountConstant(
+      lambda refresh: self.client.post(url, {'refresh_token': refresh}, format='json'),
+      lambda size: (str(RefreshToken.for_user(self.user)),)
+    )
+
+  def test_user_delete(self):
+    url = reverse('accounts:user-delete')
+
+    # 削除対象ユーザーにsize件分のレビュー・お気に入りを持たせる
+    def prepare(size):
+      user = User.objects.create_user(email=f'delete{size}@example.com')
+      self.seed(size, user=user)
+      return (user,)
+
+    def make_request(user):
+      self.client.force_authenticate(user=user)
+      return self.client.delete(url)
+
+    self.assertQueryCountConstant(make_request, prepare)
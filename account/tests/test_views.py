@@ -7,6 +7,11 @@ from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 import io
 from PIL import Image
 from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from unittest import mock
+import datetime
+from item.models import Item, Brand, Series, Position
+from review.models import Review, UserReview
+from images.models import StoredImage, PendingDeletion
 
 
 User = get_user_model()
@@ -167,3 +172,36 @@ class DeleteUserViewTest(APITestCase):
     response = self.client.delete(self.url)
     self.assertNotEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+  # レビューの件数によらず、画像の参照を1回で解放し、削除するファイルをまとめて削除待ちにする
+  def test_delete_user_releases_images_in_bulk(self):
+    brand = Brand.objects.create(name='Delete Brand')
+    item = Item.objects.create(
+      item_name='Delete Item', brand=brand, series=Series.objects.create(name='Delete Series', brand=brand),
+      position=Position.objects.create(name='Delete Position'), release_date=datetime.date(2023, 10, 1), display=True
+    )
+    # 2件のレビューが同じ画像を共有している
+    StoredImage.objects.create(name='images/aa/shared.webp', ref_count=2)
+    StoredImage.objects.create(name='images/bb/other.webp', ref_count=3)
+    renditions = {'webp': {'96': 'images/aa/shared.webp'}}
+    for i in range(2):
+      review = Review.objects.create(
+        user=self.user, item=item, title=f'Review {i}', content='Content',
+        image='images/aa/shared.webp', image_renditions=renditions
+      )
+      UserReview.objects.create(user=self.user, review=review)
+    other_user = User.objects.create_user(email='other@example.com')
+    Review.objects.create(user=other_user, item=item, title='Other', content='Content', image='images/bb/other.webp')
+    User.objects.filter(pk=self.user.pk).update(image='profiles/legacy.jpg')
+    self.user.refresh_from_db()
+
+    with mock.patch('images.deletions.delete_files') as delete_files:
+      response = self.client.delete(self.url)
+    self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+    # リクエスト中はストレージを呼び出さず、削除待ちに登録するだけ
+    delete_files.assert_not_called()
+    self.assertEqual(
+      set(PendingDeletion.objects.values_list('name', flat=True)),
+      {'images/aa/shared.webp', 'profiles/legacy.jpg'}
+    )
+    self.assertFalse(StoredImage.objects.filter(name='images/aa/shared.webp').exists())
+    self.assertEqual(StoredImage.objects.get(name='images/bb/other.webp').ref_count, 3)
@@ -5,6 +5,8 @@ from account import views
 
 app_name = 'accounts'
 router = DefaultRouter()
+# プレフィックスが空のためルートビューは一覧（customuser-list）と同じURLになり到達できない
+router.include_root_view = False
 router.register('', views.UserViewSet)
 
 urlpatterns = [
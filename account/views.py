@@ -14,16 +14,16 @@ from rest_framework_simplejwt.exceptions import TokenError,InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.exceptions import NotAuthenticated
 from rest_framework_simplejwt import views as jwt_views,exceptions as jwt_exp
-from PIL import Image
-import io
-from django.core.files.uploadedfile import InMemoryUploadedFile
 from rest_framework.parsers import MultiPartParser, FormParser
-from reviewsite.utils.image import resize_image,delete_image_from_s3
+from images.jobs import enqueue_image_job, enqueue_uploaded_image, cancel_image_jobs
+from images.blobs import release_image_files, release_images
+from images.renditions import image_file_names
 from django.db import transaction
 from review.models import UserReview
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.generics import RetrieveAPIView
 from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from reviewsite.utils.eager_loading import EagerLoadingMixin
 
 
 logger = logging.getLogger(__name__)
@@ -101,46 +101,36 @@ class RefreshTokenView(APIView):
       return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(EagerLoadingMixin, ModelViewSet):
   queryset = User.objects.all()
   serializer_class = serializers.UserSerializer
   authentication_classes = (JWTAuthentication,)
 
   def perform_update(self, serializer):
     login_user = serializer.instance
-    old_image = login_user.image
     default_image_path = 'default/default.png'
 
     new_image = self.request.FILES.get('image', None)
-
-    if new_image and new_image != '':
-      # 新しい画像が提供された場合
-      if old_image and old_image.name != default_image_path:
-        # 元々設定してある画像がデフォルト画像でない場合、S3から削除
-        image_path = 'static/' + old_image.name
-        delete_image_from_s3(image_path)
-
-      with Image.open(new_image) as img:
-        # resize_imageは適切なリサイズ処理を行う関数
-        resized_image = resize_image(img)
-      image_io = io.BytesIO()
-      resized_image.save(image_io, format='JPEG', quality=85)
-      image_io.seek(0)
-      image_file = InMemoryUploadedFile(
-        image_io, None, new_image.name,
-        'image/jpeg', image_io.getbuffer().nbytes, None
-      )
-      serializer.validated_data['image'] = image_file
-    else:
-      # 画像がリセットされた場合の処理
-      if old_image and old_image.name != default_image_path:
-        # 既存の画像がデフォルト画像でない場合、S3から削除
-        image_path = 'static/' + old_image.name
-        delete_image_from_s3(image_path)
-
-      serializer.validated_data['image'] = default_image_path
-
-    serializer.save()
+    image_key = serializer.validated_data.pop('image_key', None)
+
+    with transaction.atomic():
+      if (new_image and new_image != '') or image_key:
+        # 新しい画像が提供された場合、リサイズと古い画像の削除は画像処理ジョブで行う
+        serializer.validated_data.pop('image', None)
+      else:
+        # 画像がリセットされた場合の処理
+        cancel_image_jobs(login_user, 'image')
+        # 既存の画像（レンディションを含む）がデフォルト画像でない場合、S3から削除
+        release_image_files(login_user)
+
+        serializer.validated_data['image'] = default_image_path
+        serializer.validated_data['image_renditions'] = {}
+
+      serializer.save()
+      if new_image and new_image != '':
+        enqueue_image_job(login_user, 'image', new_image)
+      elif image_key:
+        enqueue_uploaded_image(login_user, 'image', image_key)
 
 class LogoutView(APIView):
   permission_classes = (AllowAny,)
@@ -168,16 +158,12 @@ class DeleteUserView(APIView):
 
     try:
       with transaction.atomic():
-        if user.image and not user.image.name.endswith('default/default.png'):
-          user_image_path = 'static/' + user.image.name
-          delete_image_from_s3(user_image_path)
-
-        user_reviews = UserReview.objects.filter(user=user)
+        # ユーザーと全レビューの画像の参照をまとめて解放する（ファイルはワーカーが1000件ずつ削除）
+        image_names = list(image_file_names(user))
+        user_reviews = UserReview.objects.filter(user=user).select_related('review')
         for user_review in user_reviews:
-          if user_review.review.image:
-            if user_review.review.image and not user_review.review.image.name.endswith('default/default.png'):
-              review_image_path = 'static/' + user_review.review.image.name
-              delete_image_from_s3(review_image_path)
+          image_names.extend(image_file_names(user_review.review))
+        release_images(image_names)
         user.delete()
       return Response(status=status.HTTP_204_NO_CONTENT)
     except Exception as e:
@@ -0,0 +1,15 @@
+from django.contrib import admin
+from images import models
+
+
+@admin.register(models.ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+  list_display = ('id', 'content_type', 'object_id', 'field_name', 'status', 'attempts', 'created_at')
+  list_filter = ('status', 'content_type')
+
+
+@admin.register(models.PendingDeletion)
+class PendingDeletionAdmin(admin.ModelAdmin):
+  list_display = ('id', 'name', 'status', 'attempts', 'next_attempt_at', 'created_at')
+  list_filter = ('status',)
+  search_fields = ('name',)
@@ -0,0 +1,88 @@
+import hashlib
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from images.models import PendingDeletion, StoredImage
+from images.deletions import enqueue_deletions
+from images.renditions import image_file_names
+
+
+# 内容のハッシュから決まる保存先（例: images/3f/3fa9...c1.webp）
+def content_key(data, extension):
+  digest = hashlib.sha256(data).hexdigest()
+  return f'{settings.IMAGE_BLOB_PREFIX}{digest[:2]}/{digest}.{extension}'
+
+
+# 画像を内容のハッシュをキーにして保存し、参照数を1増やしてキーを返す
+# 同じ内容の画像が保存済みの場合はアップロードしない
+def store_image(storage, data, extension):
+  key = content_key(data, extension)
+  now = timezone.now()
+  with transaction.atomic(), connection.cursor() as cursor:
+    # 同時に同じキーを登録する場合、後のINSERTは先のトランザクションの完了（アップロード後）を待つ
+    cursor.execute(
+      f'INSERT INTO {StoredImage._meta.db_table} (name, ref_count, size, updated_at, created_at) '
+      'VALUES (%s, 1, %s, %s, %s) '
+      'ON CONFLICT (name) DO UPDATE SET ref_count = '
+      f'{StoredImage._meta.db_table}.ref_count + 1, updated_at = excluded.updated_at '
+      'RETURNING ref_count',
+      [key, len(data), now, now]
+    )
+    ref_count = cursor.fetchone()[0]
+    if ref_count == 1:
+      # 参照がなくなって削除待ちになっていた画像の場合は削除を取り消す
+      # 削除中のワーカーが行をロックしている間はここで待つため、この後のexists()は削除後の状態を返す
+      PendingDeletion.objects.filter(name=key).delete()
+      if not storage.exists(key):
+        storage.save(key, ContentFile(data))
+  return key
+
+
+# 画像の参照を解放し、参照がなくなったファイルを削除待ちにする
+# namesに同じ名前が複数回含まれる場合（同じ画像を共有する複数のレビューなど）は、その回数だけ参照数を減らす
+# 参照数の管理外のファイル（ハッシュのキーで保存する前の画像）はそのまま削除する
+def release_images(names, batch_size=500):
+  counts = Counter(names)
+  if not counts:
+    return
+  table = StoredImage._meta.db_table
+  managed, unreferenced = set(), set()
+  with transaction.atomic(), connection.cursor() as cursor:
+    # 減らす数ごとにまとめて更新する（ほとんどは1）
+    by_count = defaultdict(list)
+    for name, count in counts.items():
+      by_count[count].append(name)
+    for count, batch_names in by_count.items():
+      for batch in _batches(batch_names, batch_size):
+        placeholders = ', '.join(['%s'] * len(batch))
+        cursor.execute(
+          f'UPDATE {table} SET ref_count = CASE WHEN ref_count > %s THEN ref_count - %s ELSE 0 END, '
+          f'updated_at = %s WHERE name IN ({placeholders}) RETURNING name',
+          [count, count, timezone.now(), *batch]
+        )
+        managed.update(row[0] for row in cursor.fetchall())
+
+    for batch in _batches(sorted(managed), batch_size):
+      placeholders = ', '.join(['%s'] * len(batch))
+      cursor.execute(
+        f'DELETE FROM {table} WHERE name IN ({placeholders}) AND ref_count = 0 RETURNING name',
+        batch
+      )
+      unreferenced.update(row[0] for row in cursor.fetchall())
+
+  # 参照がなくなったファイルと管理外のファイルは、同じトランザクション内で削除待ちに登録する
+  legacy = {name for name in counts.keys() - managed if not name.startswith(settings.IMAGE_BLOB_PREFIX)}
+  enqueue_deletions(unreferenced | legacy)
+
+
+def _batches(items, size):
+  items = list(items)
+  for start in range(0, len(items), size):
+    yield items[start:start + size]
+
+
+# インスタンスの画像フィールドとレンディションの参照を解放する
+def release_image_files(instance, field_name='image'):
+  release_images(image_file_names(instance, field_name))
@@ -0,0 +1,98 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from images.models import PendingDeletion, StoredImage
+
+logger = logging.getLogger(__name__)
+
+
+# ファイルの削除をアウトボックスに登録する（呼び出し元のトランザクション内で実行する）
+# リクエスト中にはストレージを呼び出さず、コミットされた削除だけがワーカーで実行される
+def enqueue_deletions(names):
+  names = sorted({name for name in names if name})
+  PendingDeletion.objects.bulk_create([PendingDeletion(name=name) for name in names])
+
+
+# 再試行までの待ち時間（指数バックオフ、上限IMAGE_DELETION_MAX_DELAY秒）
+def retry_delay(attempts):
+  delay = settings.IMAGE_DELETION_RETRY_DELAY * 2 ** (attempts - 1)
+  return timedelta(seconds=min(delay, settings.IMAGE_DELETION_MAX_DELAY))
+
+
+# 削除待ちのファイルを最大batch_size件まとめて削除し、処理した件数を返す
+# 失敗したファイルはバックオフして再試行し、IMAGE_DELETION_MAX_ATTEMPTS回失敗したらdeadにする
+def drain_pending_deletions(batch_size=1000, storage=None, chunk_size=100):
+  # 画像はすべてデフォルトのストレージに保存している
+  storage = storage or default_storage
+  claimed = claim_pending_deletions(batch_size)
+  for start in range(0, len(claimed), chunk_size):
+    delete_claimed(storage, claimed[start:start + chunk_size])
+  return len(claimed)
+
+
+# 実行時刻を過ぎた削除待ちを最大batch_size件取得し、再試行時刻を先に延ばして他のワーカーが取得しないようにする
+# （ワーカーが途中で停止した場合は、その時刻を過ぎると再び取得される）
+# ロックはこの短いトランザクションの間だけ持ち、ストレージの呼び出し中には持たない
+def claim_pending_deletions(batch_size):
+  now = timezone.now()
+  with transaction.atomic():
+    deletions = list(
+      PendingDeletion.objects.select_for_update(skip_locked=True)
+        .filter(status=PendingDeletion.STATUS_PENDING, next_attempt_at__lte=now)
+        .order_by('next_attempt_at')[:batch_size]
+    )
+    PendingDeletion.objects.filter(pk__in=[d.pk for d in deletions]).update(
+      next_attempt_at=now + retry_delay(1)
+    )
+  return [deletion.pk for deletion in deletions]
+
+
+# 取得済みの削除待ち（最大chunk_size件）のファイルを削除し、結果を記録する
+# 行をロックしてから削除するため、同じ画像を再び保存するstore_image（削除待ちの行を消す）とは同時に進まない
+# ロックを持つのはストレージの呼び出し1回分（S3では1リクエスト）だけ
+def delete_claimed(storage, deletion_ids):
+  now = timezone.now()
+  with transaction.atomic():
+    # 取得後にstore_imageで取り消された（行が消された）ものは含まれない
+    deletions = list(PendingDeletion.objects.select_for_update().filter(pk__in=deletion_ids))
+    names = {deletion.name for deletion in deletions}
+    # 削除待ちの間に同じ内容の画像が再び保存された場合は削除しない
+    referenced = set(StoredImage.objects.filter(name__in=names).values_list('name', flat=True))
+    errors = delete_files(storage, names - referenced)
+
+    failed = [deletion for deletion in deletions if deletion.name in errors]
+    PendingDeletion.objects.filter(pk__in=[d.pk for d in deletions if d.name not in errors]).delete()
+    for deletion in failed:
+      deletion.attempts += 1
+      deletion.error = errors[deletion.name]
+      deletion.next_attempt_at = now + retry_delay(deletion.attempts)
+      if deletion.attempts >= settings.IMAGE_DELETION_MAX_ATTEMPTS:
+        deletion.status = PendingDeletion.STATUS_DEAD
+        logger.error('Giving up deleting %s: %s', deletion.name, deletion.error)
+    PendingDeletion.objects.bulk_update(failed, ['attempts', 'error', 'next_attempt_at', 'status'])
+
+
+# ストレージからファイルを削除し、削除できなかったファイルの {名前: エラー} を返す
+# S3のストレージ（delete_many）は1000件ずつまとめて削除する
+def delete_files(storage, names):
+  names = sorted(names)
+  if not names:
+    return {}
+  if hasattr(storage, 'delete_many'):
+    try:
+      return storage.delete_many(names)
+    except Exception as e:
+      logger.exception('Failed to delete %d files.', len(names))
+      return {name: str(e) for name in names}
+
+  errors = {}
+  for name in names:
+    try:
+      storage.delete(name)
+    except Exception as e:
+      logger.exception('Failed to delete %s.', name)
+      errors[name] = str(e)
+  return errors
@@ -0,0 +1,206 @@
+import logging
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from images.models import ImageJob, ImageStatus
+from images.blobs import store_image, release_images
+from images.deletions import enqueue_deletions
+from images.uploads import UPLOAD_USED_MESSAGE
+from images.renditions import rendition_extension, primary_rendition, image_file_names, get_rendition_settings
+from reviewsite.utils.image import ImageTooLarge, UnsupportedImageFormat, render_image_set
+from reviewsite.utils.image_service import get_image_service
+
+logger = logging.getLogger(__name__)
+
+
+def _target_jobs(instance, field_name):
+  return ImageJob.objects.filter(
+    content_type=ContentType.objects.get_for_model(instance),
+    object_id=str(instance.pk),
+    field_name=field_name,
+  )
+
+
+def _update_target(instance, **values):
+  # auto_nowのフィールド（updated_at）も合わせて更新する
+  for field in instance._meta.concrete_fields:
+    if getattr(field, 'auto_now', False):
+      values.setdefault(field.name, timezone.now())
+  type(instance).objects.filter(pk=instance.pk).update(**values)
+  for name, value in values.items():
+    setattr(instance, name, value)
+
+
+# 元画像を保存して画像処理ジョブを登録し、対象の画像をpendingにする
+# IMAGE_PROCESSING_MODEが'inline'の場合はリサイズを処理プールに投入し、コミット後に結果を保存する
+# （処理プールが埋まっている場合はImageServiceBusyでリクエストごと503にする）
+def enqueue_image_job(instance, field_name, upload):
+  rendered = None
+  if settings.IMAGE_PROCESSING_MODE == 'inline':
+    upload.seek(0)
+    rendered = get_image_service().submit(render_image_set, upload.read(), *get_rendition_settings())
+    upload.seek(0)
+
+  job = _new_job(instance, field_name)
+  job.source.save(os.path.basename(upload.name), upload, save=False)
+  job.save()
+  _update_target(instance, image_status=ImageStatus.PENDING)
+
+  if rendered is not None:
+    transaction.on_commit(lambda: process_image_job(job, rendered))
+  return job
+
+
+# ブラウザがストレージへ直接アップロードした元画像（images.uploadsで検証済みのキー）でジョブを登録する
+# 画像のデータはリクエストで扱わず、inlineモードでもコミット後にストレージから読み込んで処理する
+def enqueue_uploaded_image(instance, field_name, key):
+  job = _new_job(instance, field_name)
+  job.source.name = key
+  job.upload_key = key
+  try:
+    with transaction.atomic():
+      job.save()
+  except IntegrityError:
+    # 検証後に同じキーで別のジョブが登録された
+    raise ValidationError(UPLOAD_USED_MESSAGE)
+  _update_target(instance, image_status=ImageStatus.PENDING)
+
+  if settings.IMAGE_PROCESSING_MODE == 'inline':
+    transaction.on_commit(lambda: process_image_job(job))
+  return job
+
+
+def _new_job(instance, field_name):
+  return ImageJob(
+    content_type=ContentType.objects.get_for_model(instance),
+    object_id=str(instance.pk),
+    field_name=field_name,
+  )
+
+
+# 処理待ち・処理中のジョブを取り消す（画像が削除された場合など）
+# 処理中のジョブは、process_image_jobが対象に書き込む前に状態を確認して結果を捨てる
+def cancel_image_jobs(instance, field_name):
+  # 処理待ちのジョブがあるのはpendingの間だけ
+  if instance.image_status != ImageStatus.PENDING:
+    return
+  with transaction.atomic():
+    jobs = list(
+      _target_jobs(instance, field_name)
+        .select_for_update()
+        .filter(status__in=(ImageJob.STATUS_PENDING, ImageJob.STATUS_PROCESSING))
+    )
+    enqueue_deletions(job.source.name for job in jobs)
+    _target_jobs(instance, field_name).filter(pk__in=[job.pk for job in jobs]).update(
+      status=ImageJob.STATUS_CANCELLED, source='', updated_at=timezone.now()
+    )
+    _update_target(instance, image_status=ImageStatus.READY)
+
+
+# 処理待ちのジョブを最大batch_size件取得して処理中にする
+# 処理中のままIMAGE_JOB_TIMEOUT秒を超えたジョブ（ワーカーの異常終了など）も再取得する
+def claim_image_jobs(batch_size):
+  stale = timezone.now() - timedelta(seconds=settings.IMAGE_JOB_TIMEOUT)
+  with transaction.atomic():
+    jobs = list(
+      ImageJob.objects.select_for_update(skip_locked=True)
+        .filter(Q(status=ImageJob.STATUS_PENDING) | Q(status=ImageJob.STATUS_PROCESSING, updated_at__lt=stale))
+        .order_by('created_at')[:batch_size]
+    )
+    ImageJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+      status=ImageJob.STATUS_PROCESSING, updated_at=timezone.now()
+    )
+  return jobs
+
+
+def _finish(job, status, error=''):
+  if status != ImageJob.STATUS_PENDING and job.source:
+    enqueue_deletions([job.source.name])
+    job.source = ''
+  job.status = status
+  job.error = error
+  job.save(update_fields=['source', 'status', 'attempts', 'error', 'updated_at'])
+
+
+# 元画像のリサイズを処理プールに投入する（空きが出るまで待つ）
+def submit_image_job(job):
+  with job.source.open('rb') as source:
+    data = source.read()
+  return get_image_service().submit(render_image_set, data, *get_rendition_settings(), block=True)
+
+
+# レンディションを内容のハッシュをキーにして保存し、{形式: {サイズ: ファイル名}} を返す
+def save_renditions(storage, rendered):
+  renditions = {}
+  for (size, image_format), data in rendered.items():
+    name = store_image(storage, data, rendition_extension(image_format))
+    renditions.setdefault(image_format, {})[str(size)] = name
+  return renditions
+
+
+# 元画像からレンディションを作って保存し、代表の画像を画像フィールドに設定して古い画像を削除する
+# renderedは投入済みのリサイズ処理（Future）で、省略した場合はここで投入する
+def process_image_job(job, rendered=None):
+  job.attempts += 1
+  target = job.target
+  if target is None:
+    _finish(job, ImageJob.STATUS_CANCELLED, 'Target does not exist.')
+    return
+
+  # 同じ画像に対して新しいジョブがある場合は、そちらを優先する
+  newer_jobs = _target_jobs(target, job.field_name).filter(
+    created_at__gt=job.created_at,
+    status__in=(ImageJob.STATUS_PENDING, ImageJob.STATUS_PROCESSING, ImageJob.STATUS_DONE),
+  )
+  if newer_jobs.exists():
+    if rendered is not None:
+      rendered.cancel()
+    _finish(job, ImageJob.STATUS_CANCELLED, 'Superseded by a newer upload.')
+    return
+
+  try:
+    if rendered is None:
+      rendered = submit_image_job(job)
+    data = rendered.result(timeout=settings.IMAGE_SERVICE_TIMEOUT)
+    storage = target._meta.get_field(job.field_name).storage
+    with transaction.atomic():
+      # 処理中に取り消された（画像のリセット・差し替え）場合は対象に書き込まない
+      # ジョブの行をロックし、取り消し（cancel_image_jobs）と同時に進まないようにする
+      status = ImageJob.objects.select_for_update().filter(pk=job.pk).values_list('status', flat=True).first()
+      if status in (None, ImageJob.STATUS_CANCELLED):
+        return
+      # 処理中に新しい画像がアップロードされた場合も、そちらを優先する
+      if newer_jobs.exists():
+        _finish(job, ImageJob.STATUS_CANCELLED, 'Superseded by a newer upload.')
+        return
+      renditions = save_renditions(storage, data)
+      old_names = image_file_names(target, job.field_name)
+      _update_target(target, **{
+        job.field_name: primary_rendition(renditions),
+        f'{job.field_name}_renditions': renditions,
+        'image_status': ImageStatus.READY,
+      })
+      # 古い画像の参照を解放する（同じ内容の画像を再アップロードした場合は参照数が変わらない）
+      release_images(old_names)
+      _finish(job, ImageJob.STATUS_DONE)
+  except Exception as e:
+    logger.exception('Image job %s failed.', job.pk)
+    # 次の場合は再試行せずにfailedにする
+    # ・試行回数が上限に達した
+    # ・形式・画素数で受け付けない画像（再試行しても結果が変わらない）
+    # ・inlineモード（処理待ちに戻しても、処理するワーカーがいない）
+    retry = (
+      job.attempts < settings.IMAGE_JOB_MAX_ATTEMPTS
+      and not isinstance(e, (ImageTooLarge, UnsupportedImageFormat))
+      and settings.IMAGE_PROCESSING_MODE != 'inline'
+    )
+    if not retry:
+      _update_target(target, image_status=ImageStatus.FAILED)
+      _finish(job, ImageJob.STATUS_FAILED, str(e))
+    else:
+      _finish(job, ImageJob.STATUS_PENDING, str(e))
@@ -0,0 +1,113 @@
+import glob
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ExifTags
+from reviewsite.utils.image import ORIENTATION_TAG, resize_image
+
+
+# 以前のresize_image（原寸でデコードし、原寸のまま回転してから縮小する）
+def legacy_resize_image(image, size=500):
+  exif = image._getexif()
+  if exif is not None:
+    orientation_key = next((key for key, value in ExifTags.TAGS.items() if value == 'Orientation'), None)
+    orientation = exif.get(orientation_key)
+    if orientation == 3:
+      image = image.rotate(180, expand=True)
+    elif orientation == 6:
+      image = image.rotate(270, expand=True)
+    elif orientation == 8:
+      image = image.rotate(90, expand=True)
+  image.thumbnail((size, size))
+  new_image = Image.new("RGB", (size, size), (255, 255, 255))
+  new_image.paste(image, (int((size - image.size[0]) / 2), int((size - image.size[1]) / 2)))
+  return new_image
+
+
+def run_variant(variant, paths, repeat):
+  resize = {'legacy': legacy_resize_image, 'current': resize_image}.get(variant)
+  start = time.process_time()
+  if resize is not None:
+    for _ in range(repeat):
+      for path in paths:
+        with Image.open(path) as img:
+          resize(img).save(io.BytesIO(), format='JPEG', quality=85)
+  cpu = time.process_time() - start
+  return cpu, peak_rss_kb()
+
+
+# プロセスのピークRSS（KB）
+# ru_maxrssはexec前の親プロセスのピークを引き継ぐため、Linuxでは/proc/self/statusのVmHWMを使う
+def peak_rss_kb():
+  try:
+    with open('/proc/self/status') as f:
+      for line in f:
+        if line.startswith('VmHWM:'):
+          return int(line.split()[1])
+  except OSError:
+    pass
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# 実際のサイズのJPEGを使って、resize_imageのCPU時間とピークメモリを以前の処理と比較する
+# ピークメモリはプロセス単位でしか測れないため、処理ごとに新しいプロセスで実行する
+class Command(BaseCommand):
+    help = '画像リサイズのCPU時間とピークメモリ（RSS）を以前の処理と比較します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help='JPEGファイルのディレクトリ（省略時は生成した画像を使います）')
+        parser.add_argument('--generate', type=int, default=8, help='生成する画像の枚数')
+        parser.add_argument('--megapixels', type=float, default=12.0, help='生成する画像の画素数（MP）')
+        parser.add_argument('--repeat', type=int, default=1)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if options['corpus']:
+                paths = sorted(
+                    glob.glob(os.path.join(options['corpus'], '*.jpg'))
+                    + glob.glob(os.path.join(options['corpus'], '*.jpeg'))
+                )
+                if not paths:
+                    raise CommandError(f'JPEGファイルがありません: {options["corpus"]}')
+            else:
+                paths = self.generate(tmpdir, options['generate'], options['megapixels'])
+
+            total_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+            context = multiprocessing.get_context('spawn')
+            results = {}
+            for variant in ('baseline', 'legacy', 'current'):
+                with context.Pool(1) as pool:
+                    results[variant] = pool.apply(run_variant, (variant, paths, options['repeat']))
+
+        self.stdout.write(f'images: {len(paths)} x {options["repeat"]} ({total_mb:.1f} MB)')
+        baseline_rss = results['baseline'][1]
+        for variant in ('legacy', 'current'):
+            cpu, rss = results[variant]
+            self.stdout.write(
+                f'{variant:8} cpu: {cpu * 1000 / (len(paths) * options["repeat"]):7.1f} ms/image, '
+                f'peak rss: +{(rss - baseline_rss) / 1024:.1f} MB'
+            )
+        legacy_cpu, current_cpu = results['legacy'][0], results['current'][0]
+        self.stdout.write(f'cpu speedup: {legacy_cpu / current_cpu:.1f}x')
+
+    # 向きのEXIF（6: 90度回転）付きのJPEGを生成する
+    def generate(self, directory, count, megapixels):
+        width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+        height = int(width * 3 / 4)
+        base = Image.merge('RGB', (
+            Image.linear_gradient('L').resize((width, height)),
+            Image.radial_gradient('L').resize((width, height)),
+            Image.effect_noise((width, height), 64),
+        ))
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = 6
+        paths = []
+        for i in range(count):
+            path = os.path.join(directory, f'{i}.jpg')
+            base.save(path, format='JPEG', quality=90, exif=exif)
+            paths.append(path)
+        return paths
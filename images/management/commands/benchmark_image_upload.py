@@ -0,0 +1,84 @@
+import io
+import time
+from concurrent.futures import as_completed
+from django.conf import settings
+from django.core.files.storage import default_storage, storages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from images.jobs import save_renditions
+from images.renditions import get_rendition_settings
+from reviewsite.utils.image import render_image_set
+from reviewsite.utils.image_service import get_image_service
+
+
+# アップロード画像の処理（レンディションの作成と保存）のスループットを計測する
+# --storageでlocal/memoryを指定すると、AWSなしで手元のマシンで計測できる
+# 保存した画像の参照はロールバックし、ファイルは計測後に削除する
+class Command(BaseCommand):
+    help = 'アップロード画像のレンディション作成・保存のスループットを計測します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help='処理する画像の枚数')
+        parser.add_argument('--megapixels', type=float, default=3.0, help='生成する画像の画素数（MP）')
+        parser.add_argument(
+            '--storage', choices=sorted(settings.MEDIA_STORAGE_BACKENDS),
+            help='保存先（省略時はMEDIA_STORAGEのストレージ）',
+        )
+
+    def handle(self, *args, **options):
+        if options['storage']:
+            storage = storages.create_storage(settings.MEDIA_STORAGE_BACKENDS[options['storage']])
+        else:
+            storage = default_storage
+        if options['count'] < 1:
+            raise CommandError('--countは1以上を指定してください。')
+
+        uploads = [self.generate(i, options['megapixels']) for i in range(options['count'])]
+        total_mb = sum(len(data) for data in uploads) / 1024 / 1024
+        service = get_image_service()
+        names = set()
+        render_wait = save_time = 0.0
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            futures = [
+                service.submit(render_image_set, data, *get_rendition_settings(), block=True)
+                for data in uploads
+            ]
+            mark = time.perf_counter()
+            for future in as_completed(futures):
+                rendered = future.result(timeout=settings.IMAGE_SERVICE_TIMEOUT)
+                save_start = time.perf_counter()
+                render_wait += save_start - mark
+                for by_size in save_renditions(storage, rendered).values():
+                    names.update(by_size.values())
+                mark = time.perf_counter()
+                save_time += mark - save_start
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+
+        for name in names:
+            storage.delete(name)
+
+        count = options['count']
+        self.stdout.write(f'storage: {type(storage).__name__}, workers: {service.max_workers}')
+        self.stdout.write(f'images: {count} ({total_mb:.1f} MB), files saved: {len(names)}')
+        self.stdout.write(f'throughput: {count / elapsed:.1f} images/s ({elapsed * 1000 / count:.1f} ms/image)')
+        self.stdout.write(
+            f'waiting for renders: {render_wait * 1000 / count:.1f} ms/image, '
+            f'saving: {save_time * 1000 / count:.1f} ms/image'
+        )
+
+    # 画像ごとに内容を変えたJPEGを生成する（同じ内容だと保存時に重複として扱われるため）
+    def generate(self, index, megapixels):
+        width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+        height = int(width * 3 / 4)
+        image = Image.merge('RGB', (
+            Image.linear_gradient('L').resize((width, height)),
+            Image.new('L', (width, height), index % 256),
+            Image.effect_noise((width, height), 32),
+        ))
+        image_io = io.BytesIO()
+        image.save(image_io, format='JPEG', quality=90)
+        return image_io.getvalue()
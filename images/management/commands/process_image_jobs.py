@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from images.deletions import drain_pending_deletions
+from images.jobs import claim_image_jobs, process_image_job, submit_image_job
+
+
+# 画像処理ジョブのワーカー（render.yamlのworkerで常駐させる）
+# ジョブの合間に削除待ちのファイル（PendingDeletion）の削除も行う
+class Command(BaseCommand):
+    help = '画像処理ジョブを実行します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='処理待ちのジョブを1回分だけ処理して終了します。')
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--sleep', type=float, default=2.0, help='ジョブがない場合の待機秒数')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            jobs = claim_image_jobs(options['batch_size'])
+            # 取得したジョブのリサイズをまとめて処理プールに投入し、複数コアで並列に処理する
+            rendered = [self.submit(job) for job in jobs]
+            for job, future in zip(jobs, rendered):
+                process_image_job(job, future)
+                self.stdout.write(f'image job {job.pk}: {job.status}')
+            deleted = drain_pending_deletions()
+            if options['once']:
+                break
+            if not jobs and not deleted:
+                time.sleep(options['sleep'])
+
+    # 元画像を読み込めない場合は、process_image_jobで失敗として扱う
+    def submit(self, job):
+        try:
+            return submit_image_job(job)
+        except Exception:
+            return None
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from images.deletions import drain_pending_deletions
+
+
+# 削除待ちのファイル（PendingDeletion）を削除する
+# 通常はprocess_image_jobsのワーカーが処理するため、溜まった分を手動で処理する場合に使う
+class Command(BaseCommand):
+    help = '削除待ちのファイルをまとめて削除します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='削除待ちのファイルがなくなったら終了します。')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=5.0, help='削除待ちがない場合の待機秒数')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            count = drain_pending_deletions(options['batch_size'])
+            if count:
+                self.stdout.write(f'processed {count} deletions')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.CharField(max_length=36)),
+                ('field_name', models.CharField(max_length=50)),
+                ('source', models.FileField(max_length=255, upload_to='uploads/', verbose_name='元画像')),
+                ('status', models.CharField(choices=[('pending', '処理待ち'), ('processing', '処理中'), ('done', '完了'), ('failed', '失敗'), ('cancelled', '取り消し')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='imagejob_status_created_idx'), models.Index(fields=['content_type', 'object_id', 'field_name'], name='imagejob_target_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# 直接アップロードの元画像が残っているジョブにキーを記録する（同じキーのジョブが複数ある場合は最初の1件だけ）
+def populate_upload_keys(apps, schema_editor):
+    ImageJob = apps.get_model('images', 'ImageJob')
+    seen = set()
+    jobs = ImageJob.objects.filter(source__startswith=settings.IMAGE_UPLOAD_PREFIX).order_by('created_at', 'pk')
+    for pk, source in jobs.values_list('pk', 'source').iterator():
+        if source not in seen:
+            seen.add(source)
+            ImageJob.objects.filter(pk=pk).update(upload_key=source)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0003_pendingdeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagejob',
+            name='upload_key',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(populate_upload_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.utils import timezone
+
+
+# 画像フィールドの処理状態（レビュー画像、プロフィール画像）
+class ImageStatus(models.TextChoices):
+  READY = 'ready', '処理済み'
+  PENDING = 'pending', '処理待ち'
+  FAILED = 'failed', '処理失敗'
+
+
+# アップロードされた元画像をリサイズして対象の画像フィールドに保存するジョブ
+class ImageJob(models.Model):
+  STATUS_PENDING = 'pending'
+  STATUS_PROCESSING = 'processing'
+  STATUS_DONE = 'done'
+  STATUS_FAILED = 'failed'
+  STATUS_CANCELLED = 'cancelled'
+  STATUS_CHOICES = (
+    (STATUS_PENDING, '処理待ち'),
+    (STATUS_PROCESSING, '処理中'),
+    (STATUS_DONE, '完了'),
+    (STATUS_FAILED, '失敗'),
+    (STATUS_CANCELLED, '取り消し'),
+  )
+
+  content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+  object_id = models.CharField(max_length=36)
+  target = GenericForeignKey('content_type', 'object_id')
+  field_name = models.CharField(max_length=50)
+  source = models.FileField('元画像', upload_to='uploads/', max_length=255)
+  # 直接アップロードされた元画像のキー（処理後にsourceを空にしても残し、同じキーの再利用を防ぐ）
+  upload_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+  status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+  attempts = models.PositiveSmallIntegerField(default=0)
+  error = models.TextField(blank=True)
+  updated_at = models.DateTimeField("更新日", auto_now=True)
+  created_at = models.DateTimeField("作成日", auto_now_add=True)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['status', 'created_at'], name='imagejob_status_created_idx'),
+      models.Index(fields=['content_type', 'object_id', 'field_name'], name='imagejob_target_idx'),
+    ]
+
+  def __str__(self):
+    return f'{self.content_type.model}:{self.object_id}.{self.field_name} ({self.status})'
+
+
+# 内容のハッシュをキーにして保存した画像ファイルと、その参照数
+# 同じ内容の画像は1つのファイルを共有し、参照数が0になったときだけ削除する
+class StoredImage(models.Model):
+  name = models.CharField(max_length=255, unique=True)
+  ref_count = models.PositiveIntegerField(default=0)
+  size = models.PositiveIntegerField(default=0)
+  updated_at = models.DateTimeField("更新日", auto_now=True)
+  created_at = models.DateTimeField("作成日", auto_now_add=True)
+
+  def __str__(self):
+    return f'{self.name} ({self.ref_count})'
+
+
+# 削除待ちのファイル（トランザクショナルアウトボックス）
+# 画像の参照を解放したトランザクション内で登録し、コミット後にワーカーがまとめて削除する
+class PendingDeletion(models.Model):
+  STATUS_PENDING = 'pending'
+  STATUS_DEAD = 'dead'
+  STATUS_CHOICES = (
+    (STATUS_PENDING, '削除待ち'),
+    (STATUS_DEAD, '削除失敗'),
+  )
+
+  name = models.CharField(max_length=255)
+  status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+  attempts = models.PositiveSmallIntegerField(default=0)
+  next_attempt_at = models.DateTimeField(default=timezone.now)
+  error = models.TextField(blank=True)
+  created_at = models.DateTimeField("作成日", auto_now_add=True)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['status', 'next_attempt_at'], name='deletion_status_next_idx'),
+    ]
+
+  def __str__(self):
+    return f'{self.name} ({self.status})'
@@ -0,0 +1,52 @@
+from django.conf import settings
+
+
+def rendition_extension(image_format):
+  return 'jpg' if image_format == 'jpeg' else image_format
+
+
+# 画像フィールドに保存する代表の画像（JPEGの最大サイズ）
+def primary_rendition(renditions):
+  by_size = renditions.get('jpeg') or next(iter(renditions.values()))
+  return by_size[max(by_size, key=int)]
+
+
+# 画像フィールドとレンディションのファイル名（デフォルト画像は除く）
+def image_file_names(instance, field_name='image'):
+  field = instance._meta.get_field(field_name)
+  names = {getattr(instance, field_name).name}
+  for by_size in getattr(instance, f'{field_name}_renditions', {}).values():
+    names.update(by_size.values())
+  names.discard(field.get_default())
+  names.discard(None)
+  names.discard('')
+  return names
+
+
+# {形式: srcset文字列} を作る（例: {'webp': 'https://.../96.webp 96w, https://.../256.webp 256w'}）
+# build_urlはファイル名を絶対URLにする関数
+def build_srcset(renditions, build_url):
+  return {
+    image_format: ', '.join(f'{build_url(by_size[size])} {size}w' for size in sorted(by_size, key=int))
+    for image_format, by_size in (renditions or {}).items()
+  }
+
+
+def get_rendition_settings():
+  return (
+    tuple(settings.IMAGE_RENDITION_SIZES),
+    tuple(settings.IMAGE_RENDITION_FORMATS),
+    settings.IMAGE_RENDITION_QUALITY,
+    settings.IMAGE_MAX_PIXELS,
+    tuple(settings.IMAGE_UPLOAD_FORMATS),
+  )
+
+
+# インスタンスの画像フィールドのsrcsetマップ
+def image_srcset(instance, field_name, request=None):
+  storage = instance._meta.get_field(field_name).storage
+
+  def build_url(name):
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+  return build_srcset(getattr(instance, f'{field_name}_renditions'), build_url)
@@ -0,0 +1,34 @@
+from rest_framework import serializers
+from images.uploads import validate_upload_key, validate_image_upload
+
+
+class PresignedUploadRequestSerializer(serializers.Serializer):
+  content_type = serializers.CharField()
+
+
+# アップロードされた画像をデコードする前に、サイズ・形式・画素数を確認するImageField
+class UploadImageField(serializers.ImageField):
+  def to_internal_value(self, data):
+    if hasattr(data, 'size') and hasattr(data, 'seek'):
+      validate_image_upload(data)
+    return super().to_internal_value(data)
+
+
+# 直接アップロード済みの元画像のキー（書き込み専用）
+# 検証にはリクエストのユーザーを使うため、contextにrequestが必要
+class UploadKeyField(serializers.CharField):
+  def __init__(self, **kwargs):
+    kwargs.setdefault('write_only', True)
+    kwargs.setdefault('required', False)
+    super().__init__(**kwargs)
+
+  def to_internal_value(self, data):
+    key = super().to_internal_value(data)
+    return validate_upload_key(self.context['request'].user, key)
+
+
+# ストレージのPOSTポリシーと同じ形式で送られたファイルを受け取る（LocalUploadView用）
+class LocalUploadSerializer(serializers.Serializer):
+  key = serializers.CharField()
+  policy = serializers.CharField()
+  file = serializers.FileField()
@@ -0,0 +1,155 @@
+import base64
+import json
+import tempfile
+from unittest import mock
+from botocore.stub import Stubber
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from images.blobs import store_image, release_images, content_key
+from images.deletions import drain_pending_deletions, enqueue_deletions
+from images.models import PendingDeletion, StoredImage
+from reviewsite.utils import storage as storage_module
+from reviewsite.utils.storage import (
+  MediaStorage, LocalMediaStorage, InMemoryMediaStorage, get_s3_client, delete_s3_objects
+)
+
+
+class StoredImageTests(TestCase):
+  def setUp(self):
+    self.data = b'rendition bytes'
+    self.name = content_key(self.data, 'webp')
+    self.addCleanup(default_storage.delete, self.name)
+
+  # 同じ内容の画像は1つのファイルを共有し、参照数で管理する
+  def test_store_deduplicates(self):
+    self.assertTrue(self.name.startswith('images/'))
+    self.assertEqual(store_image(default_storage, self.data, 'webp'), self.name)
+    self.assertEqual(store_image(default_storage, self.data, 'webp'), self.name)
+    self.assertTrue(default_storage.exists(self.name))
+    self.assertEqual(StoredImage.objects.get(name=self.name).ref_count, 2)
+    self.assertNotEqual(content_key(b'other bytes', 'webp'), self.name)
+
+  # 参照が残っている間は削除せず、最後の参照を解放したときだけ削除待ちにする
+  def test_release_enqueues_when_unreferenced(self):
+    store_image(default_storage, self.data, 'webp')
+    store_image(default_storage, self.data, 'webp')
+
+    release_images([self.name])
+    self.assertEqual(StoredImage.objects.get(name=self.name).ref_count, 1)
+    self.assertFalse(PendingDeletion.objects.exists())
+
+    release_images([self.name])
+    self.assertFalse(StoredImage.objects.filter(name=self.name).exists())
+    self.assertEqual(list(PendingDeletion.objects.values_list('name', flat=True)), [self.name])
+    # リクエスト中はストレージを呼び出さない
+    self.assertTrue(default_storage.exists(self.name))
+
+  # 参照数の管理外のファイルは、ハッシュのキーでなければそのまま削除待ちにする
+  def test_release_unmanaged_files(self):
+    release_images(['reviews/legacy.jpg', 'images/00/unknown.webp'])
+    self.assertEqual(list(PendingDeletion.objects.values_list('name', flat=True)), ['reviews/legacy.jpg'])
+
+  # 同じ名前が複数回含まれる場合は、その回数だけ参照数を減らす
+  def test_release_counts_duplicates(self):
+    for _ in range(3):
+      store_image(default_storage, self.data, 'webp')
+    release_images([self.name, self.name])
+    self.assertEqual(StoredImage.objects.get(name=self.name).ref_count, 1)
+
+
+class MediaStorageTests(TestCase):
+  # ハッシュのキーの画像だけ長期間キャッシュさせる
+  @override_settings(IMAGE_BLOB_CACHE_CONTROL='public, max-age=31536000, immutable')
+  def test_cache_control(self):
+    storage = MediaStorage(location='static', object_parameters={'CacheControl': 'max-age=86400'})
+    blob = storage.get_object_parameters(storage._normalize_name('images/ab/abcd.webp'))
+    legacy = storage.get_object_parameters(storage._normalize_name('reviews/photo.jpg'))
+    self.assertEqual(blob['CacheControl'], 'public, max-age=31536000, immutable')
+    self.assertEqual(legacy['CacheControl'], 'max-age=86400')
+
+
+
+# AWSなしで使うストレージ（MEDIA_STORAGE='local'/'memory'）もS3と同じ操作ができる
+class LocalStorageTests(TestCase):
+  def storages(self):
+    with tempfile.TemporaryDirectory() as location:
+      yield LocalMediaStorage(location=location, base_url='/media/')
+    yield InMemoryMediaStorage(base_url='/media/')
+
+  def test_save_url_and_delete_many(self):
+    for storage in self.storages():
+      with self.subTest(type(storage).__name__):
+        key = store_image(storage, b'local-image', 'webp')
+        self.assertTrue(storage.exists(key))
+        self.assertEqual(storage.url(key), f'/media/{key}')
+        self.assertEqual(storage.delete_many([key, 'images/missing.webp']), {})
+        self.assertFalse(storage.exists(key))
+        StoredImage.objects.all().delete()
+
+  # テストではMEDIA_STORAGEによらずメモリ上のストレージを使う（reviewsite.utils.testing.TestRunner）
+  def test_default_storage_is_pinned(self):
+    self.assertIsInstance(default_storage, InMemoryMediaStorage)
+
+  # 削除待ちのファイルはストレージのdelete_manyでまとめて削除する
+  def test_drain_pending_deletions(self):
+    storage = InMemoryMediaStorage()
+    names = [storage.save(f'reviews/{i}.jpg', ContentFile(b'data')) for i in range(3)]
+    enqueue_deletions(names)
+    with mock.patch.object(storage, 'delete_many', wraps=storage.delete_many) as delete_many:
+      self.assertEqual(drain_pending_deletions(storage=storage), 3)
+    delete_many.assert_called_once_with(sorted(names))
+    self.assertFalse(any(storage.exists(name) for name in names))
+
+
+# 認証情報はダミーを使い、クライアントはテストごとに作り直す（API呼び出しはStubberで置き換える）
+@override_settings(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_S3_REGION_NAME='us-east-1')
+class S3ClientTests(TestCase):
+  def setUp(self):
+    patcher = mock.patch.object(storage_module, '_s3_client', None)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.client = get_s3_client()
+    self.stubber = Stubber(self.client)
+    self.stubber.activate()
+    self.addCleanup(self.stubber.deactivate)
+
+  # クライアントはプロセス内で1つだけ作る
+  def test_client_is_shared(self):
+    self.assertIs(get_s3_client(), self.client)
+
+  # 1000件ずつdelete_objectsで削除し、削除できなかったキーを返す
+  def test_delete_in_batches(self):
+    keys = [f'static/images/{i}.webp' for i in range(2500)]
+    for start, end in ((0, 1000), (1000, 2000), (2000, 2500)):
+      errors = [{'Key': keys[start], 'Code': 'AccessDenied', 'Message': 'Access Denied'}] if start == 1000 else []
+      self.stubber.add_response(
+        'delete_objects',
+        {'Errors': errors},
+        {'Bucket': 'bucket', 'Delete': {'Objects': [{'Key': key} for key in keys[start:end]], 'Quiet': True}},
+      )
+    errors = delete_s3_objects(keys + keys[:10], bucket='bucket')
+    self.stubber.assert_no_pending_responses()
+    self.assertEqual([error['Key'] for error in errors], ['static/images/1000.webp'])
+
+  # ストレージのdelete_manyはlocationを含むキーで削除する
+  def test_storage_delete_many(self):
+    storage = MediaStorage(location='static', bucket_name='bucket')
+    self.stubber.add_response(
+      'delete_objects',
+      {},
+      {'Bucket': 'bucket', 'Delete': {'Objects': [{'Key': 'static/images/aa/a.webp'}], 'Quiet': True}},
+    )
+    self.assertEqual(storage.delete_many(['images/aa/a.webp']), {})
+    self.stubber.assert_no_pending_responses()
+
+  # 署名付きPOSTはContent-Typeとサイズの上限をポリシーに含める（API呼び出しはしない）
+  def test_presigned_post(self):
+    storage = MediaStorage(location='static', bucket_name='bucket')
+    url, fields = storage.presigned_post('uploads/direct/1/a.jpg', 'image/jpeg', 1024, 600)
+    self.assertIn('bucket', url)
+    self.assertEqual(fields['key'], 'static/uploads/direct/1/a.jpg')
+    self.assertEqual(fields['Content-Type'], 'image/jpeg')
+    policy = json.loads(base64.b64decode(fields['policy']))
+    self.assertIn(['content-length-range', 1, 1024], policy['conditions'])
+    self.assertIn({'Content-Type': 'image/jpeg'}, policy['conditions'])
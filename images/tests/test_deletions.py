@@ -0,0 +1,102 @@
+import datetime
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from images.blobs import release_images, store_image
+from images.deletions import (
+  claim_pending_deletions, delete_claimed, delete_files, drain_pending_deletions, enqueue_deletions, retry_delay
+)
+from images.models import PendingDeletion, StoredImage
+
+
+@override_settings(IMAGE_DELETION_RETRY_DELAY=30, IMAGE_DELETION_MAX_DELAY=3600, IMAGE_DELETION_MAX_ATTEMPTS=3)
+class PendingDeletionTests(TestCase):
+  def save_file(self, name):
+    name = default_storage.save(name, ContentFile(b'data'))
+    self.addCleanup(default_storage.delete, name)
+    return name
+
+  # 削除待ちのファイルをまとめて削除し、アウトボックスから取り除く
+  def test_drain(self):
+    names = [self.save_file(f'reviews/outbox-{i}.jpg') for i in range(3)]
+    enqueue_deletions(names)
+    self.assertEqual(drain_pending_deletions(), 3)
+    self.assertFalse(PendingDeletion.objects.exists())
+    for name in names:
+      self.assertFalse(default_storage.exists(name))
+    self.assertEqual(drain_pending_deletions(), 0)
+
+  # 削除待ちの間に再び参照された画像は削除しない
+  def test_skips_referenced_images(self):
+    name = self.save_file('images/aa/outbox.webp')
+    enqueue_deletions([name])
+    StoredImage.objects.create(name=name, ref_count=1)
+    drain_pending_deletions()
+    self.assertTrue(default_storage.exists(name))
+    self.assertFalse(PendingDeletion.objects.exists())
+
+  # 同じ内容の画像を再び保存すると削除待ちを取り消す
+  def test_store_cancels_pending_deletion(self):
+    name = store_image(default_storage, b'restored', 'webp')
+    self.addCleanup(default_storage.delete, name)
+    release_images([name])
+    self.assertTrue(PendingDeletion.objects.filter(name=name).exists())
+
+    self.assertEqual(store_image(default_storage, b'restored', 'webp'), name)
+    self.assertFalse(PendingDeletion.objects.exists())
+    self.assertEqual(drain_pending_deletions(), 0)
+    self.assertTrue(default_storage.exists(name))
+
+  # 取得してから削除するまでの間に再び保存された画像は削除しない
+  def test_store_between_claim_and_delete(self):
+    name = store_image(default_storage, b'raced', 'webp')
+    self.addCleanup(default_storage.delete, name)
+    release_images([name])
+
+    claimed = claim_pending_deletions(10)
+    self.assertEqual(len(claimed), 1)
+    # 取得済みの行は他のワーカーから取得されない
+    self.assertEqual(claim_pending_deletions(10), [])
+    store_image(default_storage, b'raced', 'webp')
+    delete_claimed(default_storage, claimed)
+    self.assertTrue(default_storage.exists(name))
+    self.assertEqual(StoredImage.objects.get(name=name).ref_count, 1)
+
+  # 削除はchunk_size件ずつストレージに依頼する
+  def test_drain_in_chunks(self):
+    names = [self.save_file(f'reviews/chunk-{i}.jpg') for i in range(5)]
+    enqueue_deletions(names)
+    with mock.patch('images.deletions.delete_files', wraps=delete_files) as spy:
+      self.assertEqual(drain_pending_deletions(chunk_size=2), 5)
+    self.assertEqual([len(call.args[1]) for call in spy.call_args_list], [2, 2, 1])
+    self.assertFalse(PendingDeletion.objects.exists())
+
+  # 失敗したファイルは指数バックオフで再試行し、上限に達したらdeadにする
+  def test_retry_and_dead_letter(self):
+    enqueue_deletions(['reviews/fail.jpg', 'reviews/ok.jpg'])
+    with mock.patch('images.deletions.delete_files', return_value={'reviews/fail.jpg': 'Access Denied'}) as delete_files:
+      drain_pending_deletions()
+      delete_files.assert_called_once_with(default_storage, {'reviews/fail.jpg', 'reviews/ok.jpg'})
+
+      deletion = PendingDeletion.objects.get()
+      self.assertEqual((deletion.name, deletion.attempts, deletion.error), ('reviews/fail.jpg', 1, 'Access Denied'))
+      self.assertGreater(deletion.next_attempt_at, timezone.now() + datetime.timedelta(seconds=25))
+
+      # 再試行時刻まではスキップする
+      self.assertEqual(drain_pending_deletions(), 0)
+
+      for attempts in (2, 3):
+        PendingDeletion.objects.update(next_attempt_at=timezone.now())
+        drain_pending_deletions()
+    deletion.refresh_from_db()
+    self.assertEqual(deletion.attempts, 3)
+    self.assertEqual(deletion.status, PendingDeletion.STATUS_DEAD)
+    self.assertEqual(drain_pending_deletions(), 0)
+
+  def test_retry_delay(self):
+    self.assertEqual(
+      [retry_delay(attempts).total_seconds() for attempts in (1, 2, 3, 10)],
+      [30, 60, 120, 3600]
+    )
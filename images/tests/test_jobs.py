@@ -0,0 +1,268 @@
+import datetime
+import io
+from unittest import mock
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from images.deletions import drain_pending_deletions
+from images import jobs
+from images.jobs import enqueue_image_job, cancel_image_jobs, claim_image_jobs, process_image_job
+from images.models import ImageJob, ImageStatus, PendingDeletion, StoredImage
+from images.renditions import image_file_names
+from item.models import Item, Brand, Series, Position
+from review.models import Review, UserReview
+
+User = get_user_model()
+
+
+def make_upload(name='upload.png', size=(1200, 800), color='red', format='PNG'):
+  image_io = io.BytesIO()
+  Image.new('RGB', size, color).save(image_io, format=format)
+  return SimpleUploadedFile(name, image_io.getvalue(), content_type=f'image/{format.lower()}')
+
+
+def delete_image_files(instance):
+  storage = instance._meta.get_field('image').storage
+  for name in image_file_names(instance):
+    storage.delete(name)
+
+
+class ImageJobTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user(email='image@example.com')
+    brand = Brand.objects.create(name='Image Brand')
+    cls.item = Item.objects.create(
+      item_name='Image Item',
+      brand=brand,
+      series=Series.objects.create(name='Image Series', brand=brand),
+      position=Position.objects.create(name='Image Position'),
+      release_date=datetime.date(2023, 10, 1),
+      display=True
+    )
+
+  def setUp(self):
+    self.review = Review.objects.create(user=self.user, item=self.item, title='Title', content='Content')
+    UserReview.objects.create(user=self.user, review=self.review)
+    # 削除待ちになった元画像を片付ける
+    self.addCleanup(drain_pending_deletions)
+
+  # 登録時は対象をpendingにし、処理後にリサイズ済みの画像を保存してreadyにする
+  def test_enqueue_and_process(self):
+    job = enqueue_image_job(self.review, 'image', make_upload())
+    self.review.refresh_from_db()
+    self.assertEqual(self.review.image_status, ImageStatus.PENDING)
+    self.assertFalse(self.review.image)
+
+    process_image_job(job)
+    self.review.refresh_from_db()
+    self.addCleanup(delete_image_files, self.review)
+    self.assertEqual(self.review.image_status, ImageStatus.READY)
+    with self.review.image.open('rb') as f, Image.open(f) as img:
+      self.assertEqual(img.format, 'JPEG')
+      self.assertEqual(max(img.size), 500)
+
+    job.refresh_from_db()
+    self.assertEqual(job.status, ImageJob.STATUS_DONE)
+    self.assertEqual(job.attempts, 1)
+    self.assertFalse(job.source)
+
+  # 設定したサイズと形式のレンディションを保存し、JPEGの最大サイズを画像フィールドに設定する
+  def test_renditions(self):
+    process_image_job(enqueue_image_job(self.review, 'image', make_upload()))
+    self.review.refresh_from_db()
+    self.addCleanup(delete_image_files, self.review)
+
+    renditions = self.review.image_renditions
+    self.assertEqual(set(renditions), {'webp', 'jpeg'})
+    self.assertEqual(self.review.image.name, renditions['jpeg']['500'])
+    storage = self.review.image.storage
+    for image_format, by_size in renditions.items():
+      self.assertEqual(set(by_size), {'96', '256', '500'})
+      for size, name in by_size.items():
+        self.assertTrue(name.startswith('images/'))
+        with storage.open(name) as f, Image.open(f) as img:
+          self.assertEqual(img.format, image_format.upper())
+          self.assertEqual(img.size, (int(size), int(size)))
+
+    self.client.force_authenticate(user=self.user)
+    response = self.client.get(reverse('reviews:review-detail', kwargs={'pk': self.review.id}))
+    srcset = response.data['image_srcset']
+    self.assertEqual(set(srcset), {'webp', 'jpeg'})
+    self.assertRegex(srcset['webp'], r'^\S+\.webp 96w, \S+\.webp 256w, \S+\.webp 500w$')
+    self.assertNotIn('image_renditions', response.data)
+
+  # 画像を差し替えた場合、新しい画像を保存してから古い画像（レンディションを含む）を削除する
+  def test_replaces_old_image(self):
+    Review.objects.filter(pk=self.review.pk).update(
+      image='reviews/old.jpg', image_renditions={'webp': {'96': 'reviews/old-96.webp'}}
+    )
+    self.review.refresh_from_db()
+    job = enqueue_image_job(self.review, 'image', make_upload())
+    source_name = job.source.name
+    process_image_job(job)
+    self.review.refresh_from_db()
+    self.addCleanup(delete_image_files, self.review)
+    self.assertNotEqual(self.review.image.name, 'reviews/old.jpg')
+    # 古い画像と元画像は削除待ちになる
+    self.assertEqual(
+      set(PendingDeletion.objects.values_list('name', flat=True)),
+      {'reviews/old.jpg', 'reviews/old-96.webp', source_name}
+    )
+
+  # 新しいアップロードがある場合、古いジョブは処理せずに取り消す
+  def test_superseded_job_is_cancelled(self):
+    old_job = enqueue_image_job(self.review, 'image', make_upload(color='blue'))
+    new_job = enqueue_image_job(self.review, 'image', make_upload(color='green'))
+    ImageJob.objects.filter(pk=new_job.pk).update(created_at=old_job.created_at + datetime.timedelta(seconds=1))
+
+    process_image_job(old_job)
+    old_job.refresh_from_db()
+    self.assertEqual(old_job.status, ImageJob.STATUS_CANCELLED)
+    self.review.refresh_from_db()
+    self.assertEqual(self.review.image_status, ImageStatus.PENDING)
+
+    new_job.refresh_from_db()
+    process_image_job(new_job)
+    self.review.refresh_from_db()
+    self.addCleanup(delete_image_files, self.review)
+    self.assertEqual(self.review.image_status, ImageStatus.READY)
+
+  # 処理に失敗した場合は再試行し、上限に達したらfailedにする
+  @override_settings(IMAGE_JOB_MAX_ATTEMPTS=2)
+  def test_failed_job_is_retried(self):
+    job = enqueue_image_job(self.review, 'image', SimpleUploadedFile('broken.jpg', b'not an image'))
+    with self.assertLogs('images.jobs', 'ERROR'):
+      process_image_job(job)
+    job.refresh_from_db()
+    self.assertEqual(job.status, ImageJob.STATUS_PENDING)
+
+    with self.assertLogs('images.jobs', 'ERROR'):
+      process_image_job(job)
+    job.refresh_from_db()
+    self.assertEqual(job.status, ImageJob.STATUS_FAILED)
+    self.assertEqual(job.attempts, 2)
+    self.review.refresh_from_db()
+    self.assertEqual(self.review.image_status, ImageStatus.FAILED)
+
+  # inlineモードでは処理するワーカーがいないため、上限に達していなくても再試行せずにfailedにする
+  @override_settings(IMAGE_PROCESSING_MODE='inline', IMAGE_JOB_MAX_ATTEMPTS=3)
+  def test_failed_inline_job_is_not_retried(self):
+    with self.assertLogs('images.jobs', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+      job = enqueue_image_job(self.review, 'image', SimpleUploadedFile('broken.jpg', b'not an image'))
+    job.refresh_from_db()
+    self.assertEqual((job.status, job.attempts), (ImageJob.STATUS_FAILED, 1))
+    self.assertFalse(job.source)
+    self.review.refresh_from_db()
+    self.assertEqual(self.review.image_status, ImageStatus.FAILED)
+
+  def test_cancel_image_jobs(self):
+    job = enqueue_image_job(self.review, 'image', make_upload())
+    cancel_image_jobs(self.review, 'image')
+    job.refresh_from_db()
+    self.assertEqual(job.status, ImageJob.STATUS_CANCELLED)
+    self.assertFalse(job.source)
+    self.review.refresh_from_db()
+    self.assertEqual(self.review.image_status, ImageStatus.READY)
+
+  # 処理中に取り消された（画像のリセット）ジョブは、対象に書き込まずに終わる
+  def test_cancel_processing_job(self):
+    enqueue_image_job(self.review, 'image', make_upload())
+    [job] = claim_image_jobs(10)
+    submit_image_job = jobs.submit_image_job
+
+    def cancel_during_processing(job):
+      rendered = submit_image_job(job)
+      cancel_image_jobs(Review.objects.get(pk=self.review.pk), 'image')
+      return rendered
+
+    with mock.patch('images.jobs.submit_image_job', side_effect=cancel_during_processing):
+      process_image_job(job)
+    job.refresh_from_db()
+    self.assertEqual((job.status, job.source.name), (ImageJob.STATUS_CANCELLED, ''))
+    self.review.refresh_from_db()
+    self.assertEqual(self.review.image_status, ImageStatus.READY)
+    self.assertFalse(self.review.image)
+    self.assertFalse(StoredImage.objects.exists())
+
+  # 処理中に新しい画像がアップロードされた場合は、古いジョブの結果を書き込まない
+  def test_replaced_during_processing(self):
+    enqueue_image_job(self.review, 'image', make_upload())
+    [job] = claim_image_jobs(10)
+    submit_image_job = jobs.submit_image_job
+
+    def replace_during_processing(job):
+      rendered = submit_image_job(job)
+      enqueue_image_job(Review.objects.get(pk=self.review.pk), 'image', make_upload(color='blue'))
+      return rendered
+
+    with mock.patch('images.jobs.submit_image_job', side_effect=replace_during_processing):
+      process_image_job(job)
+    self.addCleanup(lambda: [job.source.delete(save=False) for job in ImageJob.objects.all()])
+    job.refresh_from_db()
+    self.assertEqual(job.status, ImageJob.STATUS_CANCELLED)
+    self.review.refresh_from_db()
+    self.assertEqual(self.review.image_status, ImageStatus.PENDING)
+    self.assertFalse(self.review.image)
+
+  # 処理待ちのジョブと、タイムアウトした処理中のジョブを取得する
+  @override_settings(IMAGE_JOB_TIMEOUT=60)
+  def test_claim_image_jobs(self):
+    pending = enqueue_image_job(self.review, 'image', make_upload())
+    stale = enqueue_image_job(self.user, 'image', make_upload())
+    ImageJob.objects.filter(pk=stale.pk).update(
+      status=ImageJob.STATUS_PROCESSING, updated_at=timezone.now() - datetime.timedelta(minutes=5)
+    )
+    self.addCleanup(lambda: [job.source.delete(save=False) for job in ImageJob.objects.all()])
+
+    claimed = claim_image_jobs(10)
+    self.assertEqual({job.pk for job in claimed}, {pending.pk, stale.pk})
+    self.assertEqual(claim_image_jobs(10), [])
+
+  # レビュー投稿時はリサイズせずにジョブを登録し、pendingを返す
+  def test_create_review_enqueues_job(self):
+    self.client.force_authenticate(user=self.user)
+    url = reverse('reviews:create-review', kwargs={'item_id': self.item.id})
+    response = self.client.post(url, {'title': 'New', 'content': 'Content', 'image': make_upload()}, format='multipart')
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(response.data['image_status'], ImageStatus.PENDING)
+    self.assertIsNone(response.data['image'])
+
+    job = ImageJob.objects.get(object_id=response.data['id'])
+    self.addCleanup(job.source.delete, save=False)
+    self.assertEqual(job.status, ImageJob.STATUS_PENDING)
+
+  # inlineモードではコミット後にその場で処理する
+  @override_settings(IMAGE_PROCESSING_MODE='inline')
+  def test_update_review_inline(self):
+    self.client.force_authenticate(user=self.user)
+    url = reverse('reviews:review-detail', kwargs={'pk': self.review.id})
+    with self.captureOnCommitCallbacks(execute=True):
+      response = self.client.patch(url, {'image': make_upload()}, format='multipart')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.review.refresh_from_db()
+    self.addCleanup(delete_image_files, self.review)
+    self.assertEqual(self.review.image_status, ImageStatus.READY)
+    self.assertTrue(self.review.is_edited)
+
+  # プロフィール画像もジョブで処理し、デフォルト画像は削除しない
+  def test_update_user_image(self):
+    self.client.force_authenticate(user=self.user)
+    url = reverse('accounts:customuser-detail', kwargs={'pk': self.user.pk})
+    response = self.client.patch(url, {'image': make_upload()}, format='multipart')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data['image_status'], ImageStatus.PENDING)
+
+    job = ImageJob.objects.get(object_id=str(self.user.pk))
+    source_name = job.source.name
+    process_image_job(job)
+    self.user.refresh_from_db()
+    self.addCleanup(delete_image_files, self.user)
+    self.assertEqual(self.user.image.name, self.user.image_renditions['jpeg']['500'])
+    self.assertEqual(self.user.image_status, ImageStatus.READY)
+    self.assertEqual(list(PendingDeletion.objects.values_list('name', flat=True)), [source_name])
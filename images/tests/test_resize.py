@@ -0,0 +1,67 @@
+import io
+from unittest import mock
+from PIL import Image, ImageChops, ImageOps, ImageStat
+from django.test import SimpleTestCase
+from reviewsite.utils.image import ORIENTATION_TAG, ImageTooLarge, render_image_set, resize_image
+
+
+def make_jpeg(orientation=None, size=(1600, 800)):
+  # 左上だけ赤い画像（向きを判別できるようにする）
+  image = Image.new('RGB', size, (255, 255, 255))
+  image.paste((255, 0, 0), (0, 0, size[0] // 2, size[1] // 2))
+  exif = Image.Exif()
+  if orientation is not None:
+    exif[ORIENTATION_TAG] = orientation
+  image_io = io.BytesIO()
+  image.save(image_io, format='JPEG', quality=95, exif=exif)
+  return image_io.getvalue()
+
+
+class ResizeImageTests(SimpleTestCase):
+  # 原寸で向きを補正してから縮小した場合と同じ結果になる（反転を含む全ての向き）
+  def test_orientation(self):
+    for orientation in range(1, 9):
+      with self.subTest(orientation=orientation):
+        data = make_jpeg(orientation)
+        with Image.open(io.BytesIO(data)) as img:
+          result = resize_image(img)
+        with Image.open(io.BytesIO(data)) as img:
+          expected = ImageOps.exif_transpose(img)
+          expected.thumbnail((500, 500))
+          padded = Image.new('RGB', (500, 500), (255, 255, 255))
+          padded.paste(expected, ((500 - expected.size[0]) // 2, (500 - expected.size[1]) // 2))
+
+        self.assertEqual(result.size, (500, 500))
+        diff = ImageStat.Stat(ImageChops.difference(result, padded)).mean
+        self.assertLess(max(diff), 3)
+
+  # JPEGは目標サイズに近い解像度でデコードする
+  # thumbnail に渡る時点でデコード解像度が 1/4 に縮小済みであることを確認する
+  def test_draft_decode(self):
+    sizes = []
+    thumbnail = Image.Image.thumbnail
+
+    def record_size(image, *args, **kwargs):
+      sizes.append(image.size)
+      return thumbnail(image, *args, **kwargs)
+
+    with Image.open(io.BytesIO(make_jpeg(size=(4000, 3000)))) as img:
+      with mock.patch.object(Image.Image, 'thumbnail', autospec=True, side_effect=record_size):
+        result = resize_image(img)
+    self.assertEqual(sizes, [(1000, 750)])
+    self.assertEqual(result.size, (500, 500))
+
+  def test_non_jpeg(self):
+    image_io = io.BytesIO()
+    Image.new('RGBA', (1000, 200), (0, 0, 255, 255)).save(image_io, format='PNG')
+    with Image.open(image_io) as img:
+      result = resize_image(img)
+    self.assertEqual(result.size, (500, 500))
+    self.assertEqual(result.getpixel((250, 250)), (0, 0, 255))
+
+  # 画素数の上限を超える画像はデコードしない
+  def test_render_checks_pixels(self):
+    data = make_jpeg(size=(400, 300))
+    with self.assertRaises(ImageTooLarge):
+      render_image_set(data, (96,), ('jpeg',), 85, 100_000)
+    self.assertEqual(set(render_image_set(data, (96,), ('jpeg',), 85, 120_000)), {(96, 'jpeg')})
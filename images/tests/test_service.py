@@ -0,0 +1,70 @@
+import asyncio
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from images.models import ImageJob
+from images.tests.test_jobs import make_upload
+from reviewsite.utils.image import resize_image_bytes
+from reviewsite.utils.image_service import ImageProcessingService, ImageServiceBusy
+
+User = get_user_model()
+
+
+class ImageProcessingServiceTests(APITestCase):
+  def make_service(self, max_workers=1, max_queue=0):
+    service = ImageProcessingService(max_workers, max_queue, retry_after=7)
+    self.addCleanup(service.shutdown)
+    return service
+
+  # 別プロセスでリサイズした結果を受け取れる
+  def test_run_in_pool(self):
+    service = self.make_service()
+    data = service.run(resize_image_bytes, make_upload().read(), timeout=60)
+    self.assertTrue(data.startswith(b'\xff\xd8'))
+
+  def test_arun(self):
+    service = self.make_service()
+    self.assertIsNone(asyncio.run(service.arun(time.sleep, 0)))
+
+  # 実行中＋待機中のタスクが上限に達すると受け付けない
+  def test_rejects_when_saturated(self):
+    service = self.make_service(max_workers=1, max_queue=1)
+    running = [service.submit(time.sleep, 0.5), service.submit(time.sleep, 0)]
+    with self.assertRaises(ImageServiceBusy) as cm:
+      service.submit(time.sleep, 0)
+    self.assertEqual(cm.exception.wait, 7)
+
+    # 完了すると空きができる
+    for future in running:
+      future.result(timeout=60)
+    service.run(time.sleep, 0, timeout=60)
+
+  # プロセス数0の場合は呼び出し元で実行し、例外もFutureで返す
+  def test_without_pool(self):
+    service = self.make_service(max_workers=0)
+    self.assertTrue(service.run(resize_image_bytes, make_upload().read()).startswith(b'\xff\xd8'))
+    with self.assertRaises(OSError):
+      service.run(resize_image_bytes, b'not an image')
+
+
+@override_settings(IMAGE_PROCESSING_MODE='inline')
+class ImageServiceBackpressureTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user(email='busy@example.com')
+
+  # 処理プールが埋まっている場合は503とRetry-Afterを返し、何も保存しない
+  def test_upload_returns_503_when_saturated(self):
+    self.client.force_authenticate(user=self.user)
+    url = reverse('accounts:customuser-detail', kwargs={'pk': self.user.pk})
+    with mock.patch.object(ImageProcessingService, 'submit', side_effect=ImageServiceBusy(5)):
+      response = self.client.patch(url, {'name': 'Busy', 'image': make_upload()}, format='multipart')
+    self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+    self.assertEqual(response['Retry-After'], '5')
+    self.assertFalse(ImageJob.objects.exists())
+    self.user.refresh_from_db()
+    self.assertNotEqual(self.user.name, 'Busy')
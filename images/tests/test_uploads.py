@@ -0,0 +1,228 @@
+import datetime
+import struct
+import zlib
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+from images.deletions import drain_pending_deletions
+from images.jobs import enqueue_uploaded_image, process_image_job
+from images.models import ImageJob, ImageStatus, PendingDeletion
+from images.tests.test_jobs import make_upload, delete_image_files
+from item.models import Item, Brand, Series, Position
+from review.models import Review
+
+User = get_user_model()
+
+
+class DirectUploadTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user(email='direct@example.com')
+    cls.other = User.objects.create_user(email='other@example.com')
+    brand = Brand.objects.create(name='Direct Brand')
+    cls.item = Item.objects.create(
+      item_name='Direct Item',
+      brand=brand,
+      series=Series.objects.create(name='Direct Series', brand=brand),
+      position=Position.objects.create(name='Direct Position'),
+      release_date=datetime.date(2023, 10, 1),
+      display=True
+    )
+
+  def setUp(self):
+    self.client.force_authenticate(user=self.user)
+    self.addCleanup(drain_pending_deletions)
+
+  def presign(self, content_type='image/png'):
+    return self.client.post(reverse('images:presigned-upload'), {'content_type': content_type}, format='json')
+
+  # 署名付きPOSTの内容をそのまま送る（ブラウザからストレージへのアップロード）
+  def upload(self, presigned, upload=None):
+    self.client.force_authenticate(user=None)
+    response = self.client.post(
+      presigned['url'], {**presigned['fields'], 'file': upload or make_upload()}, format='multipart'
+    )
+    self.client.force_authenticate(user=self.user)
+    if response.status_code == status.HTTP_204_NO_CONTENT:
+      self.addCleanup(default_storage.delete, presigned['key'])
+    return response
+
+  # アップロードしたキーでレビューを投稿すると、画像のデータを送らずにジョブが登録される
+  def test_create_review_with_uploaded_key(self):
+    presigned = self.presign().data
+    self.assertEqual(presigned['url'], reverse('images:local-upload'))
+    self.assertTrue(presigned['key'].startswith(f'uploads/direct/{self.user.pk}/'))
+    self.assertEqual(self.upload(presigned).status_code, status.HTTP_204_NO_CONTENT)
+    self.assertTrue(default_storage.exists(presigned['key']))
+
+    url = reverse('reviews:create-review', kwargs={'item_id': self.item.id})
+    response = self.client.post(
+      url, {'title': 'Direct', 'content': 'Content', 'image_key': presigned['key']}, format='json'
+    )
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(response.data['image_status'], ImageStatus.PENDING)
+    self.assertNotIn('image_key', response.data)
+
+    job = ImageJob.objects.get(object_id=response.data['id'])
+    self.assertEqual(job.source.name, presigned['key'])
+    process_image_job(job)
+    review = Review.objects.get(pk=response.data['id'])
+    self.addCleanup(delete_image_files, review)
+    self.assertEqual(review.image_status, ImageStatus.READY)
+    # 処理後は元画像を削除待ちにする
+    self.assertEqual(list(PendingDeletion.objects.values_list('name', flat=True)), [presigned['key']])
+
+  # inlineモードでもリクエストでは画像を扱わず、コミット後にストレージから読み込んで処理する
+  @override_settings(IMAGE_PROCESSING_MODE='inline')
+  def test_update_user_with_uploaded_key(self):
+    presigned = self.presign('image/jpeg').data
+    self.upload(presigned, make_upload('upload.jpg', format='JPEG'))
+    url = reverse('accounts:customuser-detail', kwargs={'pk': self.user.pk})
+    with self.captureOnCommitCallbacks(execute=True):
+      response = self.client.patch(url, {'image_key': presigned['key']}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.user.refresh_from_db()
+    self.addCleanup(delete_image_files, self.user)
+    self.assertEqual(self.user.image_status, ImageStatus.READY)
+    self.assertEqual(self.user.image.name, self.user.image_renditions['jpeg']['500'])
+
+  # 他のユーザーのキー、存在しないキー、使用済みのキーは受け付けない
+  def test_rejects_invalid_keys(self):
+    review = Review.objects.create(user=self.user, item=self.item, title='Title', content='Content')
+    url = reverse('reviews:review-detail', kwargs={'pk': review.id})
+    presigned = self.presign().data
+    self.upload(presigned)
+
+    self.client.force_authenticate(user=self.other)
+    other_key = self.presign().data['key']
+    self.client.force_authenticate(user=self.user)
+    for key in (other_key, f'uploads/direct/{self.user.pk}/missing.png', 'reviews/photo.jpg'):
+      with self.subTest(key=key):
+        response = self.client.patch(url, {'image_key': key}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    self.assertEqual(self.client.patch(url, {'image_key': presigned['key']}, format='json').status_code, status.HTTP_200_OK)
+    response = self.client.patch(url, {'image_key': presigned['key']}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(ImageJob.objects.count(), 1)
+
+  # 処理が終わって元画像が削除待ちになった後も、同じキーは使えない
+  @override_settings(IMAGE_PROCESSING_MODE='inline')
+  def test_rejects_consumed_key_after_processing(self):
+    review = Review.objects.create(user=self.user, item=self.item, title='Title', content='Content')
+    url = reverse('reviews:review-detail', kwargs={'pk': review.id})
+    presigned = self.presign().data
+    self.upload(presigned)
+    with self.captureOnCommitCallbacks(execute=True):
+      self.assertEqual(self.client.patch(url, {'image_key': presigned['key']}, format='json').status_code, status.HTTP_200_OK)
+    review.refresh_from_db()
+    self.addCleanup(delete_image_files, review)
+    job = ImageJob.objects.get()
+    self.assertEqual((job.status, job.source.name, job.upload_key), (ImageJob.STATUS_DONE, '', presigned['key']))
+
+    # 元画像の削除前（ストレージに残っている間）でも弾く
+    self.assertEqual(self.client.patch(url, {'image_key': presigned['key']}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+    # 検証を通り抜けた場合もジョブの登録時に一意制約で弾く
+    with self.assertRaises(ValidationError):
+      enqueue_uploaded_image(review, 'image', presigned['key'])
+    self.assertEqual(ImageJob.objects.count(), 1)
+
+  # 直接アップロードでは宣言したContent-Typeによらず、処理時に画像の形式を確認する（再試行はしない）
+  def test_rejects_unsupported_format_when_processing(self):
+    review = Review.objects.create(user=self.user, item=self.item, title='Title', content='Content')
+    presigned = self.presign().data
+    self.assertEqual(self.upload(presigned, make_upload('upload.png', format='GIF')).status_code, status.HTTP_204_NO_CONTENT)
+    enqueue_uploaded_image(review, 'image', presigned['key'])
+
+    job = ImageJob.objects.get()
+    with self.assertLogs('images.jobs', 'ERROR'):
+      process_image_job(job)
+    job.refresh_from_db()
+    self.assertEqual((job.status, job.attempts), (ImageJob.STATUS_FAILED, 1))
+    self.assertIn('Unsupported image format: GIF', job.error)
+    review.refresh_from_db()
+    self.assertEqual(review.image_status, ImageStatus.FAILED)
+
+  def test_rejects_unsupported_content_type(self):
+    response = self.presign('image/svg+xml')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+  # ローカルのアップロード先はS3と同じくポリシーの署名・Content-Type・サイズを検証する
+  @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+  def test_local_upload_enforces_policy(self):
+    presigned = self.presign().data
+    cases = {
+      'tampered': (
+        {**presigned['fields'], 'key': f'uploads/direct/{self.user.pk}/other.png'},
+        make_upload(size=(8, 8)), status.HTTP_400_BAD_REQUEST,
+      ),
+      'content type': (
+        {**presigned['fields'], 'Content-Type': 'image/jpeg'},
+        make_upload(size=(8, 8)), status.HTTP_400_BAD_REQUEST,
+      ),
+      'too large': (
+        presigned['fields'],
+        SimpleUploadedFile('large.png', b'x' * 2048), status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+      ),
+    }
+    for name, (fields, upload, expected) in cases.items():
+      with self.subTest(name):
+        response = self.upload({**presigned, 'fields': fields}, upload)
+        self.assertEqual(response.status_code, expected)
+    self.assertFalse(default_storage.exists(presigned['key']))
+
+
+# 幅と高さだけを指定したPNGのヘッダー（ピクセルのデータは持たない）
+def png_header(width, height):
+  def chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+  ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+  return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IEND', b'')
+
+
+class UploadGuardTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user(email='guard@example.com')
+
+  def setUp(self):
+    self.client.force_authenticate(user=self.user)
+    self.url = reverse('accounts:customuser-detail', kwargs={'pk': self.user.pk})
+
+  def patch_image(self, upload):
+    return self.client.patch(self.url, {'image': upload}, format='multipart')
+
+  # 受信中にサイズの上限を超えた時点で413にする
+  @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+  def test_rejects_large_file(self):
+    response = self.patch_image(SimpleUploadedFile('large.png', b'x' * 4096, content_type='image/png'))
+    self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    self.assertFalse(ImageJob.objects.exists())
+
+  # 画素数はデコードせずにヘッダーで確認する（数十億画素のヘッダーでもメモリを使わない）
+  def test_rejects_too_many_pixels(self):
+    for name, upload, settings in (
+      ('bomb', SimpleUploadedFile('bomb.png', png_header(100_000, 100_000)), {}),
+      ('limit', make_upload(size=(100, 100)), {'IMAGE_MAX_PIXELS': 5000}),
+    ):
+      with self.subTest(name), override_settings(**settings):
+        response = self.patch_image(upload)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['image'][0].code, 'too_many_pixels')
+    self.assertFalse(ImageJob.objects.exists())
+
+  def test_rejects_unsupported_format(self):
+    response = self.patch_image(make_upload('upload.gif', format='GIF'))
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertFalse(ImageJob.objects.exists())
+
+  def test_accepts_valid_image(self):
+    response = self.patch_image(make_upload())
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    job = ImageJob.objects.get()
+    self.addCleanup(job.source.delete, save=False)
@@ -0,0 +1,89 @@
+import mimetypes
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from rest_framework.exceptions import ValidationError
+from images.models import ImageJob, PendingDeletion
+from reviewsite.utils.image import ImageTooLarge, inspect_image
+from reviewsite.utils.upload_handlers import UploadTooLarge
+
+UPLOAD_POLICY_SALT = 'images.uploads.policy'
+UPLOAD_USED_MESSAGE = 'This upload has already been used.'
+
+
+# アップロード先のキー（ユーザーごとのディレクトリ以下、推測できない名前）
+def upload_prefix(user):
+  return f'{settings.IMAGE_UPLOAD_PREFIX}{user.pk}/'
+
+
+def upload_key(user, content_type):
+  extension = mimetypes.guess_extension(content_type) or ''
+  return f'{upload_prefix(user)}{uuid.uuid4().hex}{extension}'
+
+
+# ブラウザからストレージへ直接アップロードするための署名付きPOST（{url, fields, key}）を作る
+# ストレージがpresigned_postを持たない場合（ローカルのファイルシステム等）は、
+# 同じ形式でLocalUploadViewに送らせる（開発・テスト用）
+def create_presigned_upload(user, content_type, storage=None):
+  if content_type not in settings.IMAGE_UPLOAD_CONTENT_TYPES:
+    raise ValidationError({'content_type': f'Unsupported content type: {content_type}'})
+  storage = storage or default_storage
+  key = upload_key(user, content_type)
+  max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+  expires = settings.IMAGE_UPLOAD_EXPIRES
+
+  if hasattr(storage, 'presigned_post'):
+    url, fields = storage.presigned_post(key, content_type, max_size, expires)
+  else:
+    url = reverse('images:local-upload')
+    policy = {'key': key, 'content_type': content_type, 'max_size': max_size}
+    fields = {
+      'key': key,
+      'Content-Type': content_type,
+      'policy': signing.dumps(policy, salt=UPLOAD_POLICY_SALT),
+    }
+  return {'url': url, 'fields': fields, 'key': key}
+
+
+# LocalUploadViewに送られたポリシーを検証して {key, content_type, max_size} を返す
+def load_upload_policy(token):
+  try:
+    return signing.loads(token, salt=UPLOAD_POLICY_SALT, max_age=settings.IMAGE_UPLOAD_EXPIRES)
+  except signing.BadSignature:
+    raise ValidationError({'policy': 'Invalid or expired upload policy.'})
+
+
+# アップロード済みのキーを検証する
+# 自分のディレクトリ以下にあり、ストレージに存在し、まだジョブで使われていないキーだけを受け付ける
+# 使用済みかはImageJob.upload_key（処理後も残る）で判定する。同時に使われた場合はジョブの登録時に一意制約で弾く
+def validate_upload_key(user, key, storage=None):
+  storage = storage or default_storage
+  if not key.startswith(upload_prefix(user)) or '..' in key:
+    raise ValidationError('Invalid upload key.')
+  # 削除待ちのキー（upload_keyを記録する前に処理されたジョブの元画像）も使用済みとする
+  if ImageJob.objects.filter(upload_key=key).exists() or PendingDeletion.objects.filter(name=key).exists():
+    raise ValidationError(UPLOAD_USED_MESSAGE)
+  if not storage.exists(key):
+    raise ValidationError('Uploaded file does not exist.')
+  return key
+
+
+# multipartでアップロードされた画像を、デコードする前に検証する
+# サイズはMaxFileSizeUploadHandlerが受信中に確認済みだが、ハンドラーを通らない場合のためにここでも確認する
+# 形式と画素数はヘッダーだけを読んで確認し、ファイルの位置は先頭に戻す
+def validate_image_upload(upload):
+  if upload.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+    raise UploadTooLarge()
+  try:
+    image_format, _ = inspect_image(upload, settings.IMAGE_MAX_PIXELS)
+  except ImageTooLarge as e:
+    raise ValidationError(str(e), code='too_many_pixels')
+  except Exception:
+    raise ValidationError('Upload a valid image.', code='invalid_image')
+  finally:
+    upload.seek(0)
+  if image_format not in settings.IMAGE_UPLOAD_FORMATS:
+    raise ValidationError(f'Unsupported image format: {image_format}', code='invalid_image')
+  return upload
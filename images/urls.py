@@ -0,0 +1,9 @@
+from django.urls import path
+from images import views
+
+app_name = 'images'
+
+urlpatterns = [
+  path('uploads/', views.PresignedUploadView.as_view(), name='presigned-upload'),
+  path('uploads/local/', views.LocalUploadView.as_view(), name='local-upload'),
+]
@@ -0,0 +1,47 @@
+from django.core.files.storage import default_storage
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from images import serializers
+from images.uploads import create_presigned_upload, load_upload_policy
+
+
+# 元画像を直接ストレージへアップロードするための署名付きPOSTを発行する
+# クライアントはurlへfieldsとfileをmultipartでPOSTし、返されたkeyをimage_keyとしてレビュー・プロフィールの保存時に送る
+class PresignedUploadView(APIView):
+  authentication_classes = (JWTAuthentication,)
+
+  def post(self, request, *args, **kwargs):
+    serializer = serializers.PresignedUploadRequestSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    upload = create_presigned_upload(request.user, serializer.validated_data['content_type'])
+    return Response(upload, status=status.HTTP_201_CREATED)
+
+
+# ストレージが署名付きPOSTに対応していない場合のアップロード先（S3のPOSTの代わり、開発・テスト用）
+# 認証はS3と同じく署名済みのポリシーで行う
+class LocalUploadView(APIView):
+  permission_classes = (AllowAny,)
+  authentication_classes = ()
+  parser_classes = (MultiPartParser,)
+
+  def post(self, request, *args, **kwargs):
+    serializer = serializers.LocalUploadSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    policy = load_upload_policy(serializer.validated_data['policy'])
+    upload = serializer.validated_data['file']
+    if serializer.validated_data['key'] != policy['key']:
+      raise ValidationError({'key': 'Key does not match the upload policy.'})
+    if request.data.get('Content-Type') != policy['content_type']:
+      raise ValidationError({'Content-Type': 'Content type does not match the upload policy.'})
+    if not 0 < upload.size <= policy['max_size']:
+      raise ValidationError({'file': 'File size is out of the allowed range.'})
+    if default_storage.exists(policy['key']):
+      raise ValidationError({'key': 'Key already exists.'})
+    default_storage.save(policy['key'], upload)
+    # S3のPOSTと同じく、成功時は本文なしの204を返す
+    return Response(status=status.HTTP_204_NO_CONTENT)
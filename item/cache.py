@@ -0,0 +1,52 @@
+import functools
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+from item.models import CatalogVersion
+from reviewsite.utils.versions import bump_version, get_version
+
+
+CATALOG_VERSION_KEY = 'item:catalog:version'
+
+
+# アイテムカタログのバージョン（管理画面などで更新されるたびに変わる）
+# 全ワーカーで同じ値になるようDBに置き、キャッシュにCATALOG_VERSION_CACHE_TIMEOUT秒だけ保持する
+# キャッシュ済みの間はクエリを発行しない（他のワーカーでの更新は最大でその秒数だけ遅れて反映される）
+# 1回のリクエストの中では同じ値を使う（requestに保持する）
+def get_catalog_version(request=None):
+  if request is not None and hasattr(request, '_catalog_version'):
+    return request._catalog_version
+  version = cache.get(CATALOG_VERSION_KEY)
+  if version is None:
+    version = get_version(CatalogVersion)
+    cache.set(CATALOG_VERSION_KEY, version, getattr(settings, 'CATALOG_VERSION_CACHE_TIMEOUT', 5))
+  if request is not None:
+    request._catalog_version = version
+  return version
+
+
+# 更新したワーカーではキャッシュしたバージョンを消してすぐに反映する
+# コミット前に他のリクエストが古いバージョンを読み直す場合があるため、コミット後にも消す
+def bump_catalog_version():
+  bump_version(CatalogVersion)
+  cache.delete(CATALOG_VERSION_KEY)
+  transaction.on_commit(lambda: cache.delete(CATALOG_VERSION_KEY))
+
+
+# GETのレスポンスデータをカタログのバージョン付きキーでキャッシュするデコレータ
+# カタログが更新されるとキーが変わり、古いキャッシュは参照されなくなる
+def catalog_cached(method):
+  @functools.wraps(method)
+  def wrapper(self, request, *args, **kwargs):
+    key = f'item:catalog:{get_catalog_version(request)}:{type(self).__name__}:{request.get_full_path()}'
+    data = cache.get(key)
+    if data is not None:
+      return Response(data)
+
+    response = method(self, request, *args, **kwargs)
+    if response.status_code == status.HTTP_200_OK:
+      cache.set(key, response.data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', None))
+    return response
+  return wrapper
@@ -0,0 +1,58 @@
+from collections import Counter
+from django.db.models import Count
+from item.models import Item
+
+# ファセットの次元（クエリパラメータ名、レスポンスのキー）
+FACETS = (
+  ('brand', 'brands'),
+  ('series', 'series'),
+  ('position', 'positions'),
+)
+
+
+# 公開状態・発売日で絞り込む（ファセットの集計でも共通の条件）
+def filter_base(queryset, filters):
+  queryset = queryset.filter(display=filters['display'])
+  if filters.get('released_after'):
+    queryset = queryset.filter(release_date__gte=filters['released_after'])
+  if filters.get('released_before'):
+    queryset = queryset.filter(release_date__lte=filters['released_before'])
+  return queryset
+
+
+def filter_items(queryset, filters):
+  queryset = filter_base(queryset, filters)
+  for name, _ in FACETS:
+    if filters.get(name):
+      queryset = queryset.filter(**{f'{name}__in': filters[name]})
+  return queryset
+
+
+# 各次元の件数を返す
+# 件数はその次元以外の条件で数える（ブランドを選んでも他のブランドの件数が分かるように）
+# (brand, series, position)ごとの件数を1回のGROUP BYで取得し、次元ごとの集計はPythonで行う
+def facet_counts(filters, queryset=None):
+  queryset = Item.objects.all() if queryset is None else queryset
+  names = [name for name, _ in FACETS]
+  rows = filter_base(queryset, filters).values(*names).annotate(count=Count('id')).order_by()
+
+  selected = {name: set(filters.get(name) or ()) for name in names}
+  counts = {name: Counter() for name in names}
+  total = 0
+  for row in rows:
+    unmatched = [name for name in names if selected[name] and row[name] not in selected[name]]
+    if not unmatched:
+      total += row['count']
+      targets = names
+    elif len(unmatched) == 1:
+      # 条件に合わない次元が1つだけなら、その次元の件数にだけ数える
+      targets = unmatched
+    else:
+      continue
+    for name in targets:
+      counts[name][row[name]] += row['count']
+
+  data = {'count': total}
+  for name, key in FACETS:
+    data[key] = [{'id': value, 'count': count} for value, count in sorted(counts[name].items())]
+  return data
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0004_alter_item_item_photo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['brand', 'series', 'position', 'release_date'], name='item_facet_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['display', '-release_date'], name='item_display_release_idx'),
+        ),
+    ]
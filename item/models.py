@@ -51,3 +51,15 @@ class Item(models.Model):
   )
   release_date = models.DateField()
   display = models.BooleanField(default=False)
+
+  class Meta:
+    indexes = [
+      # 絞り込み・ファセットの集計用
+      models.Index(fields=['brand', 'series', 'position', 'release_date'], name='item_facet_idx'),
+      # 公開中のアイテムを発売日の新しい順に並べる一覧用
+      models.Index(fields=['display', '-release_date'], name='item_display_release_idx'),
+    ]
+
+# カタログのキャッシュ・ETag用のバージョン（item.cache）。カタログが更新されるたびに増やす
+class CatalogVersion(models.Model):
+  version = models.BigIntegerField(default=0)
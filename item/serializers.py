@@ -13,6 +13,10 @@ class SeriesSerializer(serializers.ModelSerializer):
     model = models.Series
     fields = '__all__'
 
+  @classmethod
+  def setup_eager_loading(cls, queryset, request=None):
+    return queryset.select_related('brand')
+
 class PositionSerializer(serializers.ModelSerializer):
   class Meta:
     model = models.Position
@@ -26,4 +30,23 @@ class ItemSerializer(serializers.ModelSerializer) :
   class Meta:
     model = models.Item
     fields = '__all__'
-    
+
+  @classmethod
+  def setup_eager_loading(cls, queryset, request=None):
+    return queryset.select_related('brand', 'series__brand', 'position')
+
+# アイテム一覧・ファセットの絞り込み条件（クエリパラメータ）
+# brand・series・positionは ?brand=1&brand=2 のように複数指定できる
+class ItemFilterSerializer(serializers.Serializer):
+  brand = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=50)
+  series = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=50)
+  position = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=50)
+  released_after = serializers.DateField(required=False)
+  released_before = serializers.DateField(required=False)
+  display = serializers.BooleanField(default=True)
+
+  def validate(self, attrs):
+    after, before = attrs.get('released_after'), attrs.get('released_before')
+    if after and before and after > before:
+      raise serializers.ValidationError('released_after must be on or before released_before.')
+    return attrs
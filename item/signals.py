@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from item.cache import bump_catalog_version
+from item.models import Brand, Item, Position, Series
+
+
+# カタログ（アイテム、ブランド、シリーズ、ポジション）が変更されたらキャッシュを無効化
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Series)
+@receiver(post_save, sender=Position)
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Series)
+@receiver(post_delete, sender=Position)
+def invalidate_catalog_cache(sender, **kwargs):
+  bump_catalog_version()
@@ -0,0 +1,25 @@
+from django.urls import reverse
+from item.urls import urlpatterns
+from reviewsite.utils import testing
+
+
+# アイテム関連エンドポイントのクエリ数がデータ件数に依存しないことを確認
+class ItemQueryBudgetTests(testing.QueryBudgetTestCase):
+  app_namespace = 'items'
+  urlpatterns = urlpatterns
+
+  def test_item_list(self):
+    url = reverse('items:item-list')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_item_detail(self):
+    url = reverse('items:item-detail', kwargs={'pk': self.item.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_item_metadata_list(self):
+    url = reverse('items:item-metadata-list')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_item_facets(self):
+    url = reverse('items:item-facets')
+    self.assertQueryCountConstant(lambda: self.client.get(url, {'brand': self.brand.id}))
@@ -1,8 +1,11 @@
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
-from item.models import Item, Brand, Series, Position
+from item.cache import CATALOG_VERSION_KEY
+from item.models import Item, Brand, Series, Position, CatalogVersion
 import datetime
+from django.core.cache import cache
+from django.db.models import F
 
 
 class ItemDetailViewTests(APITestCase):
@@ -26,6 +29,15 @@ class ItemDetailViewTests(APITestCase):
     self.assertEqual(response.status_code, status.HTTP_200_OK)
     self.assertEqual(response.data['item_name'], self.item.item_name)
 
+  # If-None-Match: * はアイテムが存在する場合だけ304
+  def test_if_none_match_any(self):
+    url = reverse('items:item-detail', kwargs={'pk': self.item.id})
+    response = self.client.get(url,format='json',HTTP_IF_NONE_MATCH='*')
+    self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    url = reverse('items:item-detail', kwargs={'pk': self.item.id + 1})
+    response = self.client.get(url,format='json',HTTP_IF_NONE_MATCH='*')
+    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 class ItemListViewTests(APITestCase):
   # アイテム取得
   def test_get_item_list(self):
@@ -43,3 +55,141 @@ class ItemMetadataListViewTests(APITestCase):
     self.assertIn('brands', response.data)
     self.assertIn('series', response.data)
     self.assertIn('positions', response.data)
+
+class CatalogCacheTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.brand = Brand.objects.create(name='Test Brand')
+    cls.series = Series.objects.create(name='Test Series', brand=cls.brand)
+    cls.position = Position.objects.create(name='Test Position')
+    Item.objects.create(
+      item_name='Test Item',
+      brand=cls.brand,
+      series=cls.series,
+      position=cls.position,
+      release_date=datetime.date.today(),
+      display=True
+    )
+
+  def setUp(self):
+    cache.clear()
+
+  # キャッシュ済みの場合はDBに問い合わせない（カタログのバージョンもキャッシュから読む）
+  def test_warm_cache_no_queries(self):
+    for name in ('items:item-list', 'items:item-metadata-list'):
+      url = reverse(name)
+      self.client.get(url,format='json')
+      with self.assertNumQueries(0):
+        response = self.client.get(url,format='json')
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    # バージョンのキャッシュが切れた後は、バージョンだけを読み直す
+    cache.delete(CATALOG_VERSION_KEY)
+    with self.assertNumQueries(1):
+      response = self.client.get(url,format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+  # ETagが一致する場合はクエリを発行せずに304を返す
+  def test_not_modified(self):
+    item = Item.objects.get()
+    for url in (reverse('items:item-list'), reverse('items:item-detail', kwargs={'pk': item.id})):
+      etag = self.client.get(url,format='json')['ETag']
+      with self.assertNumQueries(0):
+        response = self.client.get(url,format='json',HTTP_IF_NONE_MATCH=etag)
+      self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+      item.save()
+      response = self.client.get(url,format='json',HTTP_IF_NONE_MATCH=etag)
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+  # カタログが更新されたらキャッシュが無効化される
+  def test_cache_invalidated_on_change(self):
+    url = reverse('items:item-metadata-list')
+    self.client.get(url,format='json')
+    self.brand.name = 'Renamed Brand'
+    self.brand.save()
+    response = self.client.get(url,format='json')
+    self.assertEqual(response.data['brands'][0]['name'], 'Renamed Brand')
+
+    Position.objects.create(name='New Position')
+    response = self.client.get(url,format='json')
+    self.assertEqual(len(response.data['positions']), 2)
+
+  # 他のワーカーでの更新（プロセスごとのキャッシュには残らない）も、バージョンのキャッシュが切れると反映される
+  def test_cache_invalidated_by_other_process(self):
+    url = reverse('items:item-metadata-list')
+    self.client.get(url,format='json')
+    Brand.objects.filter(pk=self.brand.pk).update(name='Updated Elsewhere')
+    CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1)
+    response = self.client.get(url,format='json')
+    self.assertEqual(response.data['brands'][0]['name'], 'Test Brand')
+
+    cache.delete(CATALOG_VERSION_KEY)
+    response = self.client.get(url,format='json')
+    self.assertEqual(response.data['brands'][0]['name'], 'Updated Elsewhere')
+
+class ItemFilterTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.yonex = Brand.objects.create(name='YONEX')
+    cls.mizuno = Brand.objects.create(name='MIZUNO')
+    cls.front = Position.objects.create(name='前衛')
+    cls.back = Position.objects.create(name='後衛')
+    cls.geo = Series.objects.create(name='GEOBREAK', brand=cls.yonex)
+    cls.acrospeed = Series.objects.create(name='ACROSPEED', brand=cls.mizuno)
+
+    def create_item(name, series, position, release_date, display=True):
+      return Item.objects.create(
+        item_name=name, brand=series.brand, series=series, position=position,
+        release_date=release_date, display=display
+      )
+    cls.geo_front = create_item('GEO 50V', cls.geo, cls.front, datetime.date(2023, 3, 1))
+    cls.geo_back = create_item('GEO 50S', cls.geo, cls.back, datetime.date(2022, 3, 1))
+    cls.acro_front = create_item('ACRO V', cls.acrospeed, cls.front, datetime.date(2021, 3, 1))
+    cls.hidden = create_item('GEO 70V', cls.geo, cls.front, datetime.date(2024, 3, 1), display=False)
+
+  def setUp(self):
+    cache.clear()
+
+  def get_item_names(self, params):
+    response = self.client.get(reverse('items:item-list'), params)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    return [item['item_name'] for item in response.data]
+
+  # 既定では公開中のアイテムだけを発売日の新しい順に返す
+  def test_filters(self):
+    cases = (
+      ({}, ['GEO 50V', 'GEO 50S', 'ACRO V']),
+      ({'display': 'false'}, ['GEO 70V']),
+      ({'brand': self.yonex.id}, ['GEO 50V', 'GEO 50S']),
+      ({'position': self.front.id}, ['GEO 50V', 'ACRO V']),
+      ({'series': [self.geo.id, self.acrospeed.id], 'position': self.back.id}, ['GEO 50S']),
+      ({'released_after': '2022-01-01', 'released_before': '2022-12-31'}, ['GEO 50S']),
+    )
+    for params, expected in cases:
+      with self.subTest(params):
+        self.assertEqual(self.get_item_names(params), expected)
+
+  def test_invalid_filters(self):
+    url = reverse('items:item-list')
+    for params in ({'brand': 'yonex'}, {'released_after': '2023-01-01', 'released_before': '2022-01-01'}):
+      with self.subTest(params):
+        self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(self.client.get(reverse('items:item-facets'), {'released_after': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+  # 各次元の件数はその次元以外の条件で数え、1回のクエリで集計する（+ カタログのバージョン）
+  def test_facet_counts(self):
+    url = reverse('items:item-facets')
+    with self.assertNumQueries(2):
+      response = self.client.get(url, {'brand': self.yonex.id, 'position': self.front.id})
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data, {
+      'count': 1,
+      'brands': [{'id': self.yonex.id, 'count': 1}, {'id': self.mizuno.id, 'count': 1}],
+      'series': [{'id': self.geo.id, 'count': 1}],
+      'positions': [{'id': self.front.id, 'count': 1}, {'id': self.back.id, 'count': 1}],
+    })
+
+    response = self.client.get(url, {'released_after': '2022-01-01'})
+    self.assertEqual(response.data['count'], 2)
+    self.assertEqual(response.data['brands'], [{'id': self.yonex.id, 'count': 2}])
@@ -9,4 +9,5 @@ urlpatterns = [
   path('item_list/',views.ItemListView.as_view(),name='item-list'),
   path('item_detail/<int:pk>/',views.ItemDetailView.as_view(),name='item-detail'),
   path('item_metadata_list/', views.ItemMetadataListView.as_view(),name='item-metadata-list'),
+  path('item_facets/', views.ItemFacetView.as_view(),name='item-facets'),
 ]
\ No newline at end of file
@@ -4,25 +4,54 @@ from rest_framework.permissions import AllowAny
 from item import serializers
 from item import models
 from rest_framework.response import Response
+from reviewsite.utils.eager_loading import EagerLoadingMixin
+from item.cache import catalog_cached, get_catalog_version
+from reviewsite.utils.etag import ETagMixin
+from item.filters import facet_counts, filter_items
 
-class ItemDetailView(generics.RetrieveAPIView):
+
+#クエリパラメータの絞り込み条件を検証して返す
+def get_item_filters(request):
+  serializer = serializers.ItemFilterSerializer(data=request.query_params)
+  serializer.is_valid(raise_exception=True)
+  return serializer.validated_data
+
+#カタログのETagはバージョンだけで決まるため、バージョンがキャッシュ済みなら304の判定にクエリを発行しない
+class ItemDetailView(ETagMixin, EagerLoadingMixin, generics.RetrieveAPIView):
   queryset = models.Item.objects.all()
   serializer_class = serializers.ItemSerializer
   permission_classes = (AllowAny,)
 
-class ItemListView(generics.ListAPIView):
+  def get_etag(self, request, *args, **kwargs):
+    return (get_catalog_version(request),)
+
+#カタログはユーザーに依存しないため認証せず、キャッシュから返す
+class ItemListView(ETagMixin, EagerLoadingMixin, generics.ListAPIView):
   queryset = models.Item.objects.all().order_by('-release_date')
   serializer_class = serializers.ItemSerializer
   permission_classes = (AllowAny,)
+  authentication_classes = ()
   ordering_fields = ['release_date']
   ordering = ['-release_date']
 
+  def get_queryset(self):
+    return filter_items(super().get_queryset(), get_item_filters(self.request))
+
+  def get_etag(self, request, *args, **kwargs):
+    return (get_catalog_version(request),)
+
+  @catalog_cached
+  def list(self, request, *args, **kwargs):
+    return super().list(request, *args, **kwargs)
+
 class ItemMetadataListView(APIView):
   permission_classes = (AllowAny,)
+  authentication_classes = ()
 
+  @catalog_cached
   def get(self, request):
     brands = models.Brand.objects.all()
-    series = models.Series.objects.all()
+    series = serializers.SeriesSerializer.setup_eager_loading(models.Series.objects.all(), request=request)
     positions = models.Position.objects.all()
 
     data = {
@@ -31,4 +60,13 @@ class ItemMetadataListView(APIView):
       "positions": serializers.PositionSerializer(positions, many=True).data
     }
 
-    return Response(data)
\ No newline at end of file
+    return Response(data)
+
+#絞り込み条件ごとのブランド・シリーズ・ポジションの件数
+class ItemFacetView(APIView):
+  permission_classes = (AllowAny,)
+  authentication_classes = ()
+
+  @catalog_cached
+  def get(self, request):
+    return Response(facet_counts(get_item_filters(request)))
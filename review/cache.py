@@ -0,0 +1,13 @@
+from django.apps import apps
+from reviewsite.utils.versions import bump_version, get_version
+
+
+# いいね状態・いいね数のバージョン（いいねの登録、解除、カウンタの反映のたびに変わる）
+# いいねの登録・解除はレビューのupdated_atを変えないため、一覧のETagはこの値で変化を検知する
+# 他のワーカーや管理コマンドでの更新も伝わるようDBに置く（review.modelsから読み込まれるためモデルは実行時に取得する）
+def get_favorites_version():
+  return get_version(apps.get_model('review', 'FavoritesVersion'))
+
+
+def bump_favorites_version():
+  bump_version(apps.get_model('review', 'FavoritesVersion'))
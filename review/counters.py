@@ -0,0 +1,120 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from review.cache import bump_favorites_version
+
+logger = logging.getLogger(__name__)
+
+
+# いいね数の差分をまとめてReview.favorites_countに反映する（UPDATE ... CASE）
+# 途中で失敗した場合に反映済みのバッチだけが残らないよう、すべて1つのトランザクションで書き込む
+def apply_favorites_count_deltas(deltas, batch_size=500):
+  Review = apps.get_model('review', 'Review')
+  review_ids = [review_id for review_id, delta in deltas.items() if delta]
+  with transaction.atomic():
+    for start in range(0, len(review_ids), batch_size):
+      batch = review_ids[start:start + batch_size]
+      Review.objects.filter(pk__in=batch).update(favorites_count=F('favorites_count') + Case(
+        *[When(pk=review_id, then=Value(deltas[review_id])) for review_id in batch],
+        default=Value(0),
+        output_field=IntegerField(),
+      ))
+    record_favorite_buckets(deltas)
+
+
+# いいねの増減を当日のFavoriteBucketに加える（ランキングの集計用）
+# 存在しないレビューの差分は捨てる（バッファに溜まっている間に削除された場合）
+def record_favorite_buckets(deltas, day=None, using='default'):
+  FavoriteBucket = apps.get_model('review', 'FavoriteBucket')
+  Review = apps.get_model('review', 'Review')
+  conn = connections[using]
+  qn = conn.ops.quote_name
+  day = conn.ops.adapt_datefield_value(day or timezone.localdate())
+  review_column = qn(FavoriteBucket._meta.get_field('review').column)
+  day_column = qn(FavoriteBucket._meta.get_field('day').column)
+  count_column = qn(FavoriteBucket._meta.get_field('count').column)
+  sql = (
+    f'INSERT INTO {qn(FavoriteBucket._meta.db_table)} ({review_column}, {day_column}, {count_column}) '
+    f'SELECT {qn(Review._meta.pk.column)}, %s, %s FROM {qn(Review._meta.db_table)} '
+    f'WHERE {qn(Review._meta.pk.column)} = %s '
+    f'ON CONFLICT ({review_column}, {day_column}) '
+    f'DO UPDATE SET {count_column} = {qn(FavoriteBucket._meta.db_table)}.{count_column} + excluded.{count_column}'
+  )
+  params = [
+    [day, delta, Review._meta.pk.get_db_prep_value(review_id, conn)]
+    for review_id, delta in deltas.items() if delta
+  ]
+  if params:
+    with transaction.atomic(using=using), conn.cursor() as cursor:
+      cursor.executemany(sql, params)
+
+
+# いいね数の増減をプロセス内に溜め、一定間隔でまとめて書き込むバッファ
+# 人気レビューへのいいねが集中しても、Reviewの行ロックを奪い合わないようにする
+# バッファはワーカーごとにあり、差分（絶対値ではない）を書き込む。reconcile_favorites_countは全ワーカーのバッファが空の状態で実行する
+class FavoriteCounterBuffer:
+  def __init__(self, flush_interval):
+    self.flush_interval = flush_interval
+    self._deltas = defaultdict(int)
+    self._lock = threading.Lock()
+    self._timer = None
+
+  def add(self, review_id, delta):
+    with self._lock:
+      self._deltas[review_id] += delta
+      if self._timer is None:
+        self._timer = threading.Timer(self.flush_interval, self._flush_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+  # まだ書き込まれていない差分
+  def pending(self, review_id):
+    with self._lock:
+      return self._deltas.get(review_id, 0)
+
+  def flush(self):
+    with self._lock:
+      deltas, self._deltas = self._deltas, defaultdict(int)
+      if self._timer is not None:
+        self._timer.cancel()
+        self._timer = None
+
+    if not deltas:
+      return
+    try:
+      apply_favorites_count_deltas(deltas)
+    except Exception:
+      # 書き込めなかった差分（トランザクションごと取り消される）は次回のフラッシュに持ち越す
+      logger.exception('Failed to flush favorite counters.')
+      for review_id, delta in deltas.items():
+        self.add(review_id, delta)
+      return
+    bump_favorites_version()
+
+  def _flush_in_background(self):
+    try:
+      self.flush()
+    finally:
+      connection.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+# FAVORITE_COUNTER_BUFFERが有効な場合のみバッファを返す
+def get_favorite_counter_buffer():
+  global _buffer
+  if not getattr(settings, 'FAVORITE_COUNTER_BUFFER', False):
+    return None
+  with _buffer_lock:
+    if _buffer is None:
+      _buffer = FavoriteCounterBuffer(getattr(settings, 'FAVORITE_COUNTER_FLUSH_INTERVAL', 5))
+      atexit.register(_buffer.flush)
+  return _buffer
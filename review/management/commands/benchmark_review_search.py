@@ -0,0 +1,104 @@
+import datetime
+import random
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from item.models import Brand, Item, Position, Series
+from review.models import Review
+from review.search import index_reviews, search_reviews
+
+User = get_user_model()
+
+# 合成レビューの語彙
+WORDS = (
+  'ラケット', 'ガット', 'スピン', 'ボレー', '前衛', '後衛', '打球感', 'コントロール', '反発', '振り抜き',
+  'シャフト', 'フレーム', 'ストローク', 'カット', 'グリップ', 'スマッシュ', 'サーブ', 'レシーブ',
+  '初心者', '上級者', '中学生', '部活', '試合', '練習', 'ヨネックス', 'ミズノ', 'ゴーセン', 'YONEX',
+)
+ADJECTIVES = ('軽い', '重い', '柔らかい', '硬い', '扱いやすい', '安定している', '飛ぶ', 'よく止まる')
+QUERIES = ('ラケット', 'ボレー', '打球感', '前衛 軽い', 'yonex', '振り抜きが', '球', '存在しない語')
+
+
+# n-gram索引による検索と、タイトル・本文のicontainsによる検索の速度を比較する
+# 計測用データはトランザクション内で作成し、終了時にロールバックする
+class Command(BaseCommand):
+    help = 'レビュー検索（n-gram索引）の速度をicontainsによる検索と比較します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        page_size = options['page_size']
+        with transaction.atomic():
+            start = time.perf_counter()
+            reviews = self.seed(rng, options['reviews'])
+            seed_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for offset in range(0, len(reviews), 1000):
+                index_reviews(reviews[offset:offset + 1000])
+            index_time = time.perf_counter() - start
+
+            self.stdout.write(
+                f'reviews: {len(reviews)}, seed: {seed_time:.1f} s, '
+                f'index: {index_time:.1f} s ({index_time * 1_000_000 / len(reviews):.0f} us/review)'
+            )
+            self.stdout.write(f'{"query":<14}{"hits":>8}{"index ms":>10}{"icontains ms":>14}')
+            for query in QUERIES:
+                def search():
+                    return list(search_reviews(query).order_by('-score', '-review_id')[:page_size])
+
+                def scan():
+                    condition = Q()
+                    for word in query.split():
+                        condition &= Q(title__icontains=word) | Q(content__icontains=word)
+                    return list(Review.objects.filter(condition).order_by('-created_at', '-id')[:page_size])
+
+                hits = search_reviews(query).count()
+                index_ms = self.measure(search, options['repeat']) * 1000
+                scan_ms = self.measure(scan, options['repeat']) * 1000
+                self.stdout.write(f'{query:<14}{hits:>8}{index_ms:>10.1f}{scan_ms:>14.1f}')
+            transaction.set_rollback(True)
+
+    def measure(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def sentence(self, rng):
+        return f'{rng.choice(WORDS)}は{rng.choice(ADJECTIVES)}です。{rng.choice(WORDS)}が{rng.choice(ADJECTIVES)}。'
+
+    def seed(self, rng, review_count):
+        key = uuid.uuid4().hex[:8]
+        brand = Brand.objects.create(name=f'Bench {key}')
+        item = Item.objects.create(
+            item_name=f'Bench Item {key}',
+            brand=brand,
+            series=Series.objects.create(name=f'Bench Series {key}', brand=brand),
+            position=Position.objects.create(name=f'Bench Position {key}'),
+            release_date=datetime.date.today(),
+            display=True
+        )
+        users = User.objects.bulk_create([
+            User(email=f'bench-{key}-{i}@example.com', name=f'Bench User {i}') for i in range(100)
+        ])
+        return Review.objects.bulk_create([
+            Review(
+                user=users[i % len(users)],
+                item=item,
+                title=f'{rng.choice(WORDS)}の{rng.choice(ADJECTIVES)}{rng.choice(WORDS)}',
+                content=''.join(self.sentence(rng) for _ in range(rng.randint(2, 6))),
+            )
+            for i in range(review_count)
+        ], batch_size=1000)
@@ -0,0 +1,100 @@
+import datetime
+import time
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from item.models import Brand, Item, Position, Series
+from review.models import Review
+from review.serializers import ReviewCardSerializer, ReviewSerializer
+
+User = get_user_model()
+
+
+# ReviewSerializerとReviewCardSerializerの一覧シリアライズ時間を比較する
+# 計測用データはトランザクション内で作成し、終了時にロールバックする
+class Command(BaseCommand):
+    help = 'レビュー一覧のシリアライズ速度をReviewSerializerとReviewCardSerializerで比較します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--host', default='softtennis-ace-review.com')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            item, viewer = self.seed(options['reviews'], options['users'])
+            request = Request(APIRequestFactory().get('/', HTTP_HOST=options['host']))
+            request.user = viewer
+            context = {'request': request}
+            queryset = Review.objects.filter(item=item).order_by('-created_at', '-id')
+            renderer = JSONRenderer()
+
+            def render_default():
+                reviews = ReviewSerializer.setup_eager_loading(queryset, request=request)
+                return renderer.render(ReviewSerializer(reviews, many=True, context=context).data)
+
+            def render_fast():
+                reviews = ReviewCardSerializer.project(ReviewSerializer.setup_eager_loading(queryset, request=request))
+                return renderer.render(ReviewCardSerializer(reviews, context=context).data)
+
+            default_time, default_body = self.measure(render_default, options['repeat'])
+            fast_time, fast_body = self.measure(render_fast, options['repeat'])
+            transaction.set_rollback(True)
+
+        if default_body != fast_body:
+            raise CommandError('ReviewCardSerializerの出力がReviewSerializerと一致しません。')
+
+        self.stdout.write(f'reviews: {options["reviews"]}, response: {len(default_body)} bytes (identical)')
+        self.stdout.write(f'ReviewSerializer:     {default_time * 1000:.1f} ms')
+        self.stdout.write(f'ReviewCardSerializer: {fast_time * 1000:.1f} ms')
+        self.stdout.write(f'speedup: {default_time / fast_time:.1f}x')
+
+    # repeat回実行して最速の時間と出力を返す
+    def measure(self, func, repeat):
+        best, body = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
+
+    def seed(self, review_count, user_count):
+        key = uuid.uuid4().hex[:8]
+        brand = Brand.objects.create(name=f'Bench {key}')
+        series = Series.objects.create(name=f'Bench Series {key}', brand=brand)
+        position = Position.objects.create(name=f'Bench Position {key}')
+        item = Item.objects.create(
+            item_name=f'Bench Item {key}',
+            brand=brand,
+            series=series,
+            position=position,
+            release_date=datetime.date.today(),
+            display=True
+        )
+        users = User.objects.bulk_create([
+            User(email=f'bench-{key}-{i}@example.com', name=f'Bench User {i}')
+            for i in range(max(user_count, 1))
+        ])
+        reviews = Review.objects.bulk_create([
+            Review(
+                user=users[i % len(users)],
+                item=item,
+                title=f'Bench Review {i}',
+                content='ベンチマーク用のレビュー本文です。' * 10,
+            )
+            for i in range(review_count)
+        ])
+        # 各ユーザーが数件ずつお気に入り登録
+        through = User.favorite_reviews.through
+        through.objects.bulk_create([
+            through(customuser_id=user.pk, review_id=reviews[(i * 7 + j) % len(reviews)].pk)
+            for i, user in enumerate(users)
+            for j in range(min(5, len(reviews)))
+        ], ignore_conflicts=True)
+        return item, users[0]
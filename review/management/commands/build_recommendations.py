@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from review.recommendations import RECOMMENDATION_SOURCES, build_recommendations
+
+
+# いいね（レビュー）・レビュー（アイテム）の共起から推薦を作り直す
+# 対象を--chunk-size件ずつ処理するため、いいねが数百万件あってもメモリの使用量はchunkの大きさで決まる
+# cron等で定期的（例: 1日1回）に実行する
+class Command(BaseCommand):
+    help = '共起（同じユーザーのいいね・レビュー）からレビューとアイテムの推薦を作り直します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(RECOMMENDATION_SOURCES), action='append',
+                            help='作り直す推薦の種類（省略時はすべて）')
+        parser.add_argument('--top-k', type=int)
+        parser.add_argument('--chunk-size', type=int)
+        parser.add_argument('--max-user-actions', type=int)
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or RECOMMENDATION_SOURCES:
+            start = time.perf_counter()
+            targets, rows = build_recommendations(
+                kind,
+                top_k=options['top_k'],
+                chunk_size=options['chunk_size'],
+                max_user_actions=options['max_user_actions'],
+            )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{kind}: {targets}件の対象に{rows}件の推薦を保存しました（{elapsed:.1f}秒）。')
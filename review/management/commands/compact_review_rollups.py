@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from review.counters import get_favorite_counter_buffer
+from review.rollups import compact_rollups, reconcile_item_review_counts
+
+
+# いいねの集計（FavoriteBucket）の古い行を削除し、期間ごとのランキングを作り直す
+# cron等で定期的（例: 10分ごと）に実行する
+class Command(BaseCommand):
+    help = 'いいねの集計を整理し、ランキングを作り直します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconcile-item-counts', action='store_true',
+            help='Reviewを数え直してアイテムごとのレビュー数のずれも修正します（全件を集計します）。',
+        )
+
+    def handle(self, *args, **options):
+        counter_buffer = get_favorite_counter_buffer()
+        if counter_buffer is not None:
+            counter_buffer.flush()
+
+        pruned = compact_rollups()
+        self.stdout.write(f'{pruned}件の集計行を削除し、ランキングを作り直しました。')
+        if options['reconcile_item_counts']:
+            self.stdout.write(f'{reconcile_item_review_counts()}件のアイテムのレビュー数を修正しました。')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from review.models import Review
+from review.search import index_reviews
+
+
+# レビュー検索の索引を作り直す（正規化の方法を変えた場合に実行する。導入時の既存レビューはマイグレーションで登録される）
+# 以降の投稿・編集・削除では索引は自動で更新される
+class Command(BaseCommand):
+    help = 'レビュー検索のn-gram索引を作り直します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        reviews = Review.objects.only('id', 'title', 'content').order_by('created_at', 'id')
+        count = 0
+        batch = []
+        for review in reviews.iterator(chunk_size=batch_size):
+            batch.append(review)
+            if len(batch) >= batch_size:
+                index_reviews(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            index_reviews(batch)
+            count += len(batch)
+        self.stdout.write(f'{count}件のレビューの索引を作成しました。')
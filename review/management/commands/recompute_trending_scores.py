@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from review import trending
+
+
+# 集計期間内のいいねからReview.trending_scoreを作り直す
+# cron等で定期的（例: 15分ごと）に実行する
+class Command(BaseCommand):
+    help = 'いいねの日時からレビューのトレンドスコアを再計算します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        updated = trending.recompute_trending_scores(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{updated}件のトレンドスコアを更新しました（{elapsed:.2f}秒）。')
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F
+from review.cache import bump_favorites_version
+from review.counters import get_favorite_counter_buffer
+from review.models import Review
+
+
+# Favoriteの件数を正として、Review.favorites_countのずれを修正する
+# FAVORITE_COUNTER_BUFFERが有効な場合、各ワーカーのバッファに残っている差分は修正後の値に上乗せされ、数えすぎになる
+# このコマンドが空にできるのは自分のプロセスのバッファだけなので、バッファを無効にするか、
+# ワーカーを停止して（終了時にフラッシュされる）バッファを空にしてから --buffer-drained を付けて実行する
+class Command(BaseCommand):
+    help = 'Favoriteの件数とReview.favorites_countのずれを修正します。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='修正せずにずれている件数だけ表示します。')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--buffer-drained', action='store_true',
+            help='FAVORITE_COUNTER_BUFFERが有効な場合に、全ワーカーのバッファが空であることを確認済みとして実行します。'
+        )
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'FAVORITE_COUNTER_BUFFER', False) and not (options['dry_run'] or options['buffer_drained']):
+            raise CommandError(
+                'FAVORITE_COUNTER_BUFFERが有効です。各ワーカーのバッファを空にしてから --buffer-drained を付けて実行してください。'
+            )
+
+        counter_buffer = get_favorite_counter_buffer()
+        if counter_buffer is not None:
+            counter_buffer.flush()
+
+        # 集計クエリ1回でずれているレビューだけを取得
+        drifted = [
+            Review(id=review_id, favorites_count=actual_count)
+            for review_id, actual_count in Review.objects
+                .annotate(actual_count=Count('favorite'))
+                .exclude(favorites_count=F('actual_count'))
+                .values_list('id', 'actual_count')
+        ]
+
+        if not options['dry_run']:
+            Review.objects.bulk_update(drifted, ['favorites_count'], batch_size=options['batch_size'])
+            if drifted:
+                bump_favorites_version()
+        self.stdout.write(f'{len(drifted)}件のいいね数を{"検出" if options["dry_run"] else "修正"}しました。')
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review', '0010_review_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='image_status',
+            field=models.CharField(choices=[('ready', '処理済み'), ('pending', '処理待ち'), ('failed', '処理失敗')], default='ready', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review', '0011_review_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+from review.search import gram_weights
+
+
+# 既存のレビューの検索索引を作る（以降の投稿・編集・削除では自動で更新される）
+def populate_review_search_grams(apps, schema_editor):
+    Review = apps.get_model('review', 'Review')
+    ReviewSearchGram = apps.get_model('review', 'ReviewSearchGram')
+    grams = []
+    for review in Review.objects.only('id', 'title', 'content').order_by('created_at', 'id').iterator(chunk_size=500):
+        grams.extend(
+            ReviewSearchGram(review_id=review.pk, gram=gram, weight=weight)
+            for gram, weight in gram_weights(review.title, review.content).items()
+        )
+        if len(grams) >= 1000:
+            ReviewSearchGram.objects.bulk_create(grams, batch_size=1000)
+            grams = []
+    ReviewSearchGram.objects.bulk_create(grams, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review', '0012_review_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewSearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=2)),
+                ('weight', models.PositiveIntegerField()),
+                ('review', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_grams', to='review.review')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['gram', 'review', 'weight'], name='review_searchgram_covering')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reviewsearchgram',
+            constraint=models.UniqueConstraint(fields=('gram', 'review'), name='review_searchgram_gram_review_uniq'),
+        ),
+        migrations.RunPython(populate_review_search_grams, migrations.RunPython.noop),
+    ]
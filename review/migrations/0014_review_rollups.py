@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# 既存のレビューからアイテムごとのレビュー数を作る
+def populate_item_review_counts(apps, schema_editor):
+    Review = apps.get_model('review', 'Review')
+    ItemReviewCount = apps.get_model('review', 'ItemReviewCount')
+    counts = Review.objects.order_by().values_list('item').annotate(count=models.Count('id'))
+    ItemReviewCount.objects.bulk_create(
+        [ItemReviewCount(item_id=item_id, review_count=count) for item_id, count in counts],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0005_item_facet_indexes'),
+        ('review', '0013_reviewsearchgram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewLeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=10)),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.IntegerField()),
+                ('review', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='review.review')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemReviewCount',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_rollup', serialize=False, to='item.item')),
+                ('review_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-review_count', 'item'], name='review_itemcount_rank_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FavoriteBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('review', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite_buckets', to='review.review')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='reviewleaderboardentry',
+            constraint=models.UniqueConstraint(fields=('period', 'rank'), name='review_leaderboard_period_rank_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='favoritebucket',
+            index=models.Index(fields=['day', 'review', 'count'], name='review_favoritebucket_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoritebucket',
+            constraint=models.UniqueConstraint(fields=('review', 'day'), name='review_favoritebucket_review_day_uniq'),
+        ),
+        migrations.RunPython(populate_item_review_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:19
+
+import datetime
+from django.db import migrations, models
+
+# 既存のいいねの日時は不明のため、トレンドの集計期間に入らないエポックにする
+# （マイグレーションの実行時刻にすると、既存のいいねが全て直近のいいねとして数えられる）
+UNKNOWN_FAVORITE_TIME = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review', '0014_review_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=UNKNOWN_FAVORITE_TIME),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['item', '-trending_score', '-id'], name='review_item_trending_id_idx'),
+        ),
+    ]
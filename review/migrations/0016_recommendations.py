@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0005_item_facet_indexes'),
+        ('review', '0015_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_for', to='review.review')),
+                ('review', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='review.review')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='item.item')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_for', to='item.item')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='reviewrecommendation',
+            constraint=models.UniqueConstraint(fields=('review', 'rank'), name='review_recommendation_review_rank_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='itemrecommendation',
+            constraint=models.UniqueConstraint(fields=('item', 'rank'), name='review_itemrecommendation_item_rank_uniq'),
+        ),
+    ]
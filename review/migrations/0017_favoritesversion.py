@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+def create_favorites_version(apps, schema_editor):
+    FavoritesVersion = apps.get_model('review', 'FavoritesVersion')
+    FavoritesVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review', '0016_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FavoritesVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_favorites_version, migrations.RunPython.noop),
+    ]
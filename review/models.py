@@ -1,24 +1,162 @@
-from django.db import models
+from django.db import models, connections, transaction
 from django.conf import settings
+from django.utils import timezone
 from item.models import Item
+from images.models import ImageStatus
+from review.cache import bump_favorites_version
+from review.counters import get_favorite_counter_buffer, record_favorite_buckets
 import uuid
 
 
+class ReviewQuerySet(models.QuerySet):
+    # ログインユーザーがお気に入り登録しているかをis_favoriteとして付与する
+    def with_favorite_state(self, user):
+        if user is None or not user.is_authenticated:
+            return self.annotate(is_favorite=models.Value(False, output_field=models.BooleanField()))
+        return self.annotate(is_favorite=models.Exists(
+            Favorite.objects.filter(user=user, review=models.OuterRef('pk'))
+        ))
+
+    # 一覧のETag用に、件数と最終更新日時（レビュー、投稿ユーザー）を1回の集計で求める
+    def fingerprint(self):
+        result = self.aggregate(
+            count=models.Count('id'),
+            last_updated=models.Max('updated_at'),
+            last_user_updated=models.Max('user__updated_at'),
+        )
+        return result['count'], result['last_updated'], result['last_user_updated']
+
 class Review(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4,editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     item = models.ForeignKey(Item,on_delete=models.CASCADE,db_index=True)
     title = models.CharField("タイトル", max_length=200)
     image = models.ImageField(upload_to='reviews/', verbose_name='画像',null=True,blank=True)
+    image_status = models.CharField(max_length=10, choices=ImageStatus.choices, default=ImageStatus.READY)
+    # 画像のレンディション {形式: {サイズ: ファイル名}}
+    image_renditions = models.JSONField(default=dict, blank=True)
     content = models.TextField("本文")
     favorites_count = models.IntegerField(default=0)
+    # 時間で減衰させたいいねの合計（recompute_trending_scoresで定期的に再計算する）
+    trending_score = models.FloatField(default=0)
     is_edited = models.BooleanField(default=False)
     updated_at = models.DateTimeField("更新日", auto_now=True)
     created_at = models.DateTimeField("作成日", auto_now_add=True)
+    objects = ReviewQuerySet.as_manager()
+
+    class Meta:
+        # 一覧のキーセットページネーション（created_at, id）用の複合インデックス
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_id_idx'),
+            models.Index(fields=['item', '-created_at', '-id'], name='review_item_created_id_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='review_user_created_id_idx'),
+            # アイテムごとのトレンド順（trending_score, id）
+            models.Index(fields=['item', '-trending_score', '-id'], name='review_item_trending_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.item.item_name} - {self.title}"
 
+# レビュー検索用のn-gram索引（review.searchで作成・更新する）
+# 正規化したタイトルと本文の文字bigramごとに1行、weightはタイトルの出現回数×REVIEW_SEARCH_TITLE_WEIGHT + 本文の出現回数
+class ReviewSearchGram(models.Model):
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='search_grams')
+    gram = models.CharField(max_length=2)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['gram', 'review'], name='review_searchgram_gram_review_uniq'),
+        ]
+        indexes = [
+            # 検索時にテーブルを読まずに索引だけで集計できるよう、重みも含める
+            models.Index(fields=['gram', 'review', 'weight'], name='review_searchgram_covering'),
+        ]
+
+    def __str__(self):
+        return f"{self.gram} - {self.review_id}"
+
+# アイテムごとのレビュー数（review.signalsでレビューの投稿・削除のたびに増減する）
+class ItemReviewCount(models.Model):
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='review_rollup')
+    review_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # レビュー数の多い順のランキング用
+            models.Index(fields=['-review_count', 'item'], name='review_itemcount_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} - {self.review_count}"
+
+# レビューごと・日ごとのいいねの増減（いいねの登録・解除のたびに当日の行を増減する）
+# 集計期間を過ぎた行はcompact_review_rollupsで削除する
+class FavoriteBucket(models.Model):
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='favorite_buckets')
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['review', 'day'], name='review_favoritebucket_review_day_uniq'),
+        ]
+        indexes = [
+            # 期間内の行だけをテーブルを読まずに集計する
+            models.Index(fields=['day', 'review', 'count'], name='review_favoritebucket_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.review_id} - {self.day}: {self.count}"
+
+# 期間ごとのいいね数ランキング（compact_review_rollupsで作り直す）
+class ReviewLeaderboardEntry(models.Model):
+    period = models.CharField(max_length=10)
+    rank = models.PositiveIntegerField()
+    review = models.ForeignKey(Review, on_delete=models.CASCADE)
+    score = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'rank'], name='review_leaderboard_period_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} #{self.rank} - {self.review_id}"
+
+# 「このレビューをいいねした人はこんなレビューもいいねしています」の上位K件
+# build_recommendationsでFavoriteの共起から作り直す
+class ReviewRecommendation(models.Model):
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='recommended_for')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # レビューごとの推薦を順位順に引く索引を兼ねる
+            models.UniqueConstraint(fields=['review', 'rank'], name='review_recommendation_review_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.review_id} #{self.rank} - {self.recommended_id}"
+
+# 「このアイテムをレビューした人はこんなアイテムもレビューしています」の上位K件
+# build_recommendationsでReviewの共起から作り直す
+class ItemRecommendation(models.Model):
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='recommended_for')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'rank'], name='review_itemrecommendation_item_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} #{self.rank} - {self.recommended_id}"
+
 class UserReview(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     review = models.ForeignKey(Review, on_delete=models.CASCADE)
@@ -29,11 +167,91 @@ class UserReview(models.Model):
     def __str__(self):
         return f"{self.review.item.item_name} - Review by {self.user.email}"
 
+class FavoriteManager(models.Manager):
+    # お気に入り登録（登録済みなら何もしない）し、(登録したか, 更新後のいいね数)を返す
+    # レビューが存在しない場合のいいね数はNone
+    def add(self, user, review_id):
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        review_id = Review._meta.pk.to_python(review_id)
+        review_pk = Review._meta.pk.get_db_prep_value(review_id, connection)
+        user_pk = user._meta.pk.get_db_prep_value(user.pk, connection)
+        created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        user_column = qn(self.model._meta.get_field('user').column)
+        review_column = qn(self.model._meta.get_field('review').column)
+        created_at_column = qn(self.model._meta.get_field('created_at').column)
+
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {qn(self.model._meta.db_table)} ({user_column}, {review_column}, {created_at_column}) '
+                f'SELECT %s, {qn(Review._meta.pk.column)}, %s FROM {qn(Review._meta.db_table)} '
+                f'WHERE {qn(Review._meta.pk.column)} = %s '
+                f'ON CONFLICT ({user_column}, {review_column}) DO NOTHING '
+                f'RETURNING {qn(self.model._meta.pk.column)}',
+                [user_pk, created_at, review_pk]
+            )
+            created = cursor.fetchone() is not None
+            favorites_count = self._shift_favorites_count(cursor, review_id, 1 if created else 0)
+            if created:
+                transaction.on_commit(bump_favorites_version, using=self.db)
+        return created, favorites_count
+
+    # お気に入り解除（未登録なら何もしない）し、(解除したか, 更新後のいいね数)を返す
+    def remove(self, user, review_id):
+        review_id = Review._meta.pk.to_python(review_id)
+
+        with transaction.atomic(using=self.db):
+            deleted, _ = self.filter(user=user, review_id=review_id).delete()
+            with connections[self.db].cursor() as cursor:
+                favorites_count = self._shift_favorites_count(cursor, review_id, -deleted)
+            if deleted:
+                transaction.on_commit(bump_favorites_version, using=self.db)
+        return bool(deleted), favorites_count
+
+    # favorites_countだけを差分で更新し、更新後の値を返す
+    # カウンタバッファが有効な場合は行を更新せず、コミット後にバッファへ差分を積む
+    def _shift_favorites_count(self, cursor, review_id, delta):
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        review_pk = Review._meta.pk.get_db_prep_value(review_id, connection)
+        count_column = qn(Review._meta.get_field('favorites_count').column)
+        counter_buffer = get_favorite_counter_buffer()
+
+        if counter_buffer is None:
+            cursor.execute(
+                f'UPDATE {qn(Review._meta.db_table)} SET {count_column} = {count_column} + %s '
+                f'WHERE {qn(Review._meta.pk.column)} = %s RETURNING {count_column}',
+                [delta, review_pk]
+            )
+            row = cursor.fetchone()
+            if row and delta:
+                record_favorite_buckets({review_id: delta}, using=self.db)
+            return row[0] if row else None
+
+        cursor.execute(
+            f'SELECT {count_column} FROM {qn(Review._meta.db_table)} '
+            f'WHERE {qn(Review._meta.pk.column)} = %s',
+            [review_pk]
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        favorites_count = row[0] + counter_buffer.pending(review_id) + delta
+        if delta:
+            transaction.on_commit(lambda: counter_buffer.add(review_id, delta), using=self.db)
+        return favorites_count
+
 class Favorite(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     review = models.ForeignKey(Review, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    objects = FavoriteManager()
 
     class Meta:
         unique_together = ('user','review')
 
+# 一覧のETag用のいいねのバージョン（review.cache）
+class FavoritesVersion(models.Model):
+    version = models.BigIntegerField(default=0)
+
 
@@ -0,0 +1,125 @@
+import heapq
+import math
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count
+from review.models import Favorite, ItemRecommendation, Review, ReviewRecommendation
+
+
+# 推薦の種類ごとの (共起を数えるモデル, 対象のフィールド, 保存先のモデル)
+# 共起を数えるモデルはユーザー（user）×対象の行を持つ。保存先は対象と同じ名前のフィールドを持つ
+RECOMMENDATION_SOURCES = {
+  'reviews': (Favorite, 'review', ReviewRecommendation),
+  'items': (Review, 'item', ItemRecommendation),
+}
+
+
+# 対象の数が多すぎるユーザー（まとめていいねするユーザーなど）は共起の組み合わせが二乗で増えるため数えない
+def heavy_users(model, max_user_actions):
+  return list(
+    model.objects.order_by().values('user')
+      .annotate(count=Count('id')).filter(count__gt=max_user_actions).values_list('user', flat=True)
+  )
+
+
+# 対象（entity）をID順にchunk_size件ずつ返す（キーセットで読むため、件数によらずメモリは一定）
+def iter_entity_chunks(model, entity_field, chunk_size):
+  column = f'{entity_field}_id'
+  entities = model.objects.order_by(column).values_list(column, flat=True).distinct()
+  last = None
+  while True:
+    chunk = list((entities.filter(**{f'{column}__gt': last}) if last is not None else entities)[:chunk_size])
+    if not chunk:
+      return
+    yield chunk
+    last = chunk[-1]
+
+
+# chunk内の対象ごとに、同じユーザーが関わった他の対象と、そのユーザー数を返す {target: [(other, count), ...]}
+# 集計はDBの自己結合とGROUP BYで行い、Pythonにはchunk分の結果だけを読み込む
+def cooccurrences(model, entity_field, chunk, excluded_users, using='default'):
+  connection = connections[using]
+  qn = connection.ops.quote_name
+  entity_target = model._meta.get_field(entity_field).target_field
+  user_target = model._meta.get_field('user').target_field
+  table = qn(model._meta.db_table)
+  entity = qn(model._meta.get_field(entity_field).column)
+  user = qn(model._meta.get_field('user').column)
+
+  sql = (
+    f'SELECT a.{entity}, b.{entity}, COUNT(DISTINCT a.{user}) FROM {table} a '
+    f'INNER JOIN {table} b ON a.{user} = b.{user} AND a.{entity} <> b.{entity} '
+    f'WHERE a.{entity} IN ({", ".join(["%s"] * len(chunk))})'
+  )
+  params = [entity_target.get_db_prep_value(value, connection) for value in chunk]
+  if excluded_users:
+    sql += f' AND a.{user} NOT IN ({", ".join(["%s"] * len(excluded_users))})'
+    params += [user_target.get_db_prep_value(value, connection) for value in excluded_users]
+  sql += f' GROUP BY a.{entity}, b.{entity}'
+
+  to_python = entity_target.to_python
+  pairs = {}
+  with connection.cursor() as cursor:
+    cursor.execute(sql, params)
+    for target, other, count in cursor.fetchall():
+      pairs.setdefault(to_python(target), []).append((to_python(other), count))
+  return pairs
+
+
+# 対象ごとのユーザー数（コサイン類似度の分母に使う）
+def user_counts(model, entity_field, entities, excluded_users, batch_size=500):
+  counts = {}
+  entities = list(entities)
+  for start in range(0, len(entities), batch_size):
+    counts.update(
+      model.objects.filter(**{f'{entity_field}__in': entities[start:start + batch_size]})
+        .exclude(user__in=excluded_users)
+        .order_by().values_list(entity_field)
+        .annotate(count=Count('user', distinct=True))
+    )
+  return counts
+
+
+# 共起の多い順ではなく、コサイン類似度 共起数 / sqrt(ユーザー数A * ユーザー数B) の上位K件を選ぶ
+# （人気の対象ばかりが推薦されないように）
+def top_k_similar(pairs, counts, top_k, min_cooccurrence):
+  results = {}
+  for target, others in pairs.items():
+    scored = (
+      (count / math.sqrt(counts[target] * counts[other]), count, str(other), other)
+      for other, count in others if count >= min_cooccurrence
+    )
+    results[target] = [(other, score) for score, _, _, other in heapq.nlargest(top_k, scored)]
+  return results
+
+
+# 共起から推薦を作り直し、(対象数, 保存した行数)を返す
+# 対象をchunk_size件ずつ処理し、chunkごとに推薦を置き換える
+def build_recommendations(kind, top_k=None, chunk_size=None, max_user_actions=None, min_cooccurrence=None):
+  model, entity_field, recommendation_model = RECOMMENDATION_SOURCES[kind]
+  top_k = top_k or settings.RECOMMENDATION_TOP_K
+  chunk_size = chunk_size or settings.RECOMMENDATION_CHUNK_SIZE
+  max_user_actions = max_user_actions or settings.RECOMMENDATION_MAX_USER_ACTIONS
+  min_cooccurrence = min_cooccurrence or settings.RECOMMENDATION_MIN_COOCCURRENCE
+  excluded_users = heavy_users(model, max_user_actions)
+  recommendations = recommendation_model.objects
+  target_count = row_count = 0
+
+  for chunk in iter_entity_chunks(model, entity_field, chunk_size):
+    pairs = cooccurrences(model, entity_field, chunk, excluded_users)
+    entities = pairs.keys() | {other for others in pairs.values() for other, _ in others}
+    similar = top_k_similar(pairs, user_counts(model, entity_field, entities, excluded_users), top_k, min_cooccurrence)
+    rows = [
+      recommendation_model(**{f'{entity_field}_id': target}, recommended_id=other, rank=rank, score=score)
+      for target, others in similar.items()
+      for rank, (other, score) in enumerate(others, start=1)
+    ]
+    with transaction.atomic():
+      recommendations.filter(**{f'{entity_field}__in': chunk}).delete()
+      recommendations.bulk_create(rows, batch_size=1000)
+    target_count += len(chunk)
+    row_count += len(rows)
+
+  # いいね・レビューがなくなった対象の推薦を消す
+  recommendations.exclude(**{f'{entity_field}__in': model.objects.values(entity_field)}).delete()
+  return target_count, row_count
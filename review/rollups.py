@@ -0,0 +1,91 @@
+import datetime
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+from review.models import FavoriteBucket, ItemReviewCount, Review, ReviewLeaderboardEntry
+
+
+# アイテムのレビュー数を増やす（行がなければ作る）
+def increment_item_review_count(item_id, using='default'):
+  connection = connections[using]
+  qn = connection.ops.quote_name
+  table = qn(ItemReviewCount._meta.db_table)
+  item_column = qn(ItemReviewCount._meta.get_field('item').column)
+  count_column = qn(ItemReviewCount._meta.get_field('review_count').column)
+  with connection.cursor() as cursor:
+    cursor.execute(
+      f'INSERT INTO {table} ({item_column}, {count_column}) VALUES (%s, 1) '
+      f'ON CONFLICT ({item_column}) DO UPDATE SET {count_column} = {table}.{count_column} + 1',
+      [item_id]
+    )
+
+
+# アイテムのレビュー数を減らす
+# アイテムごと削除される場合は集計行が先に消えていることがあるため、行は作らない
+def decrement_item_review_count(item_id, using='default'):
+  ItemReviewCount.objects.using(using).filter(item_id=item_id).update(review_count=F('review_count') - 1)
+
+
+# ユーザーのレビューの分だけ、アイテムごとのレビュー数をまとめて減らす（退会時、1回のUPDATE）
+def decrement_user_review_counts(user, using='default'):
+  reviews = Review.objects.using(using).filter(user=user).order_by()
+  ItemReviewCount.objects.using(using).filter(item__in=reviews.values('item')).update(
+    review_count=F('review_count') - Subquery(
+      reviews.filter(item=OuterRef('item')).values('item').annotate(count=Count('id')).values('count')
+    )
+  )
+
+
+# Reviewの件数を正として、アイテムごとのレビュー数のずれを直し、直した件数を返す
+def reconcile_item_review_counts(batch_size=500):
+  actual = dict(Review.objects.order_by().values_list('item').annotate(count=Count('id')))
+  current = dict(ItemReviewCount.objects.values_list('item_id', 'review_count'))
+  drifted = [
+    ItemReviewCount(item_id=item_id, review_count=actual.get(item_id, 0))
+    for item_id in actual.keys() | current.keys()
+    if actual.get(item_id, 0) != current.get(item_id)
+  ]
+  with transaction.atomic():
+    ItemReviewCount.objects.bulk_update(
+      [row for row in drifted if row.item_id in current], ['review_count'], batch_size=batch_size
+    )
+    ItemReviewCount.objects.bulk_create(
+      [row for row in drifted if row.item_id not in current], batch_size=batch_size
+    )
+  return len(drifted)
+
+
+# 期間のいいね数の上位レビュー [(review_id, score), ...]
+def top_favorited_reviews(days, limit, today=None):
+  today = today or timezone.localdate()
+  since = today - datetime.timedelta(days=days - 1)
+  return list(
+    FavoriteBucket.objects.filter(day__gte=since, day__lte=today)
+      .values('review_id')
+      .annotate(score=Sum('count'))
+      .filter(score__gt=0)
+      .order_by('-score', 'review_id')
+      .values_list('review_id', 'score')[:limit]
+  )
+
+
+# いいねの集計を整理し、ランキングを作り直す
+# 最も長い集計期間より古い行と、登録と解除が打ち消し合って0になった行を削除する
+def compact_rollups(today=None):
+  today = today or timezone.localdate()
+  periods = settings.REVIEW_LEADERBOARD_PERIODS
+  oldest = today - datetime.timedelta(days=max(periods.values()) - 1)
+  pruned, _ = FavoriteBucket.objects.filter(Q(day__lt=oldest) | Q(count=0)).delete()
+
+  for period, days in periods.items():
+    entries = [
+      ReviewLeaderboardEntry(period=period, rank=rank, review_id=review_id, score=score)
+      for rank, (review_id, score) in enumerate(
+        top_favorited_reviews(days, settings.REVIEW_LEADERBOARD_SIZE, today), start=1
+      )
+    ]
+    with transaction.atomic():
+      ReviewLeaderboardEntry.objects.filter(period=period).delete()
+      ReviewLeaderboardEntry.objects.bulk_create(entries)
+  return pruned
@@ -0,0 +1,102 @@
+import re
+import unicodedata
+from collections import Counter
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+from review.models import Review, ReviewSearchGram
+
+# 空白・記号で区切られた語（日本語の文は1語になる）
+WORD_PATTERN = re.compile(r'\w+')
+
+
+# 検索用の正規化（全角英数字・半角カナをそろえ、大文字と小文字を区別しない）
+def normalize(text):
+  return unicodedata.normalize('NFKC', text or '').lower()
+
+
+# 文字unigramとbigramに分割する（unigramは1文字の語で検索する場合に使う）
+def ngrams(text):
+  for word in WORD_PATTERN.findall(normalize(text)):
+    yield from word
+    for i in range(len(word) - 1):
+      yield word[i:i + 2]
+
+
+# {n-gram: 重み}（タイトルの出現はREVIEW_SEARCH_TITLE_WEIGHT倍に数える）
+def gram_weights(title, content):
+  weights = Counter()
+  for gram in ngrams(title):
+    weights[gram] += settings.REVIEW_SEARCH_TITLE_WEIGHT
+  weights.update(ngrams(content))
+  return weights
+
+
+# レビュー1件の索引を更新する
+# 含まれなくなったn-gramを削除し、残りは重みを上書きする（内容によらずクエリ数は一定）
+def index_review(review):
+  weights = gram_weights(review.title, review.content)
+  with transaction.atomic():
+    ReviewSearchGram.objects.filter(review=review).exclude(gram__in=list(weights)).delete()
+    insert_grams([(review.pk, gram, weight) for gram, weight in weights.items()], upsert=True)
+
+
+# 複数のレビューの索引を作り直す（一括登録したレビューや既存データ用）
+def index_reviews(reviews):
+  reviews = list(reviews)
+  with transaction.atomic():
+    ReviewSearchGram.objects.filter(review__in=reviews).delete()
+    insert_grams([
+      (review.pk, gram, weight)
+      for review in reviews
+      for gram, weight in gram_weights(review.title, review.content).items()
+    ])
+
+
+# (review_id, gram, weight)の行を複数行のINSERTでまとめて登録する
+# 件数が多いため、モデルのインスタンスを作るbulk_createではなくSQLを直接組み立てる
+# upsert=Trueの場合、登録済みのn-gramは重みを上書きする
+def insert_grams(rows, upsert=False, batch_size=1000):
+  connection = connections[ReviewSearchGram.objects.db]
+  qn = connection.ops.quote_name
+  review_column = qn(ReviewSearchGram._meta.get_field('review').column)
+  review_pk = Review._meta.pk
+  sql = (
+    f'INSERT INTO {qn(ReviewSearchGram._meta.db_table)} ({review_column}, {qn("gram")}, {qn("weight")}) VALUES '
+  )
+  conflict = (
+    f' ON CONFLICT ({qn("gram")}, {review_column}) DO UPDATE SET {qn("weight")} = excluded.{qn("weight")}'
+    if upsert else ''
+  )
+  with connection.cursor() as cursor:
+    for start in range(0, len(rows), batch_size):
+      batch = rows[start:start + batch_size]
+      params = []
+      for review_id, gram, weight in batch:
+        params.extend((review_pk.get_db_prep_value(review_id, connection), gram, weight))
+      cursor.execute(sql + ', '.join(['(%s, %s, %s)'] * len(batch)) + conflict, params)
+
+
+# 検索語のn-gram（2文字以上の語はbigram、1文字の語はunigram）
+def query_grams(query):
+  grams = {}
+  for word in WORD_PATTERN.findall(normalize(query)):
+    if len(word) == 1:
+      grams[word] = None
+    for i in range(len(word) - 1):
+      grams[word[i:i + 2]] = None
+  return list(grams)
+
+
+# 検索語のすべてのn-gramを含むレビューを、{review_id, score}の行で返す
+# scoreは一致したn-gramの重みの合計（タイトルに含まれるほど、多く含まれるほど高い）
+def search_reviews(query):
+  grams = query_grams(query)
+  # (gram, review)は一意なので、一致した行数がn-gramの数と同じならすべてを含む
+  return (
+    ReviewSearchGram.objects
+      .filter(gram__in=grams)
+      .values('review_id')
+      .annotate(score=Sum('weight'), matched=Count('id'))
+      .filter(matched=len(grams))
+  )
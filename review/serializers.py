@@ -1,21 +1,173 @@
 from rest_framework import serializers
+from django.db.models import ImageField
+from django.contrib.auth import get_user_model
 from review import models
 from account.serializers import UserSerializer
+from item.models import Item
 from item.serializers import ItemSerializer
+from images.renditions import build_srcset, image_srcset
+from images.serializers import UploadImageField, UploadKeyField
 
 class ReviewSerializer(serializers.ModelSerializer):
   user = UserSerializer(read_only=True)
   item = ItemSerializer(read_only=True)
   favorites_count = serializers.IntegerField(read_only=True)
   is_my_review = serializers.SerializerMethodField()
+  is_favorite = serializers.SerializerMethodField()
+  image_srcset = serializers.SerializerMethodField()
+  # 直接アップロードした元画像のキー（imageの代わりに送る）
+  image_key = UploadKeyField()
+
+  # 画像フィールドはデコード前にサイズ・形式・画素数を確認する
+  serializer_field_mapping = {
+    **serializers.ModelSerializer.serializer_field_mapping,
+    ImageField: UploadImageField,
+  }
+
+  # ネストしたシリアライザが参照するリレーションを一覧取得時にまとめて読み込む
+  select_related_fields = (
+    'user',
+    'item__brand',
+    'item__series__brand',
+    'item__position',
+  )
+  prefetch_related_fields = (
+    'user__favorite_reviews',
+  )
 
   class Meta:
     model = models.Review
-    fields = '__all__'
+    # レンディションのファイル名はimage_srcsetとして返す。trending_scoreは並び替え用の内部の値
+    exclude = ('image_renditions', 'trending_score')
+    read_only_fields = ('image_status',)
+
+  @classmethod
+  def setup_eager_loading(cls, queryset, request=None):
+    queryset = queryset.select_related(*cls.select_related_fields).prefetch_related(*cls.prefetch_related_fields)
+    if request is not None:
+      queryset = queryset.with_favorite_state(request.user)
+    return queryset
 
   def get_is_my_review(self, obj):
     return self.context['request'].user == obj.user
 
+  # 一覧ではwith_favorite_stateで付与済みの値を使い、単体取得時のみ問い合わせる
+  def get_is_favorite(self, obj):
+    if hasattr(obj, 'is_favorite'):
+      return obj.is_favorite
+    user = self.context['request'].user
+    if not user.is_authenticated:
+      return False
+    return models.Favorite.objects.filter(user=user, review=obj).exists()
+
+  def get_image_srcset(self, obj):
+    return image_srcset(obj, 'image', self.context.get('request'))
+
+#一覧表示用の読み取り専用シリアライザ（ReviewSerializerと同じJSONを返す）
+#ModelSerializerのフィールド処理を通さず、values()の行から直接dictを組み立てる
+class ReviewCardSerializer:
+  value_fields = (
+    'id', 'favorites_count', 'title', 'image', 'image_status', 'image_renditions',
+    'content', 'is_edited', 'updated_at', 'created_at',
+    'user_id', 'user__name', 'user__email', 'user__image', 'user__image_status', 'user__image_renditions',
+    'item_id', 'item__item_name', 'item__item_photo', 'item__release_date', 'item__display',
+    'item__brand_id', 'item__brand__name',
+    'item__series_id', 'item__series__name', 'item__series__brand_id', 'item__series__brand__name',
+    'item__position_id', 'item__position__name',
+  )
+
+  def __init__(self, rows, context=None):
+    self.rows = rows
+    self.context = context or {}
+
+  # setup_eager_loading済みのクエリセットを、必要な列だけのvalues()に変換する
+  # extra_fieldsは出力しないが行に必要な列（ページネーションのキーなど）
+  @classmethod
+  def project(cls, queryset, extra_fields=()):
+    fields = cls.value_fields + tuple(field for field in extra_fields if field not in cls.value_fields)
+    if 'is_favorite' in queryset.query.annotations:
+      fields += ('is_favorite',)
+    return queryset.prefetch_related(None).values(*fields)
+
+  @property
+  def data(self):
+    rows = list(self.rows)
+    request = self.context.get('request')
+    user_pk = request.user.pk if request is not None else None
+    format_datetime = serializers.DateTimeField().to_representation
+    format_date = serializers.DateField().to_representation
+    review_image_url = self.media_url_builder(models.Review, 'image', request)
+    user_image_url = self.media_url_builder(get_user_model(), 'image', request)
+    item_photo_url = self.media_url_builder(Item, 'item_photo', request)
+    favorite_reviews = self.get_favorite_reviews({row['user_id'] for row in rows})
+
+    return [
+      {
+        'id': str(row['id']),
+        'user': {
+          'id': str(row['user_id']),
+          'name': row['user__name'],
+          'email': row['user__email'],
+          'image': user_image_url(row['user__image']),
+          'image_status': row['user__image_status'],
+          'image_srcset': build_srcset(row['user__image_renditions'], user_image_url),
+          'favorite_reviews': favorite_reviews.get(row['user_id'], []),
+        },
+        'item': {
+          'id': row['item_id'],
+          'brand': {'id': row['item__brand_id'], 'name': row['item__brand__name']},
+          'series': {
+            'id': row['item__series_id'],
+            'brand': {'id': row['item__series__brand_id'], 'name': row['item__series__brand__name']},
+            'name': row['item__series__name'],
+          },
+          'position': {'id': row['item__position_id'], 'name': row['item__position__name']},
+          'item_name': row['item__item_name'],
+          'item_photo': item_photo_url(row['item__item_photo']),
+          'release_date': format_date(row['item__release_date']),
+          'display': row['item__display'],
+        },
+        'favorites_count': row['favorites_count'],
+        'is_my_review': user_pk == row['user_id'],
+        'is_favorite': row.get('is_favorite', False),
+        'image_srcset': build_srcset(row['image_renditions'], review_image_url),
+        'title': row['title'],
+        'image': review_image_url(row['image']),
+        'image_status': row['image_status'],
+        'content': row['content'],
+        'is_edited': row['is_edited'],
+        'updated_at': format_datetime(row['updated_at']),
+        'created_at': format_datetime(row['created_at']),
+      }
+      for row in rows
+    ]
+
+  # ファイル名から絶対URLを作る関数（同じファイル名はストレージに再計算させない）
+  @staticmethod
+  def media_url_builder(model, field_name, request):
+    storage = model._meta.get_field(field_name).storage
+    urls = {}
+
+    def build(name):
+      if not name:
+        return None
+      if name not in urls:
+        url = storage.url(name)
+        urls[name] = request.build_absolute_uri(url) if request is not None else url
+      return urls[name]
+    return build
+
+  # 投稿ユーザーごとのお気に入りレビューIDを1回のクエリで取得する
+  @staticmethod
+  def get_favorite_reviews(user_ids):
+    field = get_user_model()._meta.get_field('favorite_reviews')
+    user_column, review_column = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+    favorite_reviews = {}
+    rows = field.remote_field.through.objects.filter(**{f'{user_column}__in': user_ids}).values_list(user_column, review_column)
+    for user_id, review_id in rows:
+      favorite_reviews.setdefault(user_id, []).append(review_id)
+    return favorite_reviews
+
 class FavoriteSerializer(serializers.ModelSerializer):
   class Meta:
     model = models.Favorite
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from item.models import Item
+from review.models import Review
+from review.rollups import decrement_item_review_count, decrement_user_review_counts, increment_item_review_count
+from review.search import index_review
+
+
+# タイトルか本文が保存されたら検索索引を更新する（削除時はCASCADEで索引も消える）
+@receiver(post_save, sender=Review)
+def update_search_index(sender, instance, update_fields=None, raw=False, **kwargs):
+  if raw:
+    return
+  if update_fields is not None and not {'title', 'content'} & set(update_fields):
+    return
+  index_review(instance)
+
+
+# アイテムごとのレビュー数を投稿・削除に合わせて増減する
+@receiver(post_save, sender=Review)
+def count_created_review(sender, instance, created=False, raw=False, using='default', **kwargs):
+  if created and not raw:
+    increment_item_review_count(instance.item_id, using=using)
+
+
+# ユーザー・アイテムごと削除される場合は1件ずつ減らさない
+# （ユーザーはpre_deleteでまとめて減らし、アイテムは集計行ごと削除される）
+@receiver(post_delete, sender=Review)
+def count_deleted_review(sender, instance, using='default', origin=None, **kwargs):
+  origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+  if issubclass(origin_model, (Item, get_user_model())):
+    return
+  decrement_item_review_count(instance.item_id, using=using)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def count_deleted_user_reviews(sender, instance, using='default', **kwargs):
+  decrement_user_review_counts(instance, using=using)
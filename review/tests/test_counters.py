@@ -0,0 +1,94 @@
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from review import counters
+from review.counters import get_favorite_counter_buffer
+from review.models import Review, Favorite, FavoriteBucket
+from review.tests.test_views import BaseReviewTest
+
+
+@override_settings(FAVORITE_COUNTER_BUFFER=True)
+class FavoriteCounterBufferTests(BaseReviewTest):
+  def setUp(self):
+    super().setUp()
+    self.client.force_authenticate(user=self.user)
+    self.counter_buffer = get_favorite_counter_buffer()
+    self.addCleanup(self.counter_buffer.flush)
+
+  # バッファ有効時はレビューの行を更新せず、フラッシュ時にまとめて反映する
+  def test_favorite_is_buffered_until_flush(self):
+    url = reverse('reviews:favorite-create', kwargs={'review_id': self.review1.id})
+    with self.captureOnCommitCallbacks(execute=True):
+      response = self.client.post(url, format='json')
+    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+    self.assertEqual(response.data['favorites_count'], 1)
+    self.review1.refresh_from_db()
+    self.assertEqual(self.review1.favorites_count, 0)
+
+    self.counter_buffer.flush()
+    self.review1.refresh_from_db()
+    self.assertEqual(self.review1.favorites_count, 1)
+
+  # 複数レビューの差分を1回のUPDATEで反映する（ランキング用のFavoriteBucketへの記録は別）
+  def test_flush_updates_reviews_in_one_statement(self):
+    self.counter_buffer.add(self.review1.id, 2)
+    self.counter_buffer.add(self.review2.id, 3)
+    with CaptureQueriesContext(connection) as context:
+      self.counter_buffer.flush()
+    review_updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE "review_review"')]
+    self.assertEqual(len(review_updates), 1)
+    self.review1.refresh_from_db()
+    self.review2.refresh_from_db()
+    self.assertEqual((self.review1.favorites_count, self.review2.favorites_count), (2, 3))
+
+  # 書き込みが途中で失敗した場合は何も反映せず、次のフラッシュで1回だけ反映する
+  def test_failed_flush_is_retried_once(self):
+    self.counter_buffer.add(self.review1.id, 2)
+    self.counter_buffer.add(self.review2.id, 3)
+    with mock.patch.object(counters, 'record_favorite_buckets', side_effect=RuntimeError), \
+        mock.patch.object(counters.logger, 'exception'):
+      self.counter_buffer.flush()
+    self.assertEqual(Review.objects.get(pk=self.review1.pk).favorites_count, 0)
+    self.assertEqual(self.counter_buffer.pending(self.review1.id), 2)
+
+    self.counter_buffer.flush()
+    self.review1.refresh_from_db()
+    self.review2.refresh_from_db()
+    self.assertEqual((self.review1.favorites_count, self.review2.favorites_count), (2, 3))
+    self.assertEqual(FavoriteBucket.objects.get(review=self.review1).count, 2)
+
+  # 他のワーカーのバッファが空か分からないため、確認済みの指定がなければ修正しない
+  def test_reconcile_requires_drained_buffers(self):
+    Review.objects.filter(pk=self.review2.pk).update(favorites_count=5)
+    with self.assertRaises(CommandError):
+      call_command('reconcile_favorites_count', stdout=StringIO())
+    self.assertEqual(Review.objects.get(pk=self.review2.pk).favorites_count, 5)
+
+    call_command('reconcile_favorites_count', '--buffer-drained', stdout=StringIO())
+    self.assertEqual(Review.objects.get(pk=self.review2.pk).favorites_count, 0)
+
+
+class ReconcileFavoritesCountCommandTests(BaseReviewTest):
+  # Favoriteの件数とずれているいいね数を修正する
+  def test_reconcile_favorites_count(self):
+    Favorite.objects.create(user=self.user, review=self.review1)
+    Review.objects.filter(pk=self.review2.pk).update(favorites_count=5)
+
+    out = StringIO()
+    call_command('reconcile_favorites_count', stdout=out)
+    self.review1.refresh_from_db()
+    self.review2.refresh_from_db()
+    self.assertEqual((self.review1.favorites_count, self.review2.favorites_count), (1, 0))
+    self.assertIn('2件', out.getvalue())
+
+  def test_reconcile_favorites_count_dry_run(self):
+    Review.objects.filter(pk=self.review2.pk).update(favorites_count=5)
+    call_command('reconcile_favorites_count', '--dry-run', stdout=StringIO())
+    self.review2.refresh_from_db()
+    self.assertEqual(self.review2.favorites_count, 5)
@@ -0,0 +1,155 @@
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from review.models import Review, Favorite, FavoriteBucket
+from review.recommendations import build_recommendations
+from review.rollups import compact_rollups
+from review.urls import urlpatterns
+from reviewsite.utils import testing
+
+User = get_user_model()
+
+
+# レビュー関連エンドポイントのクエリ数がデータ件数に依存しないことを確認
+class ReviewQueryBudgetTests(testing.QueryBudgetTestCase):
+  app_namespace = 'reviews'
+  urlpatterns = urlpatterns
+
+  def new_review(self, size):
+    other_user = User.objects.create_user(email=f'target{size}@example.com')
+    return Review.objects.create(user=other_user, item=self.item, title='Target', content='Content')
+
+  def test_my_reviews_list(self):
+    url = reverse('reviews:my-reviews-list-all')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_otherusers_review_list(self):
+    url = reverse('reviews:otherusers-review-list', kwargs={'item_id': self.item.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_review_list_filter(self):
+    url = reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_review_list_filter_with_cursor(self):
+    url = reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url, {'cursor': ''}))
+
+  def test_review_list_filter_trending(self):
+    url = reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url, {'sort': 'trending', 'cursor': ''}))
+
+  def test_review_search(self):
+    url = reverse('reviews:review-search')
+    self.assertQueryCountConstant(lambda: self.client.get(url, {'q': 'Content'}))
+
+  def test_review_leaderboard(self):
+    # 全レビューにいいねを集計してからランキングを作り直す
+    def prepare(size):
+      FavoriteBucket.objects.all().delete()
+      FavoriteBucket.objects.bulk_create([
+        FavoriteBucket(review=review, day=timezone.localdate(), count=1) for review in Review.objects.all()
+      ])
+      compact_rollups()
+      return ()
+
+    url = reverse('reviews:review-leaderboard')
+    self.assertQueryCountConstant(lambda: self.client.get(url), prepare=prepare)
+
+  def test_item_leaderboard(self):
+    url = reverse('reviews:item-leaderboard')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_review_recommendations(self):
+    # userがいいねした他ユーザーのレビュー同士が、件数分だけ推薦される
+    def prepare(size):
+      build_recommendations('reviews', top_k=20)
+      return (Review.objects.filter(title__startswith='Other').order_by('title').first(),)
+
+    def make_request(review):
+      return self.client.get(reverse('reviews:review-recommendations', kwargs={'review_id': review.id}))
+    self.assertQueryCountConstant(make_request, prepare=prepare)
+
+  def test_item_recommendations(self):
+    # userがレビューした基準アイテムに、userがレビューした他のアイテムが件数分だけ推薦される
+    def prepare(size):
+      build_recommendations('items', top_k=20)
+      return ()
+
+    url = reverse('reviews:item-recommendations', kwargs={'item_id': self.item.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url), prepare=prepare)
+
+  def test_create_review(self):
+    url = reverse('reviews:create-review', kwargs={'item_id': self.item.id})
+    data = {'title': 'New Review', 'content': 'Content'}
+    self.assertQueryCountConstant(lambda: self.client.post(url, data, format='multipart'))
+
+  def test_favorite_list(self):
+    url = reverse('reviews:get-favorite-list')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_get_favorite_review(self):
+    url = reverse('reviews:get-favorite-review', kwargs={'review_id': self.review.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_get_favorite_review_count(self):
+    url = reverse('reviews:get-favorite-review-count', kwargs={'review_id': self.review.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_get_favorite_state_list(self):
+    url = reverse('reviews:get-favorite-state-list')
+    self.assertQueryCountConstant(
+      lambda ids: self.client.get(url, {'ids': ids}),
+      lambda size: (','.join(str(pk) for pk in Review.objects.values_list('id', flat=True)[:50]),)
+    )
+
+  def test_favorite_viewset(self):
+    def prepare(size):
+      review = self.new_review(size)
+      Favorite.objects.create(user=self.user, review=review)
+      return (review,)
+    self.assertQueryCountConstant(
+      lambda review: self.client.delete(reverse('reviews:favorite-viewset', kwargs={'review_id': review.id})),
+      prepare
+    )
+
+  def test_favorite_create(self):
+    self.assertQueryCountConstant(
+      lambda review: self.client.post(reverse('reviews:favorite-create', kwargs={'review_id': review.id})),
+      lambda size: (self.new_review(size),)
+    )
+
+  def test_favorite_destroy(self):
+    def prepare(size):
+      review = self.new_review(size)
+      Favorite.objects.create(user=self.user, review=review)
+      return (review,)
+    self.assertQueryCountConstant(
+      lambda review: self.client.delete(reverse('reviews:favorite-destroy', kwargs={'review_id': review.id})),
+      prepare
+    )
+
+  def test_api_root(self):
+    url = reverse('reviews:api-root')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_review_list(self):
+    url = reverse('reviews:review-list')
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_review_detail(self):
+    url = reverse('reviews:review-detail', kwargs={'pk': self.review.id})
+    self.assertQueryCountConstant(lambda: self.client.get(url))
+
+  def test_review_detail_update(self):
+    url = reverse('reviews:review-detail', kwargs={'pk': self.review.id})
+    data = {'title': 'Updated Review'}
+    self.assertQueryCountConstant(lambda: self.client.patch(url, data, format='multipart'))
+
+  def test_review_detail_destroy(self):
+    def prepare(size):
+      return (Review.objects.create(user=self.user, item=self.item, title='Delete', content='Content'),)
+    self.assertQueryCountConstant(
+      lambda review: self.client.delete(reverse('reviews:review-detail', kwargs={'pk': review.id})),
+      prepare
+    )
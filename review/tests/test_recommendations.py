@@ -0,0 +1,108 @@
+import datetime
+import io
+import math
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from item.models import Item, Brand, Series, Position
+from review.models import Review, Favorite, ReviewRecommendation, ItemRecommendation
+from review.recommendations import build_recommendations
+
+User = get_user_model()
+
+
+class RecommendationTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.author = User.objects.create_user(email='recommend@example.com')
+    cls.fans = [User.objects.create_user(email=f'recommend-fan{i}@example.com') for i in range(4)]
+    brand = Brand.objects.create(name='Recommend Brand')
+    series = Series.objects.create(name='Recommend Series', brand=brand)
+    position = Position.objects.create(name='Recommend Position')
+    cls.items = [
+      Item.objects.create(
+        item_name=f'Recommend Item {i}', brand=brand, series=series, position=position,
+        release_date=datetime.date(2023, 10, 1), display=True
+      )
+      for i in range(4)
+    ]
+    cls.reviews = {
+      title: Review.objects.create(user=cls.author, item=cls.items[0], title=title, content='Content')
+      for title in ('target', 'niche', 'popular', 'unrelated')
+    }
+    # target: fan0, fan1 / niche: fan0, fan1 / popular: fan0〜fan3 / unrelated: fan3
+    for title, fans in (('target', (0, 1)), ('niche', (0, 1)), ('popular', (0, 1, 2, 3)), ('unrelated', (3,))):
+      for i in fans:
+        Favorite.objects.create(user=cls.fans[i], review=cls.reviews[title])
+
+  def recommended(self, review, **kwargs):
+    return list(
+      ReviewRecommendation.objects.filter(review=review).order_by('rank').values_list('recommended__title', 'score')
+    )
+
+  # 共起の数が同じでも、ユーザーの少ない（似ている）レビューを上位にする
+  def test_cosine_ranking(self):
+    self.assertEqual(build_recommendations('reviews'), (4, 8))
+    self.assertEqual(self.recommended(self.reviews['target']), [
+      ('niche', 1.0),
+      ('popular', 2 / math.sqrt(2 * 4)),
+    ])
+    self.assertEqual([title for title, _ in self.recommended(self.reviews['unrelated'])], ['popular'])
+
+  # chunkの大きさによらず結果は同じで、前回の推薦は置き換わる
+  def test_chunking_and_rebuild(self):
+    build_recommendations('reviews', chunk_size=1)
+    expected = {review.title: self.recommended(review) for review in self.reviews.values()}
+    build_recommendations('reviews', chunk_size=100)
+    self.assertEqual({review.title: self.recommended(review) for review in self.reviews.values()}, expected)
+    self.assertEqual(ReviewRecommendation.objects.count(), 8)
+
+    build_recommendations('reviews', top_k=1, min_cooccurrence=2)
+    self.assertEqual(self.recommended(self.reviews['target']), [('niche', 1.0)])
+    self.assertEqual(self.recommended(self.reviews['unrelated']), [])
+
+  # いいねの多すぎるユーザーは数えず、いいねがなくなったレビューの推薦は消す
+  def test_heavy_users_and_stale_targets(self):
+    for title in ('target', 'niche'):
+      Favorite.objects.create(user=self.fans[3], review=self.reviews[title])
+    build_recommendations('reviews', max_user_actions=3)
+    self.assertEqual(self.recommended(self.reviews['target']), [
+      ('niche', 1.0),
+      ('popular', 2 / math.sqrt(2 * 3)),
+    ])
+    self.assertEqual(self.recommended(self.reviews['unrelated']), [])
+
+    Favorite.objects.filter(review=self.reviews['target']).delete()
+    build_recommendations('reviews')
+    self.assertEqual(self.recommended(self.reviews['target']), [])
+    self.assertFalse(ReviewRecommendation.objects.filter(recommended=self.reviews['target']).exists())
+
+  def test_review_recommendation_view(self):
+    call_command('build_recommendations', kind=['reviews'], stdout=io.StringIO())
+    response = self.client.get(
+      reverse('reviews:review-recommendations', kwargs={'review_id': self.reviews['target'].id})
+    )
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(
+      [(entry['score'], entry['review']['title']) for entry in response.data['results']],
+      [(1.0, 'niche'), (2 / math.sqrt(2 * 4), 'popular')]
+    )
+
+  # 同じユーザーがレビューしたアイテムを推薦し、非表示のアイテムは返さない
+  def test_item_recommendation_view(self):
+    for user, items in ((self.fans[0], (1, 2, 3)), (self.fans[1], (1, 2)), (self.fans[2], (2,))):
+      for i in items:
+        Review.objects.create(user=user, item=self.items[i], title='Title', content='Content')
+    Review.objects.create(user=self.fans[0], item=self.items[1], title='Again', content='Content')
+    Item.objects.filter(pk=self.items[3].pk).update(display=False)
+    call_command('build_recommendations', stdout=io.StringIO())
+
+    self.assertEqual(ItemRecommendation.objects.filter(item=self.items[1]).count(), 2)
+    response = self.client.get(reverse('reviews:item-recommendations', kwargs={'item_id': self.items[1].id}))
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(
+      [(entry['score'], entry['item']['id']) for entry in response.data['results']],
+      [(2 / math.sqrt(2 * 3), self.items[2].id)]
+    )
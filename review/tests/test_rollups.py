@@ -0,0 +1,159 @@
+import datetime
+import io
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from item.models import Item, Brand, Series, Position
+from review.counters import get_favorite_counter_buffer, record_favorite_buckets
+from review.models import Review, Favorite, FavoriteBucket, ItemReviewCount, ReviewLeaderboardEntry
+from review.rollups import compact_rollups, reconcile_item_review_counts
+
+User = get_user_model()
+
+
+class RollupTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user(email='rollup@example.com')
+    cls.fans = [User.objects.create_user(email=f'fan{i}@example.com') for i in range(3)]
+    brand = Brand.objects.create(name='Rollup Brand')
+    series = Series.objects.create(name='Rollup Series', brand=brand)
+    position = Position.objects.create(name='Rollup Position')
+    cls.items = [
+      Item.objects.create(
+        item_name=f'Rollup Item {i}', brand=brand, series=series, position=position,
+        release_date=datetime.date(2023, 10, 1), display=True
+      )
+      for i in range(3)
+    ]
+
+  def create_review(self, item, title='Title'):
+    return Review.objects.create(user=self.user, item=item, title=title, content='Content')
+
+  def review_counts(self):
+    return dict(ItemReviewCount.objects.values_list('item_id', 'review_count'))
+
+  # レビューの投稿・削除に合わせてアイテムのレビュー数を増減する
+  def test_item_review_counts(self):
+    first = self.create_review(self.items[0])
+    self.create_review(self.items[0])
+    self.create_review(self.items[1])
+    self.assertEqual(self.review_counts(), {self.items[0].id: 2, self.items[1].id: 1})
+
+    first.title = 'Edited'
+    first.save()
+    first.delete()
+    self.assertEqual(self.review_counts(), {self.items[0].id: 1, self.items[1].id: 1})
+
+    # アイテムごと削除しても失敗しない
+    self.items[1].delete()
+    self.assertEqual(self.review_counts(), {self.items[0].id: 1})
+
+  def test_reconcile_item_review_counts(self):
+    self.create_review(self.items[0])
+    Review.objects.bulk_create([Review(user=self.user, item=self.items[2], title='Bulk', content='Content')])
+    ItemReviewCount.objects.filter(item=self.items[0]).update(review_count=5)
+    ItemReviewCount.objects.create(item=self.items[1], review_count=3)
+
+    self.assertEqual(reconcile_item_review_counts(), 3)
+    self.assertEqual(self.review_counts(), {self.items[0].id: 1, self.items[1].id: 0, self.items[2].id: 1})
+    self.assertEqual(reconcile_item_review_counts(), 0)
+
+  # いいねの登録・解除は当日の集計行を増減する
+  def test_favorite_buckets(self):
+    review = self.create_review(self.items[0])
+    for fan in self.fans:
+      Favorite.objects.add(fan, review.id)
+    Favorite.objects.add(self.fans[0], review.id)
+    Favorite.objects.remove(self.fans[1], review.id)
+    bucket = FavoriteBucket.objects.get()
+    self.assertEqual((bucket.review_id, bucket.day, bucket.count), (review.id, timezone.localdate(), 2))
+
+  # バッファを使う場合はフラッシュ時に集計し、削除済みのレビューの差分は捨てる
+  @override_settings(FAVORITE_COUNTER_BUFFER=True)
+  def test_favorite_buckets_with_counter_buffer(self):
+    review = self.create_review(self.items[0])
+    deleted = self.create_review(self.items[1])
+    counter_buffer = get_favorite_counter_buffer()
+    self.addCleanup(counter_buffer.flush)
+    with self.captureOnCommitCallbacks(execute=True):
+      Favorite.objects.add(self.fans[0], review.id)
+      Favorite.objects.add(self.fans[0], deleted.id)
+    self.assertFalse(FavoriteBucket.objects.exists())
+
+    deleted.delete()
+    counter_buffer.flush()
+    self.assertEqual(list(FavoriteBucket.objects.values_list('review_id', 'count')), [(review.id, 1)])
+
+  # ユーザーごと削除した場合は、そのユーザーのレビュー数をまとめて減らす
+  def test_user_delete_review_counts(self):
+    other = User.objects.create_user(email='leaving@example.com')
+    self.create_review(self.items[0])
+    for item in (self.items[0], self.items[0], self.items[1]):
+      Review.objects.create(user=other, item=item, title='Title', content='Content')
+    other.delete()
+    self.assertEqual(self.review_counts(), {self.items[0].id: 1, self.items[1].id: 0})
+
+  # 期間内のいいねの合計でランキングを作り、期間外・0件の行を削除する
+  @override_settings(REVIEW_LEADERBOARD_PERIODS={'week': 7, 'month': 30}, REVIEW_LEADERBOARD_SIZE=2)
+  def test_compact_rollups(self):
+    today = datetime.date(2024, 5, 31)
+    old, recent, steady, unliked = (self.create_review(self.items[0], title) for title in ('old', 'recent', 'steady', 'unliked'))
+    record_favorite_buckets({old.id: 5}, day=today - datetime.timedelta(days=20))
+    record_favorite_buckets({recent.id: 3, steady.id: 1}, day=today)
+    record_favorite_buckets({steady.id: 1}, day=today - datetime.timedelta(days=6))
+    record_favorite_buckets({unliked.id: 1}, day=today)
+    record_favorite_buckets({unliked.id: -1}, day=today)
+    record_favorite_buckets({old.id: 9}, day=today - datetime.timedelta(days=30))
+
+    self.assertEqual(compact_rollups(today), 2)
+    entries = ReviewLeaderboardEntry.objects.order_by('period', 'rank').values_list('period', 'rank', 'review_id', 'score')
+    self.assertEqual(list(entries), [
+      ('month', 1, old.id, 5),
+      ('month', 2, recent.id, 3),
+      ('week', 1, recent.id, 3),
+      ('week', 2, steady.id, 2),
+    ])
+
+    # 作り直すと前回の順位は置き換わる
+    record_favorite_buckets({steady.id: 10}, day=today)
+    compact_rollups(today)
+    self.assertEqual(
+      list(ReviewLeaderboardEntry.objects.filter(period='week').order_by('rank').values_list('review_id', flat=True)),
+      [steady.id, recent.id]
+    )
+
+  def test_review_leaderboard_view(self):
+    first, second = self.create_review(self.items[0], 'first'), self.create_review(self.items[1], 'second')
+    record_favorite_buckets({first.id: 2, second.id: 5})
+    call_command('compact_review_rollups', stdout=io.StringIO())
+
+    url = reverse('reviews:review-leaderboard')
+    response = self.client.get(url, {'period': 'month'})
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data['period'], 'month')
+    self.assertEqual(
+      [(entry['rank'], entry['score'], entry['review']['title']) for entry in response.data['results']],
+      [(1, 5, 'second'), (2, 2, 'first')]
+    )
+    self.assertEqual(len(self.client.get(url, {'limit': 1}).data['results']), 1)
+    for params in ({'period': 'year'}, {'limit': 0}, {'limit': 'x'}):
+      with self.subTest(params):
+        self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+  def test_item_leaderboard_view(self):
+    for item, count in zip(self.items, (1, 3, 2)):
+      for _ in range(count):
+        self.create_review(item)
+    Item.objects.filter(pk=self.items[2].pk).update(display=False)
+
+    response = self.client.get(reverse('reviews:item-leaderboard'))
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(
+      [(entry['rank'], entry['review_count'], entry['item']['id']) for entry in response.data['results']],
+      [(1, 3, self.items[1].id), (2, 1, self.items[0].id)]
+    )
@@ -0,0 +1,131 @@
+import datetime
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from item.models import Item, Brand, Series, Position
+from review.models import Review, ReviewSearchGram
+from review.search import gram_weights, ngrams, search_reviews
+from review.views import ReviewSearchPagination
+
+User = get_user_model()
+
+
+class NgramTests(APITestCase):
+  # 全角英数字・大文字はそろえ、語ごとにunigramとbigramに分割する
+  def test_ngrams(self):
+    self.assertEqual(list(ngrams('ＹＯＮＥＸの軽さ!')), [
+      'y', 'o', 'n', 'e', 'x', 'の', '軽', 'さ', 'yo', 'on', 'ne', 'ex', 'xの', 'の軽', '軽さ',
+    ])
+    self.assertEqual(list(ngrams('前衛 向け')), ['前', '衛', '前衛', '向', 'け', '向け'])
+
+  def test_title_weight(self):
+    with self.settings(REVIEW_SEARCH_TITLE_WEIGHT=3):
+      weights = gram_weights('軽い', '軽いし軽い')
+    self.assertEqual(weights['軽い'], 3 + 2)
+    self.assertEqual(weights['いし'], 1)
+
+
+class ReviewSearchTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user(email='search@example.com')
+    brand = Brand.objects.create(name='Search Brand')
+    cls.item = Item.objects.create(
+      item_name='Search Item',
+      brand=brand,
+      series=Series.objects.create(name='Search Series', brand=brand),
+      position=Position.objects.create(name='Search Position'),
+      release_date=datetime.date(2023, 10, 1),
+      display=True
+    )
+
+  def setUp(self):
+    self.url = reverse('reviews:review-search')
+
+  def create_review(self, title, content):
+    return Review.objects.create(user=self.user, item=self.item, title=title, content=content)
+
+  def search(self, query, **params):
+    response = self.client.get(self.url, {'q': query, **params})
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    return response
+
+  # タイトルに含まれるレビューほど上位になり、検索語のすべてを含むレビューだけを返す
+  def test_ranked_results(self):
+    in_title = self.create_review('軽いラケット', '前衛向けです。')
+    in_content = self.create_review('初めての一本', 'とても軽いラケットでした。')
+    self.create_review('重いラケット', '後衛向けです。')
+    self.create_review('軽いシューズ', 'ラケットではありません。')
+
+    response = self.search('軽いラケット')
+    self.assertEqual([review['id'] for review in response.data['results']], [str(in_title.id), str(in_content.id)])
+    self.assertIsNone(response.data['next'])
+    self.assertEqual(response.data['results'][0]['title'], '軽いラケット')
+
+    # 空白で区切った語はそれぞれ含まれていればよい
+    response = self.search('前衛 ラケット')
+    self.assertEqual([review['id'] for review in response.data['results']], [str(in_title.id)])
+
+  def test_single_character_and_normalization(self):
+    review = self.create_review('YONEXの新作', '打球感が良い球')
+    for query in ('球', 'ｙｏｎｅｘ', 'Yonex'):
+      with self.subTest(query):
+        self.assertEqual([r['id'] for r in self.search(query).data['results']], [str(review.id)])
+
+  # 投稿・編集・削除に合わせて索引を更新する
+  def test_index_follows_changes(self):
+    review = self.create_review('ガットの張り替え', '張り替えました')
+    self.assertEqual(len(self.search('張り替え').data['results']), 1)
+
+    review.content = 'ストリングを交換しました'
+    review.save()
+    self.assertEqual(len(self.search('ストリング').data['results']), 1)
+    self.assertEqual(
+      set(ReviewSearchGram.objects.filter(review=review).values_list('gram', flat=True)),
+      set(gram_weights(review.title, review.content))
+    )
+
+    review.delete()
+    self.assertEqual(self.search('ガット').data['results'], [])
+    self.assertFalse(ReviewSearchGram.objects.exists())
+
+  # タイトル・本文を含まない保存では索引を更新しない
+  def test_skips_unrelated_updates(self):
+    review = self.create_review('ガット', '本文')
+    with mock.patch('review.signals.index_review') as index_review:
+      review.save(update_fields=['favorites_count'])
+      index_review.assert_not_called()
+      review.save(update_fields=['title', 'is_edited'])
+      index_review.assert_called_once_with(review)
+
+  @mock.patch.object(ReviewSearchPagination, 'page_size', 2)
+  def test_cursor_pagination(self):
+    reviews = [self.create_review(f'ボレー{i}', 'ボレー' * (i + 1)) for i in range(5)]
+    expected = [str(review.id) for review in reversed(reviews)]
+
+    ids, params = [], {}
+    while True:
+      response = self.search('ボレー', **params)
+      ids.extend(review['id'] for review in response.data['results'])
+      if response.data['next'] is None:
+        break
+      params = {'cursor': parse_qs(urlparse(response.data['next']).query)['cursor'][0]}
+    self.assertEqual(ids, expected)
+
+  def test_empty_and_invalid_queries(self):
+    self.create_review('ガット', '本文')
+    self.assertEqual(self.search('').data['results'], [])
+    self.assertEqual(self.search('!!').data['results'], [])
+    self.assertEqual(self.client.get(self.url, {'q': 'あ' * 51}).status_code, status.HTTP_400_BAD_REQUEST)
+    self.assertEqual(self.client.get(self.url, {'q': 'ガット', 'cursor': 'broken'}).status_code, status.HTTP_404_NOT_FOUND)
+
+  def test_search_reviews_score(self):
+    review = self.create_review('スピン', 'スピンがかかる')
+    with self.settings(REVIEW_SEARCH_TITLE_WEIGHT=3):
+      rows = list(search_reviews('スピン'))
+    self.assertEqual([row['review_id'] for row in rows], [review.id])
+    # 検索語のn-gram（スピ・ピン）がそれぞれタイトルに1回（重み3）、本文に1回
+    self.assertEqual(rows[0]['score'], 2 * (3 + 1))
@@ -0,0 +1,123 @@
+import datetime
+import io
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from item.models import Item, Brand, Series, Position
+from review import trending
+from review.models import Review, Favorite
+from reviewsite.utils.pagination import TrendingCursorPagination
+
+User = get_user_model()
+
+
+class ComputeTrendingScoresTests(unittest.TestCase):
+  # 半減期ごとにいいね1件の重みが半分になる
+  def test_scores(self):
+    scores = trending.compute_trending_scores(['a', 'b', 'a', 'c', 'a'], [0, 3600, 7200, 36000, 3600], half_life=3600)
+    self.assertEqual(set(scores), {'a', 'b', 'c'})
+    self.assertAlmostEqual(scores['a'], 1 + 0.25 + 0.5)
+    self.assertAlmostEqual(scores['b'], 0.5)
+    self.assertAlmostEqual(scores['c'], 0.5 ** 10)
+    self.assertEqual(trending.compute_trending_scores([], [], half_life=3600), {})
+
+
+@override_settings(REVIEW_TRENDING_HALF_LIFE_HOURS=24, REVIEW_TRENDING_WINDOW_DAYS=7)
+class TrendingSortTests(APITestCase):
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user(email='trending@example.com')
+    cls.fans = [User.objects.create_user(email=f'trending-fan{i}@example.com') for i in range(4)]
+    brand = Brand.objects.create(name='Trending Brand')
+    cls.item = Item.objects.create(
+      item_name='Trending Item',
+      brand=brand,
+      series=Series.objects.create(name='Trending Series', brand=brand),
+      position=Position.objects.create(name='Trending Position'),
+      release_date=datetime.date(2023, 10, 1),
+      display=True
+    )
+
+  def setUp(self):
+    self.now = timezone.now()
+    self.url = reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id})
+
+  def create_review(self, title, favorite_ages_in_hours=()):
+    review = Review.objects.create(user=self.user, item=self.item, title=title, content='Content')
+    for fan, hours in zip(self.fans, favorite_ages_in_hours):
+      favorite = Favorite.objects.create(user=fan, review=review)
+      Favorite.objects.filter(pk=favorite.pk).update(created_at=self.now - datetime.timedelta(hours=hours))
+    return review
+
+  def titles(self, **params):
+    response = self.client.get(self.url, {'sort': 'trending', **params})
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    return response
+
+  # 最近のいいねほど重く数え、期間外のいいねは数えない
+  def test_recompute(self):
+    self.create_review('fresh', (1,))
+    self.create_review('popular', (24, 24, 24))
+    old = self.create_review('old', (24 * 8, 24 * 8))
+    self.create_review('none')
+    Review.objects.filter(pk=old.pk).update(trending_score=5)
+
+    self.assertEqual(trending.recompute_trending_scores(now=self.now), 3)
+    scores = dict(Review.objects.values_list('title', 'trending_score'))
+    self.assertAlmostEqual(scores['fresh'], 0.5 ** (1 / 24))
+    self.assertAlmostEqual(scores['popular'], 1.5)
+    self.assertEqual((scores['old'], scores['none']), (0, 0))
+
+    response = self.titles()
+    self.assertEqual([review['title'] for review in response.data[:2]], ['popular', 'fresh'])
+    self.assertNotIn('trending_score', response.data[0])
+
+  def test_cursor_pagination(self):
+    reviews = [self.create_review(f'review{i}', (1,) * (i % 4)) for i in range(6)]
+    call_command('recompute_trending_scores', stdout=io.StringIO())
+    expected = [
+      review.title for review in
+      sorted(Review.objects.filter(pk__in=[r.pk for r in reviews]), key=lambda r: (-r.trending_score, -r.id.int))
+    ]
+
+    # 一覧用の高速なシリアライザでは、カーソル用にtrending_scoreを取得するが出力はしない
+    for fast in (False, True):
+      with self.subTest(fast=fast), override_settings(REVIEW_FAST_SERIALIZER=fast):
+        titles, cursor = [], ''
+        with mock.patch.object(TrendingCursorPagination, 'page_size', 4):
+          while cursor is not None:
+            response = self.titles(cursor=cursor)
+            titles.extend(review['title'] for review in response.data['results'])
+            self.assertNotIn('trending_score', response.data['results'][0])
+            next_url = response.data['next']
+            cursor = parse_qs(urlparse(next_url).query)['cursor'][0] if next_url else None
+        self.assertEqual(titles, expected)
+
+  # 再計算（別プロセスの管理コマンド）の後は、以前のETagでも304にならない
+  def test_recompute_changes_etag(self):
+    self.create_review('fresh', (1,))
+    etag = self.titles()['ETag']
+    call_command('recompute_trending_scores', stdout=io.StringIO())
+    response = self.client.get(self.url, {'sort': 'trending'}, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+  def test_invalid_sort_and_cursor(self):
+    self.assertEqual(self.client.get(self.url, {'sort': 'popular'}).status_code, status.HTTP_400_BAD_REQUEST)
+    for cursor in ('broken', 'bmFufDEyMw=='):
+      with self.subTest(cursor):
+        response = self.client.get(self.url, {'sort': 'trending', 'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+  # いいねの登録でも作成日時が記録される
+  def test_favorite_add_records_created_at(self):
+    review = self.create_review('added')
+    Favorite.objects.add(self.fans[0], review.id)
+    created_at = Favorite.objects.get(review=review).created_at
+    self.assertLess(abs((created_at - timezone.now()).total_seconds()), 60)
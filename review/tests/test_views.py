@@ -3,13 +3,18 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 from item.models import Item,Brand,Series,Position
-from review.models import Review,Favorite
+from review.models import Review,Favorite,FavoritesVersion
+from review.serializers import ReviewCardSerializer
 from rest_framework.test import APIClient
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 import datetime
+import uuid
 from django.utils import timezone
+from django.db.models import F
 from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest import mock
+from reviewsite.utils.pagination import KeysetCursorPagination
 
 
 User = get_user_model()
@@ -191,6 +196,147 @@ class ReviewListFilterViewTests(BaseReviewTest):
     self.assertEqual(response.status_code, status.HTTP_200_OK)
     self.assertEqual(len(response.data), 2) 
 
+  # cursorパラメータ指定時はキーセットページネーションで取得
+  def test_filter_reviews_with_cursor(self):
+    with mock.patch.object(KeysetCursorPagination, 'page_size', 1):
+      response = self.client.get(self.url, {'cursor': ''}, format='json')
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+      self.assertEqual(len(response.data['results']), 1)
+      self.assertEqual(response.data['results'][0]['id'], str(self.review2.id))
+      self.assertIsNotNone(response.data['next'])
+
+      response = self.client.get(response.data['next'], format='json')
+      self.assertEqual(response.status_code, status.HTTP_200_OK)
+      self.assertEqual(response.data['results'][0]['id'], str(self.review1.id))
+      self.assertIsNone(response.data['next'])
+
+  # レビュー件数が増えてもクエリ数が一定であること
+  def test_filter_reviews_query_count(self):
+    for i in range(5):
+      other_user = User.objects.create_user(email=f'other{i}@example.com', password='testpass')
+      Review.objects.create(user=other_user, item=self.item, title=f'Other {i}', content='Content')
+    # カタログのバージョンをキャッシュしておく
+    self.client.get(self.url, format='json')
+    # ETag用のいいねのバージョンと集計 + レビュー（user, item, brand, series, positionをJOIN）+ お気に入りのprefetch
+    with self.assertNumQueries(4):
+      response = self.client.get(self.url, format='json')
+    self.assertEqual(len(response.data), 7)
+
+  # 不正なcursorの場合は404
+  def test_filter_reviews_with_invalid_cursor(self):
+    response = self.client.get(self.url, {'cursor': 'invalid'}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class ReviewListETagTests(BaseReviewTest):
+  def setUp(self):
+    self.client = APIClient()
+    self.client.force_authenticate(user=self.user)
+    self.url = reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id})
+
+  def get_etag(self):
+    response = self.client.get(self.url, format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    return response['ETag']
+
+  # ETagが一致する場合は304を返す
+  def test_not_modified(self):
+    etag = self.get_etag()
+    response = self.client.get(self.url, format='json', HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    self.assertEqual(response.content, b'')
+    self.assertEqual(response['ETag'], etag)
+
+  # レビューが更新された場合はETagが変わる
+  def test_etag_changes_on_review_update(self):
+    etag = self.get_etag()
+    self.review1.title = 'Updated'
+    self.review1.save()
+    response = self.client.get(self.url, format='json', HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertNotEqual(response['ETag'], etag)
+
+  # いいねされた場合はETagが変わる
+  def test_etag_changes_on_favorite(self):
+    etag = self.get_etag()
+    with self.captureOnCommitCallbacks(execute=True):
+      self.client.post(reverse('reviews:favorite-create', kwargs={'review_id': self.review1.id}), format='json')
+    response = self.client.get(self.url, format='json', HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+  # 他のワーカー・管理コマンドでのいいねの反映（DB上のバージョン）でもETagが変わる
+  def test_etag_changes_on_version_bumped_elsewhere(self):
+    etag = self.get_etag()
+    FavoritesVersion.objects.filter(pk=1).update(version=F('version') + 1)
+    response = self.client.get(self.url, format='json', HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+  # 閲覧ユーザーが異なる場合はETagが変わる
+  def test_etag_varies_by_user(self):
+    etag = self.get_etag()
+    self.client.force_authenticate(user=None)
+    self.assertNotEqual(self.get_etag(), etag)
+
+# 画像・お気に入りを含むレビュー一覧の出力比較用
+class ReviewListOutputTest(BaseReviewTest):
+  def setUp(self):
+    self.client = APIClient()
+    self.client.force_authenticate(user=self.user)
+    other_user = User.objects.create_user(email='other@example.com', password='testpass')
+    User.objects.filter(pk=other_user.pk).update(image_renditions={'jpeg': {'96': 'profiles/96.jpg', '500': 'profiles/500.jpg'}})
+    review = Review.objects.create(
+      user=other_user, item=self.item, title='画像付き', content='本文', image='reviews/test.jpg',
+      image_renditions={'webp': {'96': 'reviews/96.webp', '256': 'reviews/256.webp'}, 'jpeg': {'96': 'reviews/96.jpg'}}
+    )
+    Favorite.objects.create(user=self.user, review=review)
+    self.user.favorite_reviews.add(review)
+    other_user.favorite_reviews.add(self.review1, self.review2)
+
+class ReviewCardSerializerTests(ReviewListOutputTest):
+  # 高速版でもReviewSerializerと同じJSONを返す
+  def test_same_json_as_review_serializer(self):
+    urls = [
+      (reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id}), {}),
+      (reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id}), {'cursor': ''}),
+      (reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id}), {'sort': 'trending', 'cursor': ''}),
+      (reverse('reviews:my-reviews-list-all'), {}),
+      (reverse('reviews:get-favorite-list'), {}),
+    ]
+    for url, params in urls:
+      with self.settings(REVIEW_FAST_SERIALIZER=False):
+        expected = self.client.get(url, params, format='json')
+      with self.settings(REVIEW_FAST_SERIALIZER=True):
+        actual = self.client.get(url, params, format='json')
+      self.assertEqual(actual.status_code, status.HTTP_200_OK)
+      self.assertEqual(actual.content, expected.content)
+
+  # 出力しない列（trending_score）は、ページネーションのキーとして指定された場合だけ取得する
+  def test_project_extra_fields(self):
+    queryset = Review.objects.all()
+    self.assertNotIn('trending_score', ReviewCardSerializer.project(queryset).query.values_select)
+    projected = ReviewCardSerializer.project(queryset, extra_fields=('trending_score', 'created_at'))
+    self.assertEqual(projected.query.values_select.count('trending_score'), 1)
+    self.assertEqual(projected.query.values_select.count('created_at'), 1)
+
+class StreamingReviewListTests(ReviewListOutputTest):
+  # ストリーミング時も通常のレスポンスと同じJSONを返す
+  def test_streaming_same_json(self):
+    urls = [reverse('reviews:my-reviews-list-all'), reverse('reviews:get-favorite-list')]
+    for url in urls:
+      for fast in (False, True):
+        with self.settings(REVIEW_FAST_SERIALIZER=fast):
+          expected = self.client.get(url, format='json')
+          with self.settings(REVIEW_STREAMING_RESPONSE=True, REVIEW_STREAMING_CHUNK_SIZE=1):
+            actual = self.client.get(url, format='json')
+        self.assertTrue(actual.streaming)
+        self.assertEqual(b''.join(actual.streaming_content), expected.content)
+
+  # 0件の場合は空の配列
+  def test_streaming_empty(self):
+    self.client.force_authenticate(user=User.objects.create_user(email='empty@example.com', password='testpass'))
+    with self.settings(REVIEW_STREAMING_RESPONSE=True):
+      response = self.client.get(reverse('reviews:my-reviews-list-all'), format='json')
+    self.assertEqual(b''.join(response.streaming_content), b'[]')
+
 class GetFavoriteListViewTest(BaseReviewTest):
   def setUp(self):
     super().setUp()
@@ -243,6 +389,46 @@ class GetFavoriteReviewViewTests(BaseReviewTest):
     self.assertEqual(response.status_code, status.HTTP_200_OK)
     self.assertFalse(response.data['isFavorite'])
 
+class GetFavoriteStateListViewTests(BaseReviewTest):
+  def setUp(self):
+    super().setUp()
+    self.client = APIClient()
+    self.client.force_authenticate(user=self.user)
+    self.url = reverse('reviews:get-favorite-state-list')
+    Favorite.objects.create(user=self.user, review=self.review1)
+    Review.objects.filter(pk=self.review1.pk).update(favorites_count=1)
+
+  # 複数レビューのいいね状態といいね数をまとめて取得
+  def test_get_favorite_states(self):
+    ids = f'{self.review1.id},{self.review2.id}'
+    with self.assertNumQueries(1):
+      response = self.client.get(self.url, {'ids': ids}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data, {
+      str(self.review1.id): {'isFavorite': True, 'favorites_count': 1},
+      str(self.review2.id): {'isFavorite': False, 'favorites_count': 0},
+    })
+
+  # 未ログインの場合はすべてisFavoriteがFalse
+  def test_get_favorite_states_no_auth(self):
+    self.client.force_authenticate(user=None)
+    response = self.client.get(self.url, {'ids': str(self.review1.id)}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertFalse(response.data[str(self.review1.id)]['isFavorite'])
+
+  # 不正なidが含まれる場合は400
+  def test_get_favorite_states_invalid_id(self):
+    response = self.client.get(self.url, {'ids': 'invalid'}, format='json')
+    self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+  # 一覧のレビューにもいいね状態が含まれる
+  def test_review_list_includes_favorite_state(self):
+    url = reverse('reviews:review-list-filter', kwargs={'item_id': self.item.id})
+    response = self.client.get(url, format='json')
+    is_favorite = {review['id']: review['is_favorite'] for review in response.data}
+    self.assertTrue(is_favorite[str(self.review1.id)])
+    self.assertFalse(is_favorite[str(self.review2.id)])
+
 class FavoriteViewSetTests(BaseReviewTest):
   def setUp(self):
     super().setUp()
@@ -260,7 +446,34 @@ class FavoriteViewSetTests(BaseReviewTest):
   #お気に入りが削除されたかを確認
   def test_destroy_favorite(self):
     Favorite.objects.create(user=self.user, review=self.review2)
+    Review.objects.filter(pk=self.review2.pk).update(favorites_count=1)
     response = self.client.delete(self.destroy_url,format='json')
-    self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data['favorites_count'], 0)
     self.assertFalse(Favorite.objects.filter(user=self.user, review=self.review2).exists())
 
+  #同じお気に入り登録を繰り返してもいいね数は増えない
+  def test_create_favorite_idempotent(self):
+    response = self.client.post(self.create_url,format='json')
+    self.assertEqual(response.data['favorites_count'], 1)
+    response = self.client.post(self.create_url,format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data['favorites_count'], 1)
+    self.review1.refresh_from_db()
+    self.assertEqual(self.review1.favorites_count, 1)
+    self.assertEqual(Favorite.objects.filter(review=self.review1).count(), 1)
+
+  #未登録のお気に入りを解除してもいいね数は減らない
+  def test_destroy_favorite_idempotent(self):
+    response = self.client.delete(self.destroy_url,format='json')
+    self.assertEqual(response.status_code, status.HTTP_200_OK)
+    self.assertEqual(response.data['favorites_count'], 0)
+
+  #存在しないレビューへのお気に入りは404
+  def test_favorite_review_not_found(self):
+    for review_id in (uuid.uuid4(), 'invalid'):
+      url = reverse('reviews:favorite-create', kwargs={'review_id': review_id})
+      response = self.client.post(url,format='json')
+      self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+      self.assertFalse(Favorite.objects.filter(user=self.user).exists())
+
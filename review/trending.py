@@ -0,0 +1,63 @@
+import datetime
+from collections import defaultdict
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from review.cache import bump_favorites_version
+from review.models import Favorite, Review
+
+
+# いいねごとの経過時間（秒）から、レビューごとのトレンドスコアを求める
+# いいね1件の重みは 0.5 ** (経過時間 / 半減期)、スコアはその合計
+def compute_trending_scores(review_ids, ages, half_life):
+  scores = defaultdict(float)
+  for review_id, age in zip(review_ids, ages):
+    scores[review_id] += 0.5 ** (age / half_life)
+  return dict(scores)
+
+
+# trending_scoreを1回のUPDATE（CASE id WHEN ... THEN ...）で書き込む
+# 件数が多いためCase/Whenの式は組み立てずにSQLを直接作る
+def update_trending_scores(scores, using='default'):
+  connection = connections[using]
+  qn = connection.ops.quote_name
+  pk_column = qn(Review._meta.pk.column)
+  score_column = qn(Review._meta.get_field('trending_score').column)
+  review_pks = [Review._meta.pk.get_db_prep_value(review_id, connection) for review_id in scores]
+  whens = ' '.join(['WHEN %s THEN %s'] * len(scores))
+  placeholders = ', '.join(['%s'] * len(scores))
+  params = [value for review_pk, score in zip(review_pks, scores.values()) for value in (review_pk, float(score))]
+  with connection.cursor() as cursor:
+    cursor.execute(
+      f'UPDATE {qn(Review._meta.db_table)} SET {score_column} = CASE {pk_column} {whens} ELSE {score_column} END '
+      f'WHERE {pk_column} IN ({placeholders})',
+      params + review_pks
+    )
+
+
+# 集計期間内のいいねの日時を読み込み、全レビューのtrending_scoreを作り直す
+# 期間内にいいねのないレビューは0にする。更新した件数を返す
+def recompute_trending_scores(now=None, batch_size=500):
+  now = now or timezone.now()
+  half_life = settings.REVIEW_TRENDING_HALF_LIFE_HOURS * 3600
+  since = now - datetime.timedelta(days=settings.REVIEW_TRENDING_WINDOW_DAYS)
+
+  rows = Favorite.objects.filter(created_at__gte=since, created_at__lte=now).values_list('review_id', 'created_at')
+  review_ids, ages = [], []
+  for review_id, created_at in rows.iterator(chunk_size=10_000):
+    review_ids.append(review_id)
+    ages.append((now - created_at).total_seconds())
+  scores = compute_trending_scores(review_ids, ages, half_life)
+
+  stale_ids = set(Review.objects.filter(trending_score__gt=0).values_list('pk', flat=True)) - scores.keys()
+  scores.update(dict.fromkeys(stale_ids, 0.0))
+
+  # 一覧の並び順が途中の状態にならないよう、まとめて1つのトランザクションで書き込む
+  review_ids = list(scores)
+  with transaction.atomic():
+    for start in range(0, len(review_ids), batch_size):
+      update_trending_scores({review_id: scores[review_id] for review_id in review_ids[start:start + batch_size]})
+  # trending_scoreの更新ではupdated_atが変わらないため、いいねのバージョン（DB）を上げて一覧のETagを変える
+  if review_ids:
+    bump_favorites_version()
+  return len(review_ids)
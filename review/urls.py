@@ -11,8 +11,14 @@ urlpatterns = [
   path('myreview_list/', views.MyReviewListView.as_view(), name='my-reviews-list-all'),
   path('otherusers_review_list/<int:item_id>/',views.OtherUsersReviewListView.as_view(),name='otherusers-review-list'),
   path('review_list/<int:item_id>/',views.ReviewListItemFilterView.as_view(),name='review-list-filter'),
+  path('reviews/search/', views.ReviewSearchView.as_view(), name='review-search'),
+  path('reviews/leaderboard/', views.ReviewLeaderboardView.as_view(), name='review-leaderboard'),
+  path('items/leaderboard/', views.ItemLeaderboardView.as_view(), name='item-leaderboard'),
+  path('reviews/<uuid:review_id>/recommendations/', views.ReviewRecommendationView.as_view(), name='review-recommendations'),
+  path('items/<int:item_id>/recommendations/', views.ItemRecommendationView.as_view(), name='item-recommendations'),
   path('review/create/<int:item_id>/', views.CreateReviewView.as_view(),name='create-review'),
   path('favorite_list/', views.GetFavoriteListView.as_view(),name='get-favorite-list'),
+  path('review/favorites/', views.GetFavoriteStateListView.as_view(),name='get-favorite-state-list'),
   path('review/<str:review_id>/favorite/', views.GetFavoriteReviewView.as_view(),name='get-favorite-review'),
   path('review/favorites_count/<str:review_id>/', views.GetFavoriteReviewCountView.as_view(),name='get-favorite-review-count'),
   path('review/set/<str:review_id>/', views.FavoriteViewSet.as_view({'post': 'create', 'delete': 'destroy'}),name='favorite-viewset'),
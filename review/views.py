@@ -9,153 +9,311 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 import logging
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from reviewsite.utils.image import resize_image,delete_image_from_s3
+from reviewsite.utils.pagination import KeysetCursorPagination, RankedCursorPagination, TrendingCursorPagination
+from reviewsite.utils.eager_loading import EagerLoadingMixin
+from reviewsite.utils.etag import ETagMixin
+from reviewsite.utils.streaming import StreamingJSONListResponse
+from review.cache import get_favorites_version
+from review.search import search_reviews
+from item.cache import get_catalog_version
+from item.models import Item
+from item.serializers import ItemSerializer
+from images.jobs import enqueue_image_job, enqueue_uploaded_image, cancel_image_jobs
+from images.blobs import release_image_files
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import NotFound
-from PIL import Image
-import io
 import jwt
-from django.core.files.uploadedfile import InMemoryUploadedFile
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.exceptions import ValidationError
 from django.conf import settings
 from django.db import transaction
+from django.db.models import F
+from django.core.exceptions import ValidationError as DjangoValidationError
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
 
+#レビュー一覧のETag（件数・最終更新日時・いいねとカタログのバージョン・閲覧ユーザー）
+class ReviewListETagMixin(ETagMixin):
+  def get_etag(self, request, *args, **kwargs):
+    return (
+      request.user.pk,
+      get_favorites_version(),
+      get_catalog_version(request),
+      *self.get_queryset().fingerprint(),
+    )
+
+
+#レビュー一覧のレスポンス
+#REVIEW_FAST_SERIALIZERが有効な場合はReviewCardSerializerで組み立て、
+#stream_responseのビューでREVIEW_STREAMING_RESPONSEが有効な場合は件数によらず少しずつ返す（ページネーション時を除く）
+class ReviewListResponseMixin:
+  stream_response = False
+
+  def list(self, request, *args, **kwargs):
+    queryset = self.filter_queryset(self.get_queryset())
+    serialize_reviews = self.get_review_list_serializer()
+    if settings.REVIEW_FAST_SERIALIZER:
+      # キーセットページネーションのキー（trending_scoreなど）は次ページのカーソルを作るために取得する
+      key_field = getattr(self.pagination_class, 'key_field', None)
+      queryset = serializers.ReviewCardSerializer.project(queryset, extra_fields=(key_field,) if key_field else ())
+
+    page = self.paginate_queryset(queryset)
+    if page is not None:
+      return self.get_paginated_response(serialize_reviews(page))
+    if self.stream_response and settings.REVIEW_STREAMING_RESPONSE:
+      return StreamingJSONListResponse(queryset, serialize_reviews, chunk_size=settings.REVIEW_STREAMING_CHUNK_SIZE)
+    return Response(serialize_reviews(queryset))
+
+  # レビューのリストをシリアライズする関数（ストリーミング中に設定が変わっても同じものを使う）
+  def get_review_list_serializer(self):
+    if settings.REVIEW_FAST_SERIALIZER:
+      context = self.get_serializer_context()
+      return lambda reviews: serializers.ReviewCardSerializer(reviews, context=context).data
+    return lambda reviews: self.get_serializer(reviews, many=True).data
+
+
 #ログインしているユーザー以外のユーザーが投稿したレビューを取得
-class OtherUsersReviewListView(APIView):
+class OtherUsersReviewListView(ReviewListResponseMixin, EagerLoadingMixin, generics.ListAPIView):
   serializer_class = serializers.ReviewSerializer
   authentication_classes = ()
+  pagination_class = KeysetCursorPagination
+  stream_response = True
 
   def get_queryset(self):
     item_id = self.kwargs.get('item_id', None)
     if item_id:
-      return models.Review.objects.exclude(user=self.request.user).filter(item__id=item_id).order_by('-created_at')
-    return models.Review.objects.exclude(user=self.request.user).order_by('-created_at')
-
-  def get(self, request, *args, **kwargs):
-    queryset = self.get_queryset()
-    serializer = self.serializer_class(queryset, many=True, context={'request': request})
-    return Response(serializer.data)
+      return models.Review.objects.exclude(user=self.request.user).filter(item__id=item_id).order_by('-created_at', '-id')
+    return models.Review.objects.exclude(user=self.request.user).order_by('-created_at', '-id')
 
 
-class ReviewListItemFilterView(APIView):
+#アイテムのレビュー一覧（?sort=newで新しい順（既定）、?sort=trendingでトレンド順）
+class ReviewListItemFilterView(ReviewListETagMixin, ReviewListResponseMixin, EagerLoadingMixin, generics.ListAPIView):
   serializer_class = serializers.ReviewSerializer
   permission_classes = (AllowAny,)
+  # 並び順ごとのページネーション（並び順はページネーションのorderingと同じ）
+  sort_paginations = {
+    'new': KeysetCursorPagination,
+    'trending': TrendingCursorPagination,
+  }
+
+  @property
+  def pagination_class(self):
+    sort = self.request.query_params.get('sort', 'new')
+    if sort not in self.sort_paginations:
+      raise ValidationError(f'sort must be one of: {", ".join(self.sort_paginations)}.')
+    return self.sort_paginations[sort]
 
   def get_queryset(self):
     item_id = self.kwargs.get('item_id', None)
-    return models.Review.objects.filter(item__id=item_id).order_by('-created_at')
-
-  def get(self, request, *args, **kwargs):
-    queryset = self.get_queryset()
-    serializer = self.serializer_class(queryset, many=True, context={'request': request})
-    return Response(serializer.data)
+    return models.Review.objects.filter(item__id=item_id).order_by(*self.pagination_class.ordering)
 
 
-class MyReviewListView(APIView):
+class MyReviewListView(ReviewListETagMixin, ReviewListResponseMixin, EagerLoadingMixin, generics.ListAPIView):
   serializer_class = serializers.ReviewSerializer
   authentication_classes = [JWTAuthentication,]
+  pagination_class = KeysetCursorPagination
+  stream_response = True
 
   def get_queryset(self):
-    return models.Review.objects.filter(user=self.request.user,).order_by('-created_at')
+    return models.Review.objects.filter(user=self.request.user,).order_by('-created_at', '-id')
 
-  def get(self, request, *args, **kwargs):
-    queryset = self.get_queryset()
-    serializer = self.serializer_class(queryset, many=True, context={'request': request})
-    return Response(serializer.data)
+
+class ReviewSearchPagination(RankedCursorPagination):
+  pk_field = 'review_id'
+
+
+#レビューの全文検索（?q=検索語）
+#検索語のすべてのn-gramを含むレビューをスコアの高い順に返す（?cursor=で次のページ）
+class ReviewSearchView(EagerLoadingMixin, generics.ListAPIView):
+  serializer_class = serializers.ReviewSerializer
+  permission_classes = (AllowAny,)
+  pagination_class = ReviewSearchPagination
+
+  def get_queryset(self):
+    return models.Review.objects.all()
+
+  def list(self, request, *args, **kwargs):
+    query = request.query_params.get('q', '')
+    if len(query) > settings.REVIEW_SEARCH_MAX_QUERY_LENGTH:
+      raise ValidationError(f'q can contain at most {settings.REVIEW_SEARCH_MAX_QUERY_LENGTH} characters.')
+
+    hits = self.paginate_queryset(search_reviews(query))
+    # ページ内のレビューをまとめて取得し、スコアの順に並べる
+    reviews = self.filter_queryset(self.get_queryset()).in_bulk([hit['review_id'] for hit in hits])
+    page = [reviews[hit['review_id']] for hit in hits if hit['review_id'] in reviews]
+    return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+#ランキングの件数（?limit=、REVIEW_LEADERBOARD_SIZE件まで）
+def get_leaderboard_limit(request, default=20):
+  try:
+    limit = int(request.query_params.get('limit', default))
+  except ValueError:
+    raise ValidationError('limit must be an integer.')
+  if not 1 <= limit <= settings.REVIEW_LEADERBOARD_SIZE:
+    raise ValidationError(f'limit must be between 1 and {settings.REVIEW_LEADERBOARD_SIZE}.')
+  return limit
+
+
+#期間内のいいね数ランキング（?period=week|month）
+#compact_review_rollupsで作成済みの順位表を返す
+class ReviewLeaderboardView(EagerLoadingMixin, generics.ListAPIView):
+  serializer_class = serializers.ReviewSerializer
+  permission_classes = (AllowAny,)
+
+  def get_queryset(self):
+    return models.Review.objects.all()
+
+  def list(self, request, *args, **kwargs):
+    period = request.query_params.get('period', 'week')
+    if period not in settings.REVIEW_LEADERBOARD_PERIODS:
+      raise ValidationError(f'period must be one of: {", ".join(settings.REVIEW_LEADERBOARD_PERIODS)}.')
+
+    entries = models.ReviewLeaderboardEntry.objects.filter(
+      period=period, rank__lte=get_leaderboard_limit(request)
+    ).order_by('rank')
+    reviews = self.filter_queryset(self.get_queryset()).in_bulk([entry.review_id for entry in entries])
+    entries = [entry for entry in entries if entry.review_id in reviews]
+    data = self.get_serializer([reviews[entry.review_id] for entry in entries], many=True).data
+    return Response({
+      'period': period,
+      'results': [
+        {'rank': entry.rank, 'score': entry.score, 'review': review}
+        for entry, review in zip(entries, data)
+      ],
+    })
+
+
+#レビュー数の多いアイテムのランキング
+class ItemLeaderboardView(generics.ListAPIView):
+  permission_classes = (AllowAny,)
+  authentication_classes = ()
+
+  def get_queryset(self):
+    return models.ItemReviewCount.objects.filter(review_count__gt=0, item__display=True) \
+      .select_related('item__brand', 'item__series__brand', 'item__position') \
+      .order_by('-review_count', 'item')
+
+  def list(self, request, *args, **kwargs):
+    rows = self.get_queryset()[:get_leaderboard_limit(request)]
+    data = ItemSerializer([row.item for row in rows], many=True).data
+    return Response({
+      'results': [
+        {'rank': rank, 'review_count': row.review_count, 'item': item}
+        for rank, (row, item) in enumerate(zip(rows, data), start=1)
+      ],
+    })
+
+
+#このレビューをいいねしたユーザーがいいねしている他のレビュー（build_recommendationsで作成済みの上位K件）
+class ReviewRecommendationView(EagerLoadingMixin, generics.ListAPIView):
+  serializer_class = serializers.ReviewSerializer
+  permission_classes = (AllowAny,)
+
+  def get_queryset(self):
+    # 推薦の行をreview_idの索引で引き、推薦されたレビューと結合して1回で取得する
+    return models.Review.objects.filter(recommended_for__review_id=self.kwargs['review_id']).annotate(
+      recommendation_rank=F('recommended_for__rank'),
+      recommendation_score=F('recommended_for__score'),
+    ).order_by('recommendation_rank')
+
+  def list(self, request, *args, **kwargs):
+    reviews = list(self.filter_queryset(self.get_queryset()))
+    data = self.get_serializer(reviews, many=True).data
+    return Response({
+      'results': [
+        {'score': review.recommendation_score, 'review': review_data}
+        for review, review_data in zip(reviews, data)
+      ],
+    })
+
+
+#このアイテムをレビューしたユーザーがレビューしている他のアイテム
+class ItemRecommendationView(generics.ListAPIView):
+  permission_classes = (AllowAny,)
+  authentication_classes = ()
+
+  def get_queryset(self):
+    queryset = Item.objects.filter(recommended_for__item_id=self.kwargs['item_id'], display=True).annotate(
+      recommendation_rank=F('recommended_for__rank'),
+      recommendation_score=F('recommended_for__score'),
+    ).order_by('recommendation_rank')
+    return ItemSerializer.setup_eager_loading(queryset)
+
+  def list(self, request, *args, **kwargs):
+    items = list(self.get_queryset())
+    data = ItemSerializer(items, many=True).data
+    return Response({
+      'results': [
+        {'score': item.recommendation_score, 'item': item_data}
+        for item, item_data in zip(items, data)
+      ],
+    })
 
 
 class CreateReviewView(generics.CreateAPIView):
   queryset = models.Review.objects.all()
   serializer_class = serializers.ReviewSerializer
   authentication_classes = (JWTAuthentication,)
-  parser_classes = (MultiPartParser, FormParser)
+  # 直接アップロードした画像のキー（image_key）だけを送る場合はJSONでもよい
+  parser_classes = (MultiPartParser, FormParser, JSONParser)
 
   def perform_create(self, serializer):
+    # 画像のリサイズは画像処理ジョブで行い、レビューは画像なしで先に保存する
     image = self.request.FILES.get('image')
-    image_file = None
-    if image:
-      with Image.open(image) as img:
-        resized_image = resize_image(img)
-      image_io = io.BytesIO()
-      resized_image.save(image_io, format='JPEG', quality=85)
-      image_io.seek(0)
-      image_file = InMemoryUploadedFile(
-        image_io,
-        None,
-        image.name,
-        'image/jpeg',
-        image_io.getbuffer().nbytes, None
-      )
+    serializer.validated_data.pop('image', None)
+    image_key = serializer.validated_data.pop('image_key', None)
 
     item_id = self.kwargs.get('item_id')
     with transaction.atomic():
-      review = serializer.save(user=self.request.user, image=image_file, item_id=item_id)
+      review = serializer.save(user=self.request.user, item_id=item_id)
 
       try:
         UserReview.objects.create(user=self.request.user, review=review)
       except Exception as e:
         raise ValidationError(f"Error creating UserReview: {str(e)}")
 
+      if image:
+        enqueue_image_job(review, 'image', image)
+      elif image_key:
+        enqueue_uploaded_image(review, 'image', image_key)
+
 
 #新規投稿、編集、削除
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
   queryset = models.Review.objects.all()
   serializer_class = serializers.ReviewSerializer
   authentication_classes = (JWTAuthentication,)
 
   def perform_update(self, serializer):
     review = serializer.instance
-    old_image = review.image
     new_image = self.request.FILES.get('image')
+    image_key = serializer.validated_data.pop('image_key', None)
 
-    if new_image:
-      # 新しい画像が提供された場合
-      if old_image:
-        # 古い画像をS3から削除
-        image_path = 'static/' + old_image.name
-        delete_image_from_s3(image_path)
-      with Image.open(new_image) as img:
-        resized_image = resize_image(img)
-      image_io = io.BytesIO()
-      resized_image.save(image_io, format='JPEG', quality=85)
-      image_io.seek(0)
-      image_file = InMemoryUploadedFile(
-        image_io,
-        None,
-        new_image.name,
-        'image/jpeg',
-        image_io.getbuffer().nbytes, None
-      )
-      serializer.validated_data['image'] = image_file
-    elif 'image' in serializer.validated_data and not new_image:
-      serializer.validated_data['image'] = None
-      # 投稿の画像が設定されておらず、既存の画像がある場合、画像を削除
-      if old_image:
-        image_path = 'static/' + old_image.name
-        delete_image_from_s3(image_path)
-      serializer.save()
-    else:
-      serializer.save()
-
-    # レビューの編集内容を保存
-    if not review.is_edited:
+    with transaction.atomic():
+      if new_image or image_key:
+        # 新しい画像が提供された場合、リサイズと古い画像の削除は画像処理ジョブで行う
+        serializer.validated_data.pop('image', None)
+      elif 'image' in serializer.validated_data:
+        serializer.validated_data['image'] = None
+        serializer.validated_data['image_renditions'] = {}
+        cancel_image_jobs(review, 'image')
+        # 投稿の画像が設定されておらず、既存の画像がある場合、画像（レンディションを含む）を削除
+        release_image_files(review)
+
+      # レビューの編集内容を保存
       serializer.save(is_edited=True)
-    else:
-      serializer.save()
+      if new_image:
+        enqueue_image_job(review, 'image', new_image)
+      elif image_key:
+        enqueue_uploaded_image(review, 'image', image_key)
 
   def perform_destroy(self, instance):
-    # レビューに関連する画像があれば、それをS3から削除
-    if instance.image:
-      image_path = 'static/' + instance.image.name
-      delete_image_from_s3(image_path)
-
-    # データベースからレビューを削除
+    # データベースからレビューを削除し、関連する画像（レンディションを含む）の参照を解放する
     with transaction.atomic():
+      release_image_files(instance)
       super().perform_destroy(instance)
       
 
@@ -173,14 +331,16 @@ class GetFavoriteReviewCountView(generics.RetrieveAPIView):
 
 
 #ログインユーザーのお気に入りをしたレビュー一覧
-class GetFavoriteListView(generics.ListAPIView):
+class GetFavoriteListView(ReviewListETagMixin, ReviewListResponseMixin, EagerLoadingMixin, generics.ListAPIView):
   serializer_class = serializers.ReviewSerializer
   authentication_classes = (JWTAuthentication,)
+  pagination_class = KeysetCursorPagination
+  stream_response = True
 
   def get_queryset(self):
     user = self.request.user
     favorite_review_ids = models.Favorite.objects.filter(user=user).values_list('review_id', flat=True)
-    return models.Review.objects.filter(id__in=favorite_review_ids).order_by('-created_at')
+    return models.Review.objects.filter(id__in=favorite_review_ids).order_by('-created_at', '-id')
 
 #reviewIdを受け取り、それと一致するレビューのいいねの数を返す
 class GetFavoriteReviewCountView(generics.RetrieveAPIView):
@@ -197,6 +357,33 @@ class GetFavoriteReviewCountView(generics.RetrieveAPIView):
     count = models.Favorite.objects.filter(review=review).count()
     return {'favorites_count': count}
 
+#複数のreviewIdを受け取り、それぞれのいいね状態といいね数をまとめて返す
+#例: ?ids=<id1>,<id2> → {<id1>: {'isFavorite': bool, 'favorites_count': int}, ...}
+class GetFavoriteStateListView(APIView):
+  permission_classes = (AllowAny,)
+  authentication_classes = (JWTAuthentication,)
+  max_review_ids = 100
+
+  def get_review_ids(self):
+    raw_ids = [review_id for review_id in self.request.query_params.get('ids', '').split(',') if review_id]
+    if len(raw_ids) > self.max_review_ids:
+      raise ValidationError(f'ids can contain at most {self.max_review_ids} review ids.')
+    try:
+      return [models.Review._meta.pk.to_python(review_id) for review_id in raw_ids]
+    except DjangoValidationError:
+      raise ValidationError('ids must be a comma separated list of review ids.')
+
+  def get(self, request, *args, **kwargs):
+    review_ids = self.get_review_ids()
+    if not review_ids:
+      return Response({})
+    rows = models.Review.objects.filter(id__in=review_ids).with_favorite_state(request.user)\
+      .values_list('id', 'favorites_count', 'is_favorite')
+    return Response({
+      str(review_id): {'isFavorite': is_favorite, 'favorites_count': favorites_count}
+      for review_id, favorites_count, is_favorite in rows
+    })
+
 #review_idとuser_idを受け取り、レビューにいいねをしているかしていないかを返す
 class GetFavoriteReviewView(generics.RetrieveAPIView):
   serializer_class = serializers.FavoriteSerializer
@@ -216,21 +403,28 @@ class GetFavoriteReviewView(generics.RetrieveAPIView):
       
 
 #いいね登録削除機能
+#登録済みの登録、未登録の削除は何もせず、更新後のいいね数を返す
 class FavoriteViewSet(viewsets.ViewSet):
   serializer_class = serializers.FavoriteSerializer
   authentication_classes = (JWTAuthentication,)
 
   def create(self, request, review_id=None):
-    review = get_object_or_404(models.Review, pk=review_id)
-    models.Favorite.objects.create(user=request.user, review=review)
-    review.favorites_count = models.Favorite.objects.filter(review=review).count()
-    review.save()
-    return Response({'status': 'favorite set'}, status=status.HTTP_201_CREATED)
+    created, favorites_count = models.Favorite.objects.add(request.user, self.get_review_pk(review_id))
+    if favorites_count is None:
+      raise NotFound('Review does not exist.')
+    return Response(
+      {'status': 'favorite set', 'favorites_count': favorites_count},
+      status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+    )
 
   def destroy(self, request, review_id=None):
-    review = get_object_or_404(models.Review, pk=review_id)
-    favorite = get_object_or_404(models.Favorite, user=request.user, review=review)
-    favorite.delete()
-    review.favorites_count = models.Favorite.objects.filter(review=review).count()
-    review.save()
-    return Response({'status': 'favorite removed'}, status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    _, favorites_count = models.Favorite.objects.remove(request.user, self.get_review_pk(review_id))
+    if favorites_count is None:
+      raise NotFound('Review does not exist.')
+    return Response({'status': 'favorite removed', 'favorites_count': favorites_count}, status=status.HTTP_200_OK)
+
+  def get_review_pk(self, review_id):
+    try:
+      return models.Review._meta.pk.to_python(review_id)
+    except DjangoValidationError:
+      raise NotFound('Review does not exist.')
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'review',
     'account',
     'item',
+    'images',
     'django.contrib.admin',
     'django.contrib.auth',
     'rest_framework_simplejwt.token_blacklist',
@@ -180,15 +181,22 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'account.CustomUser'
 
+# メディアファイル（画像）の保存先
+# 's3': S3（本番）、'local': MEDIA_ROOTのディスク、'memory': プロセス内のメモリ
+# local/memoryはAWSなしでの開発・負荷試験・ベンチマーク用で、AWSの設定は不要
+MEDIA_STORAGE = env('MEDIA_STORAGE', default='s3')
+
 # AWS-Settings
-AWS_ACCESS_KEY_ID = os.environ['AWS_ACCESS_KEY_ID']
-AWS_SECRET_ACCESS_KEY = os.environ['AWS_SECRET_ACCESS_KEY']
+AWS_ACCESS_KEY_ID = os.environ['AWS_ACCESS_KEY_ID'] if MEDIA_STORAGE == 's3' else os.environ.get('AWS_ACCESS_KEY_ID')
+AWS_SECRET_ACCESS_KEY = os.environ['AWS_SECRET_ACCESS_KEY'] if MEDIA_STORAGE == 's3' else os.environ.get('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME')
 AWS_S3_CUSTOM_DOMAIN = '%s.s3.amazonaws.com' % AWS_STORAGE_BUCKET_NAME
 AWS_LOCATION = 'static' # s3バケット上のベースとなるファイルパス
 AWS_S3_REGION_NAME=os.environ.get('AWS_S3_REGION_NAME')
 AWS_S3_URL = '%s.s3.amazonaws.com' % AWS_STORAGE_BUCKET_NAME
 AWS_S3_SIGNATURE_VERSION = 's3v4'
+# プロセス内で共有するS3クライアントの最大接続数（reviewsite.utils.storage.get_s3_client）
+AWS_S3_MAX_POOL_CONNECTIONS = env.int('AWS_S3_MAX_POOL_CONNECTIONS', default=20)
 
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR,'static'),
@@ -209,9 +217,16 @@ MEDIA_ROOT = f'https://{AWS_S3_CUSTOM_DOMAIN}/static/{MEDIAFILES_LOCATION}/'
 STATIC_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/static/'
 STATIC_ROOT = 'https://%s/%s/static/' % (AWS_S3_CUSTOM_DOMAIN,STATICFILES_LOCATION)
 
-STORAGES = {
-    "default": {
-        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+# MEDIA_STORAGE='local'の保存先
+MEDIA_LOCAL_ROOT = env('MEDIA_LOCAL_ROOT', default=os.path.join(BASE_DIR, 'media'))
+if MEDIA_STORAGE != 's3':
+    MEDIA_URL = '/media/'
+    MEDIA_ROOT = MEDIA_LOCAL_ROOT
+
+# MEDIA_STORAGEごとのストレージ（いずれもsave/url/delete/delete_manyを持つ）
+MEDIA_STORAGE_BACKENDS = {
+    "s3": {
+        "BACKEND": "reviewsite.utils.storage.MediaStorage",
         "OPTIONS": {
             "bucket_name": AWS_STORAGE_BUCKET_NAME,
             "region_name": AWS_S3_REGION_NAME,
@@ -225,12 +240,122 @@ STORAGES = {
             },
         },
     },
+    "local": {
+        "BACKEND": "reviewsite.utils.storage.LocalMediaStorage",
+        "OPTIONS": {
+            "location": MEDIA_LOCAL_ROOT,
+            "base_url": "/media/",
+        },
+    },
+    "memory": {
+        "BACKEND": "reviewsite.utils.storage.InMemoryMediaStorage",
+        "OPTIONS": {
+            "base_url": "/media/",
+        },
+    },
+}
+
+STORAGES = {
+    "default": MEDIA_STORAGE_BACKENDS[MEDIA_STORAGE],
     "staticfiles": {
         "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
     },
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# テスト時はメディアをメモリ上に保存する（reviewsite.utils.testing.TestRunner）
+TEST_RUNNER = 'reviewsite.utils.testing.TestRunner'
+
+# CACHE_URL未設定時はプロセスごとのメモリキャッシュ（複数ワーカーで共有する場合はredis://等を指定）
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+# アイテムカタログのキャッシュ有効期限（秒）。Noneは無期限（更新時にバージョンで無効化）
+# バージョンはDBに置くため、プロセスごとのキャッシュでも他のワーカーでの更新が反映される
+CATALOG_CACHE_TIMEOUT = None
+# カタログのバージョンをキャッシュする秒数（キャッシュ済みのレスポンスはクエリなしで返す）
+# 他のワーカーでの更新は最大でこの秒数だけ遅れて反映される
+CATALOG_VERSION_CACHE_TIMEOUT = env.int('CATALOG_VERSION_CACHE_TIMEOUT', default=5)
+
+# レビュー一覧をReviewCardSerializer（values()から直接組み立てる高速版）で返す
+REVIEW_FAST_SERIALIZER = env.bool('REVIEW_FAST_SERIALIZER', default=False)
+
+# マイレビュー・他ユーザーのレビュー・お気に入り一覧を、全件を溜めずに少しずつ返す
+REVIEW_STREAMING_RESPONSE = env.bool('REVIEW_STREAMING_RESPONSE', default=False)
+REVIEW_STREAMING_CHUNK_SIZE = 200
+# ストリーミング時のJSONエンコーダー（'json' または 'orjson'）
+STREAMING_JSON_ENCODER = env('STREAMING_JSON_ENCODER', default='json')
+
+# レビュー検索（review.search）
+# タイトルに含まれるn-gramの重み（本文は1）と、検索語の最大文字数
+REVIEW_SEARCH_TITLE_WEIGHT = 3
+REVIEW_SEARCH_MAX_QUERY_LENGTH = 50
+
+# ランキング（review.rollups）
+# いいね数ランキングの期間（名前: 日数）と、保持・返却する件数の上限
+# compact_review_rollupsを定期実行して作り直す
+REVIEW_LEADERBOARD_PERIODS = {'week': 7, 'month': 30}
+REVIEW_LEADERBOARD_SIZE = 100
+
+# トレンド順（review.trending）
+# いいねの重みが半分になるまでの時間と、スコアに含めるいいねの期間
+# recompute_trending_scoresを定期実行して再計算する
+REVIEW_TRENDING_HALF_LIFE_HOURS = 48
+REVIEW_TRENDING_WINDOW_DAYS = 14
+
+# 共起による推薦（review.recommendations）
+# 対象ごとに保存する件数、1回に処理する対象の数、共起を数えないユーザーの基準（いいね・レビューの数）、
+# 推薦に必要な最小の共起ユーザー数。build_recommendationsを定期実行して作り直す
+RECOMMENDATION_TOP_K = 10
+RECOMMENDATION_CHUNK_SIZE = 500
+RECOMMENDATION_MAX_USER_ACTIONS = 500
+RECOMMENDATION_MIN_COOCCURRENCE = 1
+
+# いいね数の更新をプロセス内にバッファし、FAVORITE_COUNTER_FLUSH_INTERVAL秒ごとにまとめて反映する
+FAVORITE_COUNTER_BUFFER = env.bool('FAVORITE_COUNTER_BUFFER', default=False)
+FAVORITE_COUNTER_FLUSH_INTERVAL = env.int('FAVORITE_COUNTER_FLUSH_INTERVAL', default=5)
+# アップロード画像の処理方法
+# 'background': process_image_jobsワーカーで処理、'inline': リクエストのコミット後に同じプロセスで処理
+IMAGE_PROCESSING_MODE = env('IMAGE_PROCESSING_MODE', default='background')
+IMAGE_JOB_MAX_ATTEMPTS = env.int('IMAGE_JOB_MAX_ATTEMPTS', default=3)
+IMAGE_JOB_TIMEOUT = env.int('IMAGE_JOB_TIMEOUT', default=300)
+# アップロード画像から作るレンディション（サイズ(px)と形式）
+# 画像フィールドにはJPEGの最大サイズを設定する
+IMAGE_RENDITION_SIZES = (96, 256, 500)
+IMAGE_RENDITION_FORMATS = ('webp', 'jpeg')
+IMAGE_RENDITION_QUALITY = 85
+# レンディションは内容のハッシュをキーにしてIMAGE_BLOB_PREFIX以下に保存する（内容が変わらないため長期間キャッシュ可能）
+IMAGE_BLOB_PREFIX = 'images/'
+IMAGE_BLOB_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# ブラウザからストレージへ直接アップロードする元画像（images.uploads）
+# IMAGE_UPLOAD_PREFIX以下のキーは処理後に削除される。使われなかったものはS3のライフサイクルルールで期限切れにする
+IMAGE_UPLOAD_PREFIX = 'uploads/direct/'
+IMAGE_UPLOAD_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+IMAGE_UPLOAD_MAX_SIZE = env.int('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024)
+IMAGE_UPLOAD_EXPIRES = 600
+# アップロード画像の上限（IMAGE_UPLOAD_MAX_SIZEはmultipartのアップロードにも適用する）
+# 形式と画素数はデコード前にヘッダーで確認し、超えた場合は400にする（サイズ超過は413）
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'WEBP')
+IMAGE_MAX_PIXELS = env.int('IMAGE_MAX_PIXELS', default=40_000_000)
+# multipartのファイルはサイズを数えながら受け取り、FILE_UPLOAD_MAX_MEMORY_SIZEを超える分は一時ファイルに書き出す
+FILE_UPLOAD_HANDLERS = [
+    'reviewsite.utils.upload_handlers.MaxFileSizeUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+# 削除待ちのファイル（images.PendingDeletion）の再試行
+# 失敗するたびに待ち時間を倍にし（上限IMAGE_DELETION_MAX_DELAY秒）、IMAGE_DELETION_MAX_ATTEMPTS回でdeadにする
+IMAGE_DELETION_RETRY_DELAY = 30
+IMAGE_DELETION_MAX_DELAY = 3600
+IMAGE_DELETION_MAX_ATTEMPTS = 8
+# 画像処理プール（プロセス数、待機できるタスク数、1件の処理待ちの上限秒数、混雑時のRetry-After秒数）
+# IMAGE_SERVICE_WORKERS=0の場合はプロセスを使わずに呼び出し元で処理する
+IMAGE_SERVICE_WORKERS = env.int('IMAGE_SERVICE_WORKERS', default=os.cpu_count() or 1)
+IMAGE_SERVICE_MAX_QUEUE = env.int('IMAGE_SERVICE_MAX_QUEUE', default=IMAGE_SERVICE_WORKERS * 2)
+IMAGE_SERVICE_TIMEOUT = env.int('IMAGE_SERVICE_TIMEOUT', default=60)
+IMAGE_SERVICE_RETRY_AFTER = env.int('IMAGE_SERVICE_RETRY_AFTER', default=5)
 SUPERUSER_EMAIL = env('SUPERUSER_EMAIL')
 SUPERUSER_PASSWORD = env('SUPERUSER_PASSWORD')
 
@@ -10,6 +10,13 @@ urlpatterns = [
     path('api/verify/', TokenVerifyView.as_view()),
     path('api/auth/', include('account.urls',)),
     path('api/item/',include('item.urls')),
+    path('api/images/', include('images.urls')),
     path('api/', include('review.urls')), 
     path('admin/', admin.site.urls),
 ] 
+
+# MEDIA_STORAGE='local'の場合はディスクに保存したメディアファイルをDjangoから配信する（開発・負荷試験用）
+if settings.MEDIA_STORAGE == 'local':
+    urlpatterns += [
+        re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_LOCAL_ROOT}),
+    ]
@@ -0,0 +1,10 @@
+# シリアライザが宣言したselect_related / prefetch_relatedをビューのクエリセットに適用する
+# シリアライザ側で setup_eager_loading(queryset, request=None) を定義しておく
+class EagerLoadingMixin:
+  def filter_queryset(self, queryset):
+    queryset = super().filter_queryset(queryset)
+    serializer_class = self.get_serializer_class()
+    setup_eager_loading = getattr(serializer_class, 'setup_eager_loading', None)
+    if setup_eager_loading is not None:
+      queryset = setup_eager_loading(queryset, request=self.request)
+    return queryset
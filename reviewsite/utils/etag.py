@@ -0,0 +1,35 @@
+import hashlib
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# 値を連結したハッシュから強いETagを作る
+def make_etag(*parts):
+  return quote_etag(hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+# GETでETagを返し、If-None-Matchが一致すればシリアライズせずに304を返す
+# ビュー側でget_etag(request, *args, **kwargs)を定義する（レスポンス本体を生成せずに求められる値から作る）
+class ETagMixin:
+  def get_etag(self, request, *args, **kwargs):
+    raise NotImplementedError('get_etag() must be implemented.')
+
+  def get(self, request, *args, **kwargs):
+    etag = make_etag(request.get_full_path(), *self.get_etag(request, *args, **kwargs))
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+
+    if etag in if_none_match:
+      response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+      response = super().get(request, *args, **kwargs)
+      # If-None-Match: * は対象が存在する（200を返せる）場合だけ304にする
+      if '*' in if_none_match and response.status_code == status.HTTP_200_OK:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+      response['ETag'] = etag
+    # ユーザーによって内容（is_my_review, is_favorite）が変わるため
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -1,48 +1,116 @@
 from PIL import Image, ExifTags
 import io
-from django.core.files.uploadedfile import InMemoryUploadedFile
-from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.exceptions import ValidationError
-import boto3
-from botocore.exceptions import ClientError
-from django.conf import settings
 
 
-def rotate_image_based_on_exif(image):
+# EXIFのOrientationタグ番号（ExifTags.TAGSを毎回探索しないよう読み込み時に一度だけ求める）
+ORIENTATION_TAG = next(key for key, value in ExifTags.TAGS.items() if value == 'Orientation')
+
+# Orientationの値ごとの変換（2/4/5/7は反転を含む）
+ORIENTATION_TRANSPOSE = {
+  2: Image.Transpose.FLIP_LEFT_RIGHT,
+  3: Image.Transpose.ROTATE_180,
+  4: Image.Transpose.FLIP_TOP_BOTTOM,
+  5: Image.Transpose.TRANSPOSE,
+  6: Image.Transpose.ROTATE_270,
+  7: Image.Transpose.TRANSVERSE,
+  8: Image.Transpose.ROTATE_90,
+}
+
+
+def get_exif_orientation(image):
   try:
-    exif = image._getexif()
-    if exif is not None:
-      orientation_key = next((key for key, value in ExifTags.TAGS.items() if value == 'Orientation'), None)
-      if orientation_key is not None:
-        orientation = exif.get(orientation_key)
-        if orientation == 3:
-          image = image.rotate(180, expand=True)
-        elif orientation == 6:
-          image = image.rotate(270, expand=True)
-        elif orientation == 8:
-          image = image.rotate(90, expand=True)
-  except (AttributeError, KeyError, IndexError, TypeError):
-    pass  
+    return image.getexif().get(ORIENTATION_TAG)
+  except (AttributeError, KeyError, IndexError, TypeError, ValueError, SyntaxError):
+    return None
 
+
+def rotate_image_based_on_exif(image, orientation=None):
+  if orientation is None:
+    orientation = get_exif_orientation(image)
+  method = ORIENTATION_TRANSPOSE.get(orientation)
+  if method is not None:
+    image = image.transpose(method)
   return image
 
+# 画素数が多すぎる画像（解凍爆弾を含む）
+class ImageTooLarge(ValueError):
+  pass
+
+
+# 受け付けない形式の画像
+class UnsupportedImageFormat(ValueError):
+  pass
+
+
+# 開いただけの画像（ヘッダーのみ読み込み済み）の画素数を確認する
+def check_image_pixels(image, max_pixels):
+  width, height = image.size
+  if max_pixels and width * height > max_pixels:
+    raise ImageTooLarge(f'Image has too many pixels: {width}x{height} (max {max_pixels}).')
+
+
+# ピクセルをデコードせずに、ヘッダーから画像の形式とサイズを読み取る
+# 画素数がmax_pixelsを超える場合はImageTooLarge、画像として読めない場合はそのままPILの例外を送出する
+def inspect_image(fp, max_pixels=None):
+  try:
+    with Image.open(fp) as img:
+      check_image_pixels(img, max_pixels)
+      return img.format, img.size
+  except Image.DecompressionBombError as e:
+    raise ImageTooLarge(str(e))
+
+
 # 画像のリサイズ処理
+# JPEGはdraftで目標サイズに近い解像度までデコード時に縮小し、
+# 向きの補正は縮小後の小さい画像に対して行う
 def resize_image(image, size=500):
-  image = rotate_image_based_on_exif(image)
+  orientation = get_exif_orientation(image)
+  image.draft('RGB', (size, size))
   image.thumbnail((size, size))
+  image = rotate_image_based_on_exif(image, orientation)
+  return pad_image(image, size)
+
+
+# 白背景の正方形の中央に配置する
+def pad_image(image, size):
   new_image = Image.new("RGB", (size, size), (255, 255, 255))
   new_image.paste(image, (int((size - image.size[0]) / 2), int((size - image.size[1]) / 2)))
   return new_image
 
 
-def delete_image_from_s3(image_path):
-  try:
-    s3_client = boto3.client(
-      's3',
-      aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-      aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    )
-    s3_client.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=image_path)
-  except ClientError as e:
-    e
-  return None
\ No newline at end of file
+# 複数サイズ・複数形式の画像（レンディション）を1回のデコードで作る
+# 戻り値は {(サイズ, 形式): バイト列}
+# デコードする前に形式がallowed_formatsに含まれ、画素数がmax_pixels以下であることを確認する
+# （直接アップロードされた画像はここで初めて検証される）
+RENDITION_FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+def render_image_set(data, sizes, formats, quality=85, max_pixels=None, allowed_formats=None):
+  renditions = {}
+  largest = max(sizes)
+  with Image.open(io.BytesIO(data)) as img:
+    if allowed_formats and img.format not in allowed_formats:
+      raise UnsupportedImageFormat(f'Unsupported image format: {img.format}')
+    check_image_pixels(img, max_pixels)
+    orientation = get_exif_orientation(img)
+    img.draft('RGB', (largest, largest))
+    img.thumbnail((largest, largest))
+    image = rotate_image_based_on_exif(img, orientation)
+    # 大きいサイズから順に、前のサイズの画像を縮小していく
+    for size in sorted(sizes, reverse=True):
+      image.thumbnail((size, size))
+      padded = pad_image(image, size)
+      for image_format in formats:
+        image_io = io.BytesIO()
+        padded.save(image_io, format=RENDITION_FORMATS[image_format], quality=quality)
+        renditions[(size, image_format)] = image_io.getvalue()
+  return renditions
+
+
+# 画像のバイト列をリサイズし、JPEGのバイト列を返す
+def resize_image_bytes(data, size=500, quality=85):
+  with Image.open(io.BytesIO(data)) as img:
+    resized_image = resize_image(img, size)
+  image_io = io.BytesIO()
+  resized_image.save(image_io, format='JPEG', quality=quality)
+  return image_io.getvalue()
+
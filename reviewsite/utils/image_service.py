@@ -0,0 +1,97 @@
+import asyncio
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# 画像処理プールが埋まっている場合のエラー（DRFがwaitをRetry-Afterヘッダーにする）
+class ImageServiceBusy(APIException):
+  status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+  default_detail = '画像処理が混み合っています。しばらくしてから再度お試しください。'
+  default_code = 'image_service_busy'
+
+  def __init__(self, wait, detail=None, code=None):
+    super().__init__(detail, code)
+    self.wait = wait
+
+
+# 画像のデコード・リサイズ・エンコードを別プロセスで行うサービス
+# PILの処理はGILを握るため、リクエストのスレッドやワーカーのスレッドでは並列化できない
+# 実行中＋待機中のタスク数をmax_workers + max_queueまでに制限し、超えた分は受け付けない
+class ImageProcessingService:
+  def __init__(self, max_workers, max_queue, retry_after=5):
+    self.max_workers = max_workers
+    self.retry_after = retry_after
+    self._slots = threading.BoundedSemaphore(max_workers + max_queue) if max_workers else None
+    self._executor = None
+    self._lock = threading.Lock()
+
+  @property
+  def executor(self):
+    with self._lock:
+      if self._executor is None:
+        # スレッド起動後のforkはデッドロックの恐れがあるためspawnを使う
+        self._executor = ProcessPoolExecutor(
+          max_workers=self.max_workers,
+          mp_context=multiprocessing.get_context('spawn'),
+        )
+      return self._executor
+
+  # funcを処理プールに投入してFutureを返す
+  # block=Falseの場合、空きがなければImageServiceBusyを送出する（ワーカーはblock=Trueで待つ）
+  def submit(self, func, *args, block=False):
+    if self._slots is None:
+      # max_workers=0の場合はプロセスを使わずにその場で実行する
+      return self._run_in_process(func, *args)
+
+    if not self._slots.acquire(blocking=block):
+      raise ImageServiceBusy(self.retry_after)
+    try:
+      future = self.executor.submit(func, *args)
+    except Exception:
+      self._slots.release()
+      raise
+    future.add_done_callback(lambda f: self._slots.release())
+    return future
+
+  def run(self, func, *args, timeout=None, block=False):
+    return self.submit(func, *args, block=block).result(timeout)
+
+  async def arun(self, func, *args, block=False):
+    return await asyncio.wrap_future(self.submit(func, *args, block=block))
+
+  def shutdown(self):
+    with self._lock:
+      if self._executor is not None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+  @staticmethod
+  def _run_in_process(func, *args):
+    future = Future()
+    try:
+      future.set_result(func(*args))
+    except Exception as e:
+      future.set_exception(e)
+    return future
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_image_service():
+  global _service
+  with _service_lock:
+    if _service is None:
+      _service = ImageProcessingService(
+        settings.IMAGE_SERVICE_WORKERS,
+        settings.IMAGE_SERVICE_MAX_QUEUE,
+        settings.IMAGE_SERVICE_RETRY_AFTER,
+      )
+      atexit.register(_service.shutdown)
+  return _service
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import math
+import uuid
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# (created_at, id)をキーにしたキーセットページネーション
+# クエリパラメータにcursorが含まれる場合のみ有効（?cursor= で1ページ目）
+# key_fieldとformat_key / parse_keyを変えると、created_at以外の列の降順にも使える
+class KeysetCursorPagination(BasePagination):
+  cursor_query_param = 'cursor'
+  page_size = 20
+  key_field = 'created_at'
+  ordering = ('-created_at', '-id')
+  invalid_cursor_message = 'Invalid cursor'
+
+  def paginate_queryset(self, queryset, request, view=None):
+    if self.cursor_query_param not in request.query_params:
+      return None
+
+    self.request = request
+    position = self.decode_cursor(request.query_params[self.cursor_query_param])
+    queryset = queryset.order_by(*self.ordering)
+    if position is not None:
+      key, pk = position
+      queryset = queryset.filter(
+        Q(**{f'{self.key_field}__lt': key}) | Q(**{self.key_field: key, 'id__lt': pk})
+      )
+
+    # 1件多く取得して次ページの有無を判定する
+    results = list(queryset[:self.page_size + 1])
+    self.has_next = len(results) > self.page_size
+    self.page = results[:self.page_size]
+    return self.page
+
+  def get_paginated_response(self, data):
+    return Response({
+      'next': self.get_next_link(),
+      'results': data,
+    })
+
+  def get_paginated_response_schema(self, schema):
+    return {
+      'type': 'object',
+      'properties': {
+        'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+        'results': schema,
+      },
+    }
+
+  def get_next_link(self):
+    if not self.has_next:
+      return None
+    last = self.page[-1]
+    url = self.request.build_absolute_uri()
+    return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last))
+
+  # モデルインスタンスとvalues()の行（dict）のどちらにも対応
+  def encode_cursor(self, instance):
+    if isinstance(instance, dict):
+      key, pk = instance[self.key_field], instance['id']
+    else:
+      key, pk = getattr(instance, self.key_field), instance.pk
+    raw = f'{self.format_key(key)}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+  def decode_cursor(self, encoded):
+    if not encoded:
+      return None
+    try:
+      raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+      key, pk = raw.split('|', 1)
+      key = self.parse_key(key)
+      pk = uuid.UUID(pk)
+    except (TypeError, ValueError, binascii.Error, UnicodeError):
+      raise NotFound(self.invalid_cursor_message)
+    if key is None:
+      raise NotFound(self.invalid_cursor_message)
+    return key, pk
+
+  def format_key(self, created_at):
+    return created_at.isoformat()
+
+  # 不正な値の場合はNoneを返すかValueErrorを送出する
+  def parse_key(self, raw):
+    return parse_datetime(raw)
+
+
+# (trending_score, id)の降順のキーセットページネーション（トレンド順の一覧用）
+class TrendingCursorPagination(KeysetCursorPagination):
+  key_field = 'trending_score'
+  ordering = ('-trending_score', '-id')
+
+  # reprは元のfloatに戻せる最短の表記
+  def format_key(self, score):
+    return repr(float(score))
+
+  def parse_key(self, raw):
+    score = float(raw)
+    return score if math.isfinite(score) else None
+
+
+# 検索結果など、(score, id)の降順に並べた行（values()のdict）のキーセットページネーション
+# cursorがなくても常にページ単位で返す
+class RankedCursorPagination(KeysetCursorPagination):
+  score_field = 'score'
+  pk_field = 'id'
+
+  def paginate_queryset(self, queryset, request, view=None):
+    self.request = request
+    position = self.decode_cursor(request.query_params.get(self.cursor_query_param, ''))
+    queryset = queryset.order_by(f'-{self.score_field}', f'-{self.pk_field}')
+    if position is not None:
+      score, pk = position
+      queryset = queryset.filter(
+        Q(**{f'{self.score_field}__lt': score}) | Q(**{self.score_field: score, f'{self.pk_field}__lt': pk})
+      )
+
+    results = list(queryset[:self.page_size + 1])
+    self.has_next = len(results) > self.page_size
+    self.page = results[:self.page_size]
+    return self.page
+
+  def encode_cursor(self, row):
+    raw = f'{row[self.score_field]}|{row[self.pk_field]}'
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+  def decode_cursor(self, encoded):
+    if not encoded:
+      return None
+    try:
+      raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+      score, pk = raw.split('|', 1)
+      return int(score), uuid.UUID(pk)
+    except (TypeError, ValueError, binascii.Error, UnicodeError):
+      raise NotFound(self.invalid_cursor_message)
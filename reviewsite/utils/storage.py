@@ -0,0 +1,102 @@
+import threading
+import boto3
+from botocore.config import Config
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, InMemoryStorage
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+# delete_objectsで一度に削除できるキーの上限
+S3_DELETE_BATCH_SIZE = 1000
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+# プロセス内で共有するS3クライアント（接続はクライアント内でプールされ、再利用される）
+# boto3のクライアントは作成後はスレッドセーフだが、作成はスレッドセーフではないためロックして1回だけ作る
+def get_s3_client():
+  global _s3_client
+  if _s3_client is None:
+    with _s3_client_lock:
+      if _s3_client is None:
+        _s3_client = boto3.session.Session().client(
+          's3',
+          aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+          aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+          region_name=settings.AWS_S3_REGION_NAME,
+          config=Config(
+            max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+            retries={'max_attempts': 3, 'mode': 'standard'},
+          ),
+        )
+  return _s3_client
+
+
+# キーをS3_DELETE_BATCH_SIZE件ずつdelete_objectsで削除し、削除できなかったキーのエラーを返す
+def delete_s3_objects(keys, bucket=None):
+  client = get_s3_client()
+  bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+  keys = list(dict.fromkeys(keys))
+  errors = []
+  for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+    batch = keys[start:start + S3_DELETE_BATCH_SIZE]
+    response = client.delete_objects(
+      Bucket=bucket,
+      Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+    )
+    errors.extend(response.get('Errors', []))
+  return errors
+
+
+# 内容のハッシュをキーにした画像（IMAGE_BLOB_PREFIX以下）は内容が変わらないため、長期間キャッシュさせる
+class MediaStorage(S3Boto3Storage):
+  def get_object_parameters(self, name):
+    params = super().get_object_parameters(name)
+    # nameはlocationを含むキー（例: static/images/3f/3fa9...c1.webp）
+    if name.startswith(self._normalize_name(clean_name(settings.IMAGE_BLOB_PREFIX))):
+      params['CacheControl'] = settings.IMAGE_BLOB_CACHE_CONTROL
+    return params
+
+  # 複数のファイルをまとめて削除し、削除できなかったファイルの {名前: エラー} を返す
+  def delete_many(self, names):
+    keys = {self._normalize_name(clean_name(name)): name for name in names}
+    errors = delete_s3_objects(keys, self.bucket_name)
+    return {keys[error['Key']]: error.get('Message', error.get('Code', '')) for error in errors}
+
+  # ブラウザから直接アップロードするための署名付きPOST（url, fields）を作る
+  # Content-Typeとサイズの上限はポリシーの条件に含め、S3側で検証させる
+  def presigned_post(self, name, content_type, max_size, expires):
+    post = get_s3_client().generate_presigned_post(
+      Bucket=self.bucket_name,
+      Key=self._normalize_name(clean_name(name)),
+      Fields={'Content-Type': content_type},
+      Conditions=[
+        {'Content-Type': content_type},
+        ['content-length-range', 1, max_size],
+      ],
+      ExpiresIn=expires,
+    )
+    return post['url'], post['fields']
+
+
+# 1件ずつ削除するdelete_many（戻り値はMediaStorage.delete_manyと同じ {名前: エラー}）
+class DeleteManyMixin:
+  def delete_many(self, names):
+    errors = {}
+    for name in names:
+      try:
+        self.delete(name)
+      except Exception as e:
+        errors[name] = str(e)
+    return errors
+
+
+# MEDIA_ROOTのディスクに保存するストレージ（MEDIA_STORAGE='local'）
+class LocalMediaStorage(DeleteManyMixin, FileSystemStorage):
+  pass
+
+
+# プロセス内のメモリに保存するストレージ（MEDIA_STORAGE='memory'、プロセスを終了すると消える）
+class InMemoryMediaStorage(DeleteManyMixin, InMemoryStorage):
+  pass
@@ -0,0 +1,53 @@
+from itertools import islice
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+
+# 1件分のデータをJSONのバイト列にする関数を返す（STREAMING_JSON_ENCODERで切り替え）
+# 'json'はJSONRendererと同じ出力、'orjson'はorjsonがインストールされている場合のみ使える高速版
+def get_json_encoder():
+  encoder = getattr(settings, 'STREAMING_JSON_ENCODER', 'json')
+  if encoder == 'orjson':
+    if orjson is None:
+      raise ImproperlyConfigured('STREAMING_JSON_ENCODER = "orjson" requires the orjson package.')
+    default = JSONEncoder().default
+    return lambda data: orjson.dumps(data, default=default)
+  if encoder != 'json':
+    raise ImproperlyConfigured(f'Unknown STREAMING_JSON_ENCODER: {encoder}')
+
+  encoder = JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+  def encode(data):
+    # JSONRendererと同様にU+2028/U+2029をエスケープする
+    ret = encoder.encode(data).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+    return ret.encode('utf-8')
+  return encode
+
+
+# クエリセットをchunk_size件ずつ取得・シリアライズしながらJSON配列として返すレスポンス
+# serialize_chunkは行のリストを受け取り、シリアライズ済みのリストを返す
+class StreamingJSONListResponse(StreamingHttpResponse):
+  def __init__(self, queryset, serialize_chunk, chunk_size=200, **kwargs):
+    kwargs.setdefault('content_type', 'application/json')
+    super().__init__(self.stream(queryset, serialize_chunk, chunk_size), **kwargs)
+
+  @staticmethod
+  def stream(queryset, serialize_chunk, chunk_size):
+    encode = get_json_encoder()
+    rows = queryset.iterator(chunk_size=chunk_size)
+    separator = b'['
+    while True:
+      chunk = list(islice(rows, chunk_size))
+      if not chunk:
+        break
+      encoded = [encode(data) for data in serialize_chunk(chunk)]
+      yield separator + b','.join(encoded)
+      separator = b','
+    yield b'[]' if separator == b'[' else b']'
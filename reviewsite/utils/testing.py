@@ -0,0 +1,160 @@
+import datetime
+import unittest
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, resolve
+from rest_framework.test import APITestCase
+from item.models import Item, Brand, Series, Position
+from review.models import Review, Favorite, UserReview
+
+User = get_user_model()
+
+
+# テストではMEDIA_STORAGEの設定によらず、メモリ上のストレージ（MEDIA_STORAGE='memory'）を使う
+# 既定のs3のままだと画像を扱うテストが実際のS3に接続してしまうため
+class TestRunner(DiscoverRunner):
+  def setup_test_environment(self, **kwargs):
+    super().setup_test_environment(**kwargs)
+    self.storage_override = override_settings(
+      STORAGES={**settings.STORAGES, 'default': settings.MEDIA_STORAGE_BACKENDS['memory']}
+    )
+    self.storage_override.enable()
+
+  def teardown_test_environment(self, **kwargs):
+    self.storage_override.disable()
+    super().teardown_test_environment(**kwargs)
+
+
+# URLconfに含まれるURL名を名前空間付きで列挙する
+def collect_url_names(urlpatterns, namespace=None):
+  names = set()
+  for pattern in urlpatterns:
+    if isinstance(pattern, URLResolver):
+      child_namespace = pattern.namespace or namespace
+      if namespace and pattern.namespace:
+        child_namespace = f'{namespace}:{pattern.namespace}'
+      names |= collect_url_names(pattern.url_patterns, child_namespace)
+    elif isinstance(pattern, URLPattern) and pattern.name:
+      names.add(f'{namespace}:{pattern.name}' if namespace else pattern.name)
+  return names
+
+
+# エンドポイントのSQL発行数がデータ件数に比例して増えないことを確認するテスト基盤
+# seed()でデータを増やしながら2つの件数でリクエストし、クエリ数が一致するかを検証する
+class QueryBudgetTestCase(APITestCase):
+  sizes = (2, 10)
+  # テスト対象のURLconf（app_namespaceのURL名がすべて計測済みかをクラスの終了時に確認する）
+  app_namespace = None
+  urlpatterns = ()
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    # 実行したテストと、成功したリクエストが解決されたURL名（名前空間付き）
+    cls.executed_tests = set()
+    cls.requested_url_names = set()
+
+  @classmethod
+  def tearDownClass(cls):
+    try:
+      cls.check_url_names_covered()
+    finally:
+      super().tearDownClass()
+
+  # URLconfのすべてのURL名に、計測済みの成功リクエストがあるか
+  # 一部のテストだけを実行した場合は確認しない
+  @classmethod
+  def check_url_names_covered(cls):
+    if cls.app_namespace is None:
+      return
+    test_names = set(unittest.defaultTestLoader.getTestCaseNames(cls))
+    if cls.executed_tests != test_names:
+      return
+    missing = collect_url_names(cls.urlpatterns, cls.app_namespace) - cls.requested_url_names
+    if missing:
+      raise AssertionError(f'URL names without a measured request: {sorted(missing)}')
+
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create_user(email='budget@example.com', password='testpass')
+    cls.brand = Brand.objects.create(name='Budget Brand')
+    cls.series = Series.objects.create(name='Budget Series', brand=cls.brand)
+    cls.position = Position.objects.create(name='Budget Position')
+    cls.item = Item.objects.create(
+      item_name='Budget Item',
+      brand=cls.brand,
+      series=cls.series,
+      position=cls.position,
+      release_date=datetime.date(2023, 10, 1),
+      display=True
+    )
+    cls.review = Review.objects.create(user=cls.user, item=cls.item, title='Budget Review', content='Content')
+    UserReview.objects.create(user=cls.user, review=cls.review)
+
+  def setUp(self):
+    super().setUp()
+    self.sequence = 0
+    self.executed_tests.add(self._testMethodName)
+    self.client.force_authenticate(user=self.user)
+
+  # n件分のアイテム・ユーザー・レビュー・お気に入りを追加する
+  def seed(self, n, user=None):
+    user = user or self.user
+    for _ in range(n):
+      self.sequence += 1
+      key = f'{user.pk.hex[:8]}-{self.sequence}'
+      brand = Brand.objects.create(name=f'Brand {key}')
+      series = Series.objects.create(name=f'Series {key}', brand=brand)
+      position = Position.objects.create(name=f'Position {key}')
+      item = Item.objects.create(
+        item_name=f'Item {key}',
+        brand=brand,
+        series=series,
+        position=position,
+        release_date=datetime.date(2023, 10, 1),
+        display=True
+      )
+      other_user = User.objects.create_user(email=f'budget-{key}@example.com')
+
+      # 他ユーザーが基準アイテムに投稿したレビューを、userがお気に入り登録
+      other_review = Review.objects.create(user=other_user, item=self.item, title=f'Other {key}', content='Content')
+      UserReview.objects.create(user=other_user, review=other_review)
+      Favorite.objects.create(user=user, review=other_review)
+      user.favorite_reviews.add(other_review)
+
+      # userが新しいアイテムに投稿したレビュー
+      my_review = Review.objects.create(user=user, item=item, title=f'Mine {key}', content='Content')
+      UserReview.objects.create(user=user, review=my_review)
+
+      # 他ユーザーが基準レビューをお気に入り登録
+      Favorite.objects.create(user=other_user, review=self.review)
+      other_user.favorite_reviews.add(self.review)
+
+  # make_requestのクエリ数が件数sizesの間で一定であることを確認する
+  # prepareはクエリ計測の外で実行され、戻り値がmake_requestの引数になる
+  # エラー応答のクエリ数を計測しないよう、毎回2xx/3xx（expected_statusの指定があればその値）を確認する
+  def assertQueryCountConstant(self, make_request, prepare=None, expected_status=None):
+    counts = []
+    seeded = 0
+    for size in self.sizes:
+      self.seed(size - seeded)
+      seeded = size
+      args = prepare(size) if prepare else ()
+      with CaptureQueriesContext(connection) as context:
+        response = make_request(*args)
+      if expected_status is None:
+        self.assertTrue(200 <= response.status_code < 400, f'{response.status_code} {response}')
+      else:
+        self.assertEqual(response.status_code, expected_status, response)
+      self.requested_url_names.add(resolve(response.wsgi_request.path_info).view_name)
+      counts.append(len(context.captured_queries))
+
+    self.assertEqual(
+      counts[0], counts[-1],
+      f'Query count grew with data size {self.sizes}: {counts}\n'
+      + '\n'.join(query['sql'] for query in context.captured_queries)
+    )
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class UploadTooLarge(APIException):
+  status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+  default_detail = 'アップロードできるファイルのサイズを超えています。'
+  default_code = 'upload_too_large'
+
+
+# アップロードされたファイルのサイズを受信しながら数え、IMAGE_UPLOAD_MAX_SIZEを超えた時点で413にする
+# FILE_UPLOAD_HANDLERSの先頭に置き、受け取ったデータは後続のハンドラー（メモリ→一時ファイル）にそのまま渡す
+# Content-Lengthが明らかに大きい場合は本文を読む前に拒否する
+class MaxFileSizeUploadHandler(FileUploadHandler):
+  def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+    # ファイル以外のフィールドはDATA_UPLOAD_MAX_MEMORY_SIZEまで
+    limit = settings.IMAGE_UPLOAD_MAX_SIZE + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+    if settings.DATA_UPLOAD_MAX_MEMORY_SIZE is not None and content_length > limit:
+      raise UploadTooLarge()
+
+  def new_file(self, *args, **kwargs):
+    super().new_file(*args, **kwargs)
+    self.received = 0
+
+  def receive_data_chunk(self, raw_data, start):
+    self.received += len(raw_data)
+    if self.received > settings.IMAGE_UPLOAD_MAX_SIZE:
+      raise UploadTooLarge()
+    return raw_data
+
+  def file_complete(self, file_size):
+    return None
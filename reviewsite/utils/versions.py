@@ -0,0 +1,13 @@
+from django.db.models import F
+
+
+# キャッシュキーやETagに使うバージョン番号（1行だけのテーブルに保存する）
+# キャッシュ（既定ではプロセスごとのメモリキャッシュ）に置くと、他のワーカーや管理コマンドでの更新が伝わらないためDBに置く
+# modelはversionフィールドを持ち、pk=1の行を使う
+def get_version(model):
+  return model.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def bump_version(model):
+  if not model.objects.filter(pk=1).update(version=F('version') + 1):
+    model.objects.get_or_create(pk=1, defaults={'version': 1})